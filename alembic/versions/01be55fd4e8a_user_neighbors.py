@@ -0,0 +1,38 @@
+"""Precomputed user neighbours
+
+Revision ID: 01be55fd4e8a
+Revises: 9385137e21cd
+Create Date: 2026-10-19 13:27:51.904116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '01be55fd4e8a'
+down_revision: Union[str, Sequence[str], None] = '9385137e21cd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_neighbors',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.SmallInteger(), nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), nullable=False),
+    sa.Column('distance', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['neighbor_id'], ['public.users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['public.users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'rank'),
+    schema='public'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_neighbors', schema='public')
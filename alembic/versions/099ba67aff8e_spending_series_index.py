@@ -0,0 +1,35 @@
+"""Covering index for spending series
+
+Revision ID: 099ba67aff8e
+Revises: b793e45fbcae
+Create Date: 2026-10-19 10:12:04.318227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '099ba67aff8e'
+down_revision: Union[str, Sequence[str], None] = 'b793e45fbcae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_transactions_from_account_datetime_spend',
+        'transactions',
+        ['from_account_id', 'datetime'],
+        unique=False,
+        schema='public',
+        postgresql_include=['category', 'currency', 'amount'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transactions_from_account_datetime_spend', table_name='transactions', schema='public')
@@ -0,0 +1,50 @@
+"""Cohort statistics
+
+Revision ID: 4c2f9e7a1b3d
+Revises: ed77c8cbbb68
+Create Date: 2026-10-19 16:02:11.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c2f9e7a1b3d'
+down_revision: Union[str, Sequence[str], None] = 'ed77c8cbbb68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('cohort_stats',
+    sa.Column('city', sa.Text(), nullable=False),
+    sa.Column('age_band', sa.Text(), nullable=False),
+    sa.Column('profile', sa.Text(), nullable=False),
+    sa.Column('members', sa.Integer(), nullable=False),
+    sa.Column('goals', sa.Integer(), nullable=False),
+    sa.Column('median_savings_rate_pct', sa.Float(), nullable=True),
+    sa.Column('median_goal_kzt', sa.Float(), nullable=True),
+    sa.Column('on_time_pct', sa.Float(), nullable=True),
+    sa.Column('computed_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('city', 'age_band', 'profile'),
+    schema='public'
+    )
+    op.create_table('user_cohorts',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.Text(), nullable=False),
+    sa.Column('age_band', sa.Text(), nullable=False),
+    sa.Column('profile', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['public.users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id'),
+    schema='public'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_cohorts', schema='public')
+    op.drop_table('cohort_stats', schema='public')
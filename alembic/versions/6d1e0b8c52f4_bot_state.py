@@ -0,0 +1,51 @@
+"""Bot state store tables
+
+Revision ID: 6d1e0b8c52f4
+Revises: 4c2f9e7a1b3d
+Create Date: 2026-10-19 18:41:37.205116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d1e0b8c52f4'
+down_revision: Union[str, Sequence[str], None] = '4c2f9e7a1b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('bot_conversations',
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('data', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    schema='public'
+    )
+    op.create_table('bot_alert_subscriptions',
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'chat_id'),
+    schema='public'
+    )
+    op.create_table('bot_cache',
+    sa.Column('namespace', sa.Text(), nullable=False),
+    sa.Column('key', sa.Text(), nullable=False),
+    sa.Column('value', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('namespace', 'key'),
+    schema='public'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('bot_cache', schema='public')
+    op.drop_table('bot_alert_subscriptions', schema='public')
+    op.drop_table('bot_conversations', schema='public')
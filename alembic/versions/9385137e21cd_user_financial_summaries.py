@@ -0,0 +1,106 @@
+"""Precomputed user financial summaries, transaction versions and batch checkpoints
+
+Revision ID: 9385137e21cd
+Revises: 099ba67aff8e
+Create Date: 2026-10-19 11:03:47.582103
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9385137e21cd'
+down_revision: Union[str, Sequence[str], None] = '099ba67aff8e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Once per statement, bumps the version of every user the written rows belong
+# to, as owner (user_id) or sender (from_account_id), before and after the
+# change. A trigger with transition tables can only have one event, so the
+# same function serves the three triggers below.
+BUMP_FUNCTION = """
+CREATE FUNCTION public.bump_user_transaction_versions() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    ids integer[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        ids := ARRAY(SELECT user_id FROM new_rows UNION SELECT from_account_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        ids := ARRAY(SELECT user_id FROM old_rows UNION SELECT from_account_id FROM old_rows);
+    ELSE
+        ids := ARRAY(
+            SELECT user_id FROM new_rows UNION SELECT from_account_id FROM new_rows
+            UNION SELECT user_id FROM old_rows UNION SELECT from_account_id FROM old_rows
+        );
+    END IF;
+    -- In id order, so concurrent statements lock the version rows in the same order
+    INSERT INTO public.user_transaction_versions AS v (user_id, version, updated_at)
+    SELECT id, 1, now() FROM unnest(ids) AS id WHERE id IS NOT NULL ORDER BY id
+    ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1, updated_at = excluded.updated_at;
+    RETURN NULL;
+END
+$$
+"""
+
+VERSION_TRIGGERS = {
+    'trg_transactions_versions_insert': 'AFTER INSERT ON public.transactions REFERENCING NEW TABLE AS new_rows',
+    'trg_transactions_versions_update': (
+        'AFTER UPDATE ON public.transactions REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows'
+    ),
+    'trg_transactions_versions_delete': 'AFTER DELETE ON public.transactions REFERENCING OLD TABLE AS old_rows',
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_transaction_versions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    schema='public'
+    )
+    op.execute(BUMP_FUNCTION)
+    for name, timing in VERSION_TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER {name} {timing} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION public.bump_user_transaction_versions()"
+        )
+    op.create_table('user_financial_summaries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('watermark_version', sa.BigInteger(), nullable=False),
+    sa.Column('rates_version', sa.Text(), nullable=False),
+    sa.Column('summary', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('pie_chart', sa.LargeBinary(), nullable=True),
+    sa.Column('line_chart', sa.LargeBinary(), nullable=True),
+    sa.Column('computed_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['public.users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id'),
+    schema='public'
+    )
+    op.create_table('batch_checkpoints',
+    sa.Column('job', sa.Text(), nullable=False),
+    sa.Column('last_user_id', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('processed', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('started_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('job'),
+    schema='public'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('batch_checkpoints', schema='public')
+    op.drop_table('user_financial_summaries', schema='public')
+    for name in VERSION_TRIGGERS:
+        op.execute(f"DROP TRIGGER {name} ON public.transactions")
+    op.execute("DROP FUNCTION public.bump_user_transaction_versions()")
+    op.drop_table('user_transaction_versions', schema='public')
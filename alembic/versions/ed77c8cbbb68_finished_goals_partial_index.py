@@ -0,0 +1,36 @@
+"""Partial index on finished goals for peer comparisons
+
+Revision ID: ed77c8cbbb68
+Revises: 01be55fd4e8a
+Create Date: 2026-10-19 14:05:12.660481
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ed77c8cbbb68'
+down_revision: Union[str, Sequence[str], None] = '01be55fd4e8a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_goals_finished_user_deadline',
+        'financial_goals',
+        ['user_id', sa.text('deadline DESC NULLS LAST')],
+        unique=False,
+        schema='public',
+        postgresql_where=sa.text('current_amount >= target_amount'),
+        postgresql_include=['name', 'target_amount', 'currency'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_goals_finished_user_deadline', table_name='financial_goals', schema='public')
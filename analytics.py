@@ -1,15 +1,51 @@
 import requests
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 import io
+import time
+import logging
 import asyncio
-from sqlalchemy.ext.asyncio import AsyncEngine
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection
 from sqlalchemy import text
 from db import engine
 
 pd.options.display.float_format = "{:,.2f}".format
 
+RATES_URL = "https://latest.currency-api.pages.dev/v1/currencies/eur.json"
+RATES_TTL_SECONDS = 15 * 60
+
+_rates_cache: tuple[float, str, dict] | None = None  # (fetched_at, version, rates)
+
+# Buckets are cut in the bank's local time, not in the session time zone
+SERIES_TIMEZONE = "Asia/Almaty"
+SERIES_GRANULARITIES = ("day", "week", "month")
+LINE_CHART_DAYS = 90
+
+SPENDING_SERIES_QUERY = text(
+    """
+    SELECT from_account_id AS user_id,
+           (date_trunc(:granularity, datetime, :tz) AT TIME ZONE :tz)::date AS bucket,
+           category,
+           currency,
+           SUM(amount) AS amount
+    FROM transactions
+    WHERE from_account_id = ANY(:user_ids)
+      AND datetime >= :start_at
+      AND datetime < :end_at
+    GROUP BY from_account_id, bucket, category, currency
+    ORDER BY from_account_id, bucket
+    """
+)
+
+# Rows that feed one user's summary: income by user_id, expenses by from_account_id.
+USER_TRANSACTIONS_QUERY = text(
+    "SELECT * FROM transactions "
+    "WHERE user_id = ANY(:user_ids) OR from_account_id = ANY(:user_ids)"
+)
+
 
 def convert_to_kzt(amount, currency, rates_from_eur):
     amount = float(amount)
@@ -26,26 +62,172 @@ def convert_to_kzt(amount, currency, rates_from_eur):
     raise ValueError(f"Неизвестная валюта: {currency}")
 
 
-def plot_to_bytesio(fig) -> io.BytesIO:
+def figure_to_bytesio(fig: Figure) -> io.BytesIO:
     """Saves Matplotlib figure to BytesIO (PNG)"""
     buffer = io.BytesIO()
     fig.savefig(buffer, format="png", bbox_inches="tight", dpi=150)
     buffer.seek(0)
-    plt.close(fig)
     return buffer
 
 
-async def get_user_financial_summary(user_id: str):
+def render_charts(chart_data: dict) -> dict[str, io.BytesIO]:
+    """
+    Pie chart of expenses by category and line chart of daily expenses as PNGs.
+    Blocking (matplotlib); run in a thread. Figures are created without pyplot,
+    so several renders can run at once.
+    """
+    sns.set_theme(style="whitegrid")
+    graphs = {}
+
+    expenses_by_category = chart_data["expenses_by_category"]
+    if expenses_by_category:
+        fig = Figure(figsize=(6, 6))
+        ax = fig.subplots()
+        ax.pie(
+            [amount for _, amount in expenses_by_category],
+            labels=[category for category, _ in expenses_by_category],
+            autopct="%1.1f%%",
+            startangle=140,
+        )
+        ax.set_title("Структура расходов по категориям")
+        graphs["pie_chart"] = figure_to_bytesio(fig)
+
+    daily_expenses = chart_data["daily_expenses"]
+    if daily_expenses:
+        frame = pd.DataFrame(daily_expenses, columns=["date", "amount_kzt"])
+        frame["date"] = pd.to_datetime(frame["date"])
+
+        fig = Figure(figsize=(7, 4))
+        ax = fig.subplots()
+        sns.lineplot(data=frame, x="date", y="amount_kzt", marker="o", ax=ax)
+        ax.set_title("Траты по дням (₸)")
+        ax.set_xlabel("Дата")
+        ax.set_ylabel("Сумма (₸)")
+        ax.tick_params(axis="x", labelrotation=45)
+        graphs["line_chart"] = figure_to_bytesio(fig)
+
+    return graphs
+
+
+def fetch_versioned_rates() -> tuple[str, dict]:
+    """Fetch latest EUR-based rates together with their publication date."""
+    response = requests.get(RATES_URL)
+    payload = response.json()
+    return str(payload.get("date")), payload["eur"]
+
+
+async def get_rates() -> tuple[str, dict]:
+    """
+    Return (rates_version, rates_from_eur), refetching at most every RATES_TTL_SECONDS.
+    The version is the publication date of the rates, so it only changes when the rates do.
+    """
+    global _rates_cache
+    now = time.monotonic()
+    if _rates_cache is None or now - _rates_cache[0] > RATES_TTL_SECONDS:
+        version, rates = await asyncio.to_thread(fetch_versioned_rates)
+        _rates_cache = (now, version, rates)
+    _, version, rates = _rates_cache
+    return version, rates
+
+
+async def get_spending_series(
+    user_id: int,
+    start: datetime,
+    end: datetime,
+    granularity: str = "day",
+    rates_from_eur: dict | None = None,
+    conn: AsyncConnection | None = None,
+) -> list[dict]:
+    """
+    Spending of one user in [start, end) bucketed by day, week or month and category.
+
+    Spending is the user's expense rows (from_account_id, as in the summary).
+    Bucketing and summing happen in Postgres on the (from_account_id, datetime) index,
+    so only one row per (bucket, category, currency) comes back; conversion to
+    KZT is applied to those few rows. Returns a list ordered by bucket:
+    [{"bucket": "2025-10-01", "category": "groceries", "amount_kzt": 1234.5}, ...]
+    """
+    series = await get_spending_series_for_users(
+        [user_id], start, end, granularity, rates_from_eur, conn
+    )
+    return series.get(int(user_id), [])
+
+
+async def get_spending_series_for_users(
+    user_ids: list[int],
+    start: datetime,
+    end: datetime,
+    granularity: str = "day",
+    rates_from_eur: dict | None = None,
+    conn: AsyncConnection | None = None,
+) -> dict[int, list[dict]]:
+    """Same as get_spending_series for many users in one query, keyed by user id."""
+    if granularity not in SERIES_GRANULARITIES:
+        raise ValueError(f"Неизвестная гранулярность: {granularity}")
+
+    if rates_from_eur is None:
+        _, rates_from_eur = await get_rates()
+
+    params = {
+        "granularity": granularity,
+        "tz": SERIES_TIMEZONE,
+        "user_ids": [int(x) for x in user_ids],
+        "start_at": start,
+        "end_at": end,
+    }
+    if conn is None:
+        async with engine.connect() as conn:
+            result = await conn.execute(SPENDING_SERIES_QUERY, params)
+            rows = result.fetchall()
+    else:
+        result = await conn.execute(SPENDING_SERIES_QUERY, params)
+        rows = result.fetchall()
+
+    totals: dict[tuple, float] = defaultdict(float)
+    for user_id, bucket, category, currency, amount in rows:
+        totals[(user_id, bucket, category)] += convert_to_kzt(amount, currency, rates_from_eur)
+
+    series: dict[int, list[dict]] = defaultdict(list)
+    for (user_id, bucket, category), amount in totals.items():
+        series[user_id].append(
+            {
+                "bucket": bucket.isoformat(),
+                "category": category,
+                "amount_kzt": round(amount, 2),
+            }
+        )
+    return dict(series)
+
+
+def line_chart_range() -> tuple[datetime, datetime]:
+    end = datetime.now(timezone.utc)
+    return end - timedelta(days=LINE_CHART_DAYS), end
+
+
+async def get_user_financial_summary(user_id: str, rates_from_eur: dict | None = None):
     # Fetch latest currency rates
-    url = "https://latest.currency-api.pages.dev/v1/currencies/eur.json"
-    response = requests.get(url)
-    rates_from_eur = response.json()["eur"]
+    if rates_from_eur is None:
+        _, rates_from_eur = await get_rates()
 
     # --- ASYNC SQL FETCH ---
     async with engine.connect() as conn:
-        result = await conn.execute(text("SELECT * FROM transactions"))
+        result = await conn.execute(USER_TRANSACTIONS_QUERY, {"user_ids": [int(user_id)]})
         df = pd.DataFrame(result.fetchall(), columns=result.keys())
 
+        start, end = line_chart_range()
+        series = await get_spending_series(
+            user_id, start, end, "day", rates_from_eur, conn=conn
+        )
+
+    return build_financial_summary(df, user_id, rates_from_eur, series)
+
+
+def build_financial_summary(df: pd.DataFrame, user_id, rates_from_eur: dict, series: list[dict]):
+    """
+    CPU part of the summary: totals, recommendations and chart data for one user.
+    `df` holds the user's transactions (as sender or owner), `series` the daily
+    spending from get_spending_series. Pure, so it can run in a worker process.
+    """
     if df.empty:
         return None
 
@@ -92,9 +274,7 @@ async def get_user_financial_summary(user_id: str):
         .sort_values(ascending=False)
     )
 
-    print("\n\n", user_id)
-    print("df:", df)
-    print("user_expenses_by_category:", user_expenses_by_category, "\n\n")
+    logging.debug(f"user {user_id} expenses by category: {user_expenses_by_category}")
 
     # --- Recommendations ---
     top_categories = []
@@ -119,42 +299,17 @@ async def get_user_financial_summary(user_id: str):
     else:
         recommendations.append("Отличная финансовая стабильность — нет трат.")
 
-    # --- Graphs ---
-    sns.set(style="whitegrid")
-    graphs = {}
-
-    # Pie chart
-    if not user_expenses_by_category.empty:
-        fig, ax = plt.subplots(figsize=(6, 6))
-        ax.pie(
-            user_expenses_by_category,
-            labels=user_expenses_by_category.index,
-            autopct="%1.1f%%",
-            startangle=140,
-        )
-        ax.set_title("Структура расходов по категориям")
-        graphs["pie_chart"] = plot_to_bytesio(fig)
-
-    # Line chart by date
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"], errors="coerce")
-        daily_expenses = (
-            df[df["from_account_id"] == str(user_id)]
-            .groupby(df["date"].dt.date)["amount_kzt"]
-            .sum()
-            .reset_index()
-        )
-
-        if not daily_expenses.empty:
-            fig, ax = plt.subplots(figsize=(7, 4))
-            sns.lineplot(
-                data=daily_expenses, x="date", y="amount_kzt", marker="o", ax=ax
-            )
-            ax.set_title("Траты по дням (₸)")
-            ax.set_xlabel("Дата")
-            ax.set_ylabel("Сумма (₸)")
-            plt.xticks(rotation=45)
-            graphs["line_chart"] = plot_to_bytesio(fig)
+    # --- Chart data, drawn by render_charts off the event loop ---
+    daily_expenses = []
+    if series:
+        daily = pd.DataFrame(series).groupby("bucket")["amount_kzt"].sum()
+        daily_expenses = [[str(day), round(float(amount), 2)] for day, amount in daily.items()]
+    chart_data = {
+        "expenses_by_category": [
+            [category, round(float(amount), 2)] for category, amount in user_expenses_by_category.items()
+        ],
+        "daily_expenses": daily_expenses,
+    }
 
     # --- Final Result ---
     result = {
@@ -164,7 +319,7 @@ async def get_user_financial_summary(user_id: str):
         "net_balance": round(user_balance, 2),
         "top_expense_categories": top_categories,
         "recommendations": recommendations,
-        "graphs": graphs,
+        "chart_data": chart_data,
     }
 
     return result
@@ -0,0 +1,189 @@
+"""
+Nightly precomputation of financial summaries for every user.
+
+    python analytics_batch.py [--chunk-size 500] [--workers 8] [--restart]
+
+Users are streamed from Postgres in id order; each chunk's transactions and
+daily series are fetched with two queries, the per-user summaries and charts
+are rendered on a process pool and upserted into user_financial_summaries
+together with the job's checkpoint, so an interrupted run resumes after the
+last committed chunk.
+"""
+import argparse
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from analytics import (
+    USER_TRANSACTIONS_QUERY,
+    build_financial_summary,
+    get_rates,
+    get_spending_series_for_users,
+    line_chart_range,
+    render_charts,
+)
+from batch_jobs import (
+    Progress,
+    count_users_after,
+    finish_checkpoint,
+    iter_user_id_chunks,
+    load_checkpoint,
+    save_checkpoint,
+)
+from db import engine
+from db.models import t_user_financial_summaries
+
+JOB_NAME = "analytics_summaries"
+DEFAULT_CHUNK_SIZE = 500
+
+# The watermark analytics_cache reads per user, for a chunk of users
+TRANSACTION_VERSIONS_QUERY = text(
+    "SELECT user_id, version FROM user_transaction_versions WHERE user_id = ANY(:user_ids)"
+)
+
+
+def compute_user_summary(user_id: int, user_df: pd.DataFrame, rates_from_eur: dict, series: list[dict]):
+    """Worker-process entrypoint: summary without charts plus the charts as PNG bytes."""
+    summary = build_financial_summary(user_df, user_id, rates_from_eur, series)
+    if summary is None:
+        return user_id, None, None, None
+    graphs = render_charts(summary.pop("chart_data"))
+    pie = graphs.get("pie_chart")
+    line = graphs.get("line_chart")
+    return (
+        user_id,
+        summary,
+        pie.getvalue() if pie else None,
+        line.getvalue() if line else None,
+    )
+
+
+def split_by_user(df: pd.DataFrame, user_ids: list[int]) -> dict[int, pd.DataFrame]:
+    """Rows feeding each user's summary: owned by the user or sent from the user's id."""
+    if df.empty:
+        return {}
+    by_owner = df.groupby("user_id").indices
+    by_sender = df.groupby("from_account_id").indices
+    parts = {}
+    for user_id in user_ids:
+        positions = set(by_owner.get(user_id, ())) | set(by_sender.get(user_id, ()))
+        if positions:
+            parts[user_id] = df.iloc[sorted(positions)].copy()
+    return parts
+
+
+async def process_chunk(pool: ProcessPoolExecutor, user_ids: list[int], rates_version: str, rates_from_eur: dict) -> list[dict]:
+    start, end = line_chart_range()
+    async with engine.connect() as conn:
+        # Versions first: a write landing before the rows are read leaves the
+        # stored version behind the data, so the summary is recomputed, never served stale
+        result = await conn.execute(TRANSACTION_VERSIONS_QUERY, {"user_ids": user_ids})
+        versions = dict(result.fetchall())
+        result = await conn.execute(USER_TRANSACTIONS_QUERY, {"user_ids": user_ids})
+        df = pd.DataFrame(result.fetchall(), columns=result.keys())
+        series = await get_spending_series_for_users(
+            user_ids, start, end, "day", rates_from_eur, conn=conn
+        )
+
+    parts = split_by_user(df, user_ids)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                pool, compute_user_summary, user_id, user_df, rates_from_eur, series.get(user_id, [])
+            )
+            for user_id, user_df in parts.items()
+        )
+    )
+
+    rows = []
+    for user_id, summary, pie, line in results:
+        if summary is None:
+            continue
+        rows.append(
+            {
+                "user_id": user_id,
+                "watermark_version": versions.get(user_id, 0),
+                "rates_version": rates_version,
+                "summary": summary,
+                "pie_chart": pie,
+                "line_chart": line,
+            }
+        )
+    return rows
+
+
+async def run(chunk_size: int, workers: int, restart: bool):
+    rates_version, rates_from_eur = await get_rates()
+    last_user_id, processed = await load_checkpoint(JOB_NAME, restart)
+    progress = Progress(JOB_NAME, await count_users_after(last_user_id), processed)
+
+    # spawn: workers must not inherit the parent's event loop and DB connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        async for user_ids in iter_user_id_chunks(last_user_id, chunk_size):
+            rows = await process_chunk(pool, user_ids, rates_version, rates_from_eur)
+            processed += len(user_ids)
+
+            async with engine.begin() as conn:
+                if rows:
+                    stmt = insert(t_user_financial_summaries).values(rows)
+                    await conn.execute(
+                        stmt.on_conflict_do_update(
+                            index_elements=["user_id"],
+                            set_={
+                                c: stmt.excluded[c]
+                                for c in (
+                                    "watermark_version",
+                                    "rates_version",
+                                    "summary",
+                                    "pie_chart",
+                                    "line_chart",
+                                )
+                            }
+                            | {"computed_at": text("now()")},
+                        )
+                    )
+                await save_checkpoint(conn, JOB_NAME, user_ids[-1], processed)
+            progress.advance(len(user_ids))
+
+    await finish_checkpoint(JOB_NAME)
+    logging.info(f"[{JOB_NAME}] done, {processed} users")
+
+
+async def get_precomputed_summary(user_id: int, watermark: int, rates_version: str) -> dict | None:
+    """Precomputed summary of the user if it is still current, else None."""
+    async with engine.connect() as conn:
+        row = (
+            await conn.execute(
+                text("SELECT * FROM user_financial_summaries WHERE user_id = :user_id"),
+                {"user_id": int(user_id)},
+            )
+        ).one_or_none()
+
+    if row is None or row.rates_version != rates_version:
+        return None
+    if row.watermark_version != watermark:
+        return None
+
+    graphs = {}
+    if row.pie_chart is not None:
+        graphs["pie_chart"] = io.BytesIO(row.pie_chart)
+    if row.line_chart is not None:
+        graphs["line_chart"] = io.BytesIO(row.line_chart)
+    return {**row.summary, "graphs": graphs}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute analytics for all users")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--restart", action="store_true", help="Ignore an unfinished run and start over")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.chunk_size, args.workers, args.restart))
@@ -0,0 +1,152 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+from sqlalchemy import text
+from analytics import get_rates, get_user_financial_summary, render_charts
+from analytics_batch import get_precomputed_summary
+from config import get_settings
+from db import engine
+from metrics import metrics
+from state_store import get_store
+
+CHART_ORDER = ("pie_chart", "line_chart")
+
+# A trigger bumps the user's version on every insert, update or delete of a
+# row the user owns (user_id) or sent (from_account_id), so the watermark is
+# one primary-key lookup however long the history. No row yet reads as 0.
+WATERMARK_QUERY = text(
+    "SELECT coalesce((SELECT version FROM user_transaction_versions WHERE user_id = :user_id), 0)"
+)
+
+
+class AnalyticsCache:
+    """
+    Financial summaries and their charts in the state store's TTL cache, so
+    every worker (and the next process after a restart) reuses them.
+
+    A summary is stored under (user_id, transactions version, rates version),
+    so it goes stale exactly when the user's transactions (inserted, deleted
+    or updated) or the currency rates change; stale entries simply expire.
+    Charts rendered from a summary are stored under a hash of its chart data.
+    Charts are kept as base64 PNG and handed out as fresh BytesIO objects,
+    because callers consume them.
+    """
+
+    SUMMARIES = "analytics_summary"
+    CHARTS = "analytics_charts"
+
+    def __init__(self, ttl_seconds: float | None = None):
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def ttl(self) -> float:
+        return self.ttl_seconds if self.ttl_seconds is not None else get_settings().ANALYTICS_CACHE_TTL_SECONDS
+
+    async def get(self, user_id: int, watermark: int, rates_version: str) -> dict | None:
+        value = await get_store().cache_get(self.SUMMARIES, f"{user_id}:{watermark}:{rates_version}")
+        if value is None:
+            metrics.inc("analytics_cache.misses")
+            return None
+        metrics.inc("analytics_cache.hits")
+        return _materialize(json.loads(value))
+
+    async def put(self, user_id: int, watermark: int, rates_version: str, summary: dict):
+        await get_store().cache_set(
+            self.SUMMARIES,
+            f"{user_id}:{watermark}:{rates_version}",
+            json.dumps(_freeze(summary), ensure_ascii=False),
+            self.ttl,
+        )
+
+    async def get_graphs(self, chart_data: dict) -> dict[str, io.BytesIO] | None:
+        value = await get_store().cache_get(self.CHARTS, _chart_key(chart_data))
+        if value is None:
+            return None
+        return _materialize({"graphs": json.loads(value)})["graphs"]
+
+    async def put_graphs(self, chart_data: dict, graphs: dict):
+        """Keep charts rendered from a summary's chart data."""
+        frozen = _freeze({"graphs": graphs})["graphs"]
+        await get_store().cache_set(self.CHARTS, _chart_key(chart_data), json.dumps(frozen), self.ttl)
+
+    def stats(self) -> dict:
+        hits = metrics.counter("analytics_cache.hits")
+        misses = metrics.counter("analytics_cache.misses")
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        }
+
+
+def _chart_key(chart_data: dict) -> str:
+    return hashlib.sha256(json.dumps(chart_data, sort_keys=True).encode()).hexdigest()
+
+
+def _freeze(summary: dict) -> dict:
+    if "graphs" not in summary:
+        return summary
+    graphs = {name: base64.b64encode(buffer.getvalue()).decode() for name, buffer in summary["graphs"].items()}
+    return {**summary, "graphs": graphs}
+
+
+def _materialize(frozen: dict) -> dict:
+    if "graphs" not in frozen:
+        return frozen
+    graphs = {name: io.BytesIO(base64.b64decode(png)) for name, png in frozen["graphs"].items()}
+    return {**frozen, "graphs": graphs}
+
+
+async def get_user_watermark(user_id: int) -> int:
+    async with engine.connect() as conn:
+        result = await conn.execute(WATERMARK_QUERY, {"user_id": int(user_id)})
+        return int(result.scalar_one())
+
+
+analytics_cache = AnalyticsCache()
+
+
+async def get_cached_user_financial_summary(user_id: int):
+    """
+    get_user_financial_summary, recomputed only when the user's data or the rates change.
+    Falls back to the nightly precomputed summary before computing on demand.
+    """
+    rates_version, rates_from_eur = await get_rates()
+    watermark = await get_user_watermark(user_id)
+
+    summary = await analytics_cache.get(user_id, watermark, rates_version)
+    if summary is not None:
+        return summary
+
+    summary = await get_precomputed_summary(user_id, watermark, rates_version)
+    if summary is not None:
+        metrics.inc("analytics.precomputed_hits")
+    else:
+        with metrics.timer("analytics.summary"):
+            summary = await get_user_financial_summary(user_id, rates_from_eur)
+    if summary is None:
+        return None
+
+    await analytics_cache.put(user_id, watermark, rates_version, summary)
+    logging.info(f"Analytics cache stats: {analytics_cache.stats()}")
+    return summary
+
+
+async def get_summary_charts(summary: dict) -> list[io.BytesIO]:
+    """
+    Charts of a summary from get_cached_user_financial_summary, pie first.
+    Precomputed summaries come with them; otherwise they are taken from the
+    cache or rendered from the summary's chart data in a thread, off the
+    event loop, and cached for the other workers.
+    """
+    graphs = summary.get("graphs")
+    if graphs is None:
+        graphs = await analytics_cache.get_graphs(summary["chart_data"])
+    if graphs is None:
+        with metrics.timer("analytics.render_charts"):
+            graphs = await asyncio.to_thread(render_charts, summary["chart_data"])
+        await analytics_cache.put_graphs(summary["chart_data"], graphs)
+    return [graphs[name] for name in CHART_ORDER if name in graphs]
@@ -0,0 +1,104 @@
+import logging
+import time
+from collections.abc import AsyncIterator
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+from db import engine
+from db.models import t_batch_checkpoints
+
+
+async def load_checkpoint(job: str, restart: bool = False) -> tuple[int, int]:
+    """
+    Return (last_user_id, processed) to resume `job` from.
+    A finished run, or restart=True, starts a new run from the first user.
+    """
+    async with engine.begin() as conn:
+        row = (
+            await conn.execute(
+                text("SELECT last_user_id, processed, finished_at FROM batch_checkpoints WHERE job = :job"),
+                {"job": job},
+            )
+        ).one_or_none()
+
+        if row is not None and not restart and row.finished_at is None:
+            logging.info(f"[{job}] resuming after user {row.last_user_id} ({row.processed} done)")
+            return row.last_user_id, row.processed
+
+        stmt = insert(t_batch_checkpoints).values(job=job)
+        await conn.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["job"],
+                set_={
+                    "last_user_id": 0,
+                    "processed": 0,
+                    "started_at": text("now()"),
+                    "updated_at": text("now()"),
+                    "finished_at": None,
+                },
+            )
+        )
+    return 0, 0
+
+
+async def save_checkpoint(conn: AsyncConnection, job: str, last_user_id: int, processed: int):
+    """Advance the cursor; call inside the transaction that wrote the chunk's results."""
+    await conn.execute(
+        text(
+            "UPDATE batch_checkpoints SET last_user_id = :last_user_id, processed = :processed, "
+            "updated_at = now() WHERE job = :job"
+        ),
+        {"job": job, "last_user_id": last_user_id, "processed": processed},
+    )
+
+
+async def finish_checkpoint(job: str):
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("UPDATE batch_checkpoints SET finished_at = now(), updated_at = now() WHERE job = :job"),
+            {"job": job},
+        )
+
+
+async def iter_user_id_chunks(after_user_id: int, chunk_size: int) -> AsyncIterator[list[int]]:
+    """Stream user ids in ascending chunks with a keyset cursor."""
+    while True:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT id FROM users WHERE id > :after ORDER BY id LIMIT :limit"),
+                {"after": after_user_id, "limit": chunk_size},
+            )
+            ids = list(result.scalars().all())
+        if not ids:
+            return
+        yield ids
+        after_user_id = ids[-1]
+
+
+async def count_users_after(after_user_id: int) -> int:
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT count(*) FROM users WHERE id > :after"), {"after": after_user_id}
+        )
+        return int(result.scalar_one())
+
+
+class Progress:
+    """Logs done/total, throughput and ETA of a batch job."""
+
+    def __init__(self, job: str, total: int, already_done: int = 0):
+        self.job = job
+        self.total = total
+        self.done = 0
+        self.already_done = already_done
+        self.started = time.monotonic()
+
+    def advance(self, n: int):
+        self.done += n
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+        logging.info(
+            f"[{self.job}] {self.already_done + self.done}/{self.already_done + self.total} users, "
+            f"{rate:.1f} users/s, ETA {eta:.0f}s"
+        )
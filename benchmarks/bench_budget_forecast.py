@@ -0,0 +1,120 @@
+"""
+Latency of the budget forecast for a user with a year of daily history:
+the 364-day series query and the forecast computed from it, separately and
+end to end, as forecast_category_budget runs them.
+
+Like bench_spending_series, the history is inserted for one existing user
+inside a transaction that is rolled back at the end. --no-db times only the
+forecast, on a synthetic series:
+
+    python -m benchmarks.bench_budget_forecast --tx-per-day 20
+    python -m benchmarks.bench_budget_forecast --no-db
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from analytics import SERIES_TIMEZONE, get_spending_series
+from benchmarks.bench_spending_series import RATES_FROM_EUR, gen_history
+from budget_forecast import HISTORY_DAYS, build_forecast, history_window
+
+CATEGORIES = ["groceries", "restaurants", "transport", "online_shopping", "entertainment",
+              "utilities", "clothes", "recurring", "transfer"]
+BUDGET_MS = 50
+
+
+def synthetic_series(today: date) -> list[dict]:
+    series = []
+    for day in range(HISTORY_DAYS):
+        bucket = today - timedelta(days=HISTORY_DAYS - day)
+        weekend = 1.5 if bucket.weekday() >= 5 else 1.0
+        for category in CATEGORIES:
+            series.append({
+                "bucket": bucket.isoformat(),
+                "category": category,
+                "amount_kzt": round(random.uniform(1_000, 20_000) * weekend, 2),
+            })
+    return series
+
+
+def report(name: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<9} p50 {statistics.median(timings):7.2f} ms, p95 {p95:7.2f} ms, max {timings[-1]:7.2f} ms")
+
+
+def bench_forecast(repeat: int):
+    today = date.today()
+    series = synthetic_series(today)
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        forecast = build_forecast(series, today)
+        timings.append((time.perf_counter() - t0) * 1000)
+    print(f"Synthetic series: {len(series)} daily points, {len(forecast['categories'])} categories")
+    report("forecast", timings)
+
+
+async def bench_query_and_forecast(repeat: int, tx_per_day: int):
+    from db import engine
+    from db.models import t_transactions
+
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        try:
+            # from_account_id references accounts, so the user's id must also be an account id
+            user_id = (
+                await conn.execute(text("SELECT id FROM users WHERE id IN (SELECT id FROM accounts) ORDER BY id LIMIT 1"))
+            ).scalar()
+            if user_id is None:
+                raise SystemExit("Seed the database first: python seed_db_script.py")
+
+            rows = gen_history(user_id, 1, tx_per_day)
+            for i in range(0, len(rows), 5_000):
+                await conn.execute(sa.insert(t_transactions), rows[i:i + 5_000])
+            await conn.execute(text("ANALYZE transactions"))
+            print(f"Inserted {len(rows):,} transactions for user {user_id}")
+
+            today = datetime.now(ZoneInfo(SERIES_TIMEZONE)).date()
+            start, end = history_window(today)
+            query_ms, forecast_ms, total_ms = [], [], []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                series = await get_spending_series(user_id, start, end, "day", RATES_FROM_EUR, conn=conn)
+                t1 = time.perf_counter()
+                build_forecast(series, today)
+                t2 = time.perf_counter()
+                query_ms.append((t1 - t0) * 1000)
+                forecast_ms.append((t2 - t1) * 1000)
+                total_ms.append((t2 - t0) * 1000)
+            print(f"{HISTORY_DAYS}-day series: {len(series)} points")
+            report("query", query_ms)
+            report("forecast", forecast_ms)
+            report("total", total_ms)
+        finally:
+            await trans.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the budget forecast")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--tx-per-day", type=int, default=20)
+    parser.add_argument("--no-db", action="store_true", help="Time only the forecast on a synthetic series")
+    args = parser.parse_args()
+
+    print(f"Budget {BUDGET_MS} ms end to end")
+    if args.no_db:
+        bench_forecast(args.repeat)
+    else:
+        asyncio.run(bench_query_and_forecast(args.repeat, args.tx_per_day))
+
+
+if __name__ == "__main__":
+    main()
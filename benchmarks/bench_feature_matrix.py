@@ -0,0 +1,66 @@
+"""
+Peak memory and time of building and fitting the sparse similarity features.
+Synthetic aggregate rows are fed chunk by chunk, as fetch_user_features does:
+
+    python -m benchmarks.bench_feature_matrix --users 100000 1000000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from collections import namedtuple
+
+from user_grouping import FEATURE_CHUNK_USERS, FeatureMatrixBuilder, fit_model
+
+StatsRow = namedtuple("StatsRow", "user_id expense_mean expense_std transaction_count most_used_currency")
+CountRow = namedtuple("CountRow", "user_id category n")
+
+CURRENCIES = ["KZT", "USD", "RUB", "EUR", "CNY"]
+
+
+def synthetic_chunk(first_user_id: int, n_users: int, categories: list[str], per_user: int):
+    stats, counts = [], []
+    for user_id in range(first_user_id, first_user_id + n_users):
+        stats.append(StatsRow(user_id, random.uniform(500, 50_000), random.uniform(0, 10_000),
+                              random.randint(1, 500), random.choice(CURRENCIES)))
+        for category in random.sample(categories, per_user):
+            counts.append(CountRow(user_id, category, random.randint(1, 50)))
+    return stats, counts
+
+
+def run(n_users: int, n_categories: int, per_user: int):
+    categories = [f"cat{i}" for i in range(n_categories)]
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    builder = FeatureMatrixBuilder()
+    for first in range(1, n_users + 1, FEATURE_CHUNK_USERS):
+        stats, counts = synthetic_chunk(first, min(FEATURE_CHUNK_USERS, n_users + 1 - first), categories, per_user)
+        builder.add_chunk(stats, counts)
+        del stats, counts
+    user_ids, X = builder.build()
+    model = fit_model(user_ids, X, builder.columns)
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    dense_mb = n_users * len(model.columns) * 8 / 2**20
+    print(
+        f"{n_users:>9,} users x {len(model.columns)} columns, nnz {model.X.nnz:,}: "
+        f"{elapsed:6.1f}s, peak {peak / 2**20:8.1f} MB (dense float64 matrix alone: {dense_mb:8.1f} MB)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sparse feature matrix memory")
+    parser.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--per-user", type=int, default=8, help="Distinct categories per user")
+    args = parser.parse_args()
+    random.seed(0)
+    for n in args.users:
+        run(n, args.categories, args.per_user)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Closed-form savings projection vs the month-by-month simulation, and a check
+that both give the same months and rounded final amounts on random inputs:
+
+    python -m benchmarks.bench_savings_projection --cells 200000
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from product_catalog import DAYS_PER_MONTH
+from saving_strategies import project, simulate, what_if_savings
+
+RATES = [0.0, 0.05, 0.12, 0.17, 0.3]
+# Fractional terms come from products with *_term_days
+TERMS = [12, 60, 1200, 6.5, 91 / DAYS_PER_MONTH, 400 / DAYS_PER_MONTH]
+
+
+def random_grid(cells: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    goal = rng.integers(0, 50_000_000, cells).astype(float)
+    balance = rng.integers(0, 20_000_000, cells).astype(float)
+    monthly = rng.integers(0, 2_000_000, cells).astype(float)
+    monthly[rng.random(cells) < 0.05] = 0
+    rate = rng.choice(RATES, cells)
+    term = rng.choice(TERMS, cells).astype(float)
+    return goal, balance, monthly, rate, term
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=200_000)
+    args = parser.parse_args()
+
+    grid = random_grid(args.cells)
+    t0 = time.perf_counter()
+    months, final = project(*grid)
+    vectorized = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    mismatches = 0
+    for i in range(args.cells):
+        n, balance = simulate(*(float(x[i]) for x in grid))
+        expected = n if balance >= grid[0][i] else -1
+        if expected != months[i] or round(balance, 2) != round(float(final[i]), 2):
+            mismatches += 1
+    loop = time.perf_counter() - t0
+
+    print(f"{args.cells} cells: closed form {vectorized * 1000:.1f} ms, loop {loop * 1000:.1f} ms, "
+          f"{mismatches} mismatches")
+
+    timings = []
+    for _ in range(1000):
+        t0 = time.perf_counter()
+        what_if_savings(5_000_000, 1_500_000, 300_000, [10, 20, 50])
+        timings.append((time.perf_counter() - t0) * 1e6)
+    timings.sort()
+    print(f"what_if_savings p50 {statistics.median(timings):.0f} us, p95 {timings[949]:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Load harness for runtime.ShardedRuntime: throughput against worker count and
+a check that every chat is served by one worker, in order.
+
+Workers run a stub handler instead of the bot, so no Telegram, OpenAI or
+database is needed. By default it is CPU-bound (--cpu-ms of Python work per
+update, hashing the update like handlers parse and format text), so the
+speedup measures what extra processes buy on this host's cores and
+levels off at the CPU count. --io-ms adds awaiting per update (one update
+at a time, like a worker with BOT_CONCURRENT_UPDATES=1); that part scales
+with workers even on one core and is reported separately on purpose:
+
+    python -m benchmarks.bench_sharded_runtime --updates 400 --chats 100 --workers 1 2 4 8
+    python -m benchmarks.bench_sharded_runtime --cpu-ms 2 --io-ms 40
+"""
+import hashlib
+import json
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import time
+from collections import defaultdict
+
+from runtime import ShardedRuntime, chat_id_of
+
+CPU_MS = 20
+IO_MS = 0
+
+
+def cpu_work(update: dict, ms: float):
+    """Hash the serialized update over and over for `ms` of CPU time."""
+    payload = json.dumps(update).encode()
+    deadline = time.process_time() + ms / 1000
+    while time.process_time() < deadline:
+        for _ in range(100):
+            payload = hashlib.sha256(payload).digest()
+
+
+async def stub_worker(index: int, updates, results, cpu_ms: float, io_ms: float):
+    async for update in updates:
+        cpu_work(update, cpu_ms)
+        if io_ms:
+            await asyncio.sleep(io_ms / 1000)
+        results.put((chat_id_of(update), update["message"]["message_id"], index))
+
+
+def make_update(update_id: int, chat_id: int, seq: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {"message_id": seq, "chat": {"id": chat_id, "type": "private"}, "text": "hi"},
+    }
+
+
+def run(workers: int, n_updates: int, n_chats: int, cpu_ms: float, io_ms: float) -> tuple[float, bool]:
+    results = mp.get_context("spawn").Queue()
+    runtime = ShardedRuntime(
+        workers,
+        target="benchmarks.bench_sharded_runtime:stub_worker",
+        target_args=(results, cpu_ms, io_ms),
+        queue_size=n_updates,
+    )
+    runtime.start()
+    # Warm up: one update per worker, so process start-up is not measured
+    warmup_chats = list(range(-workers, 0))
+    for chat in warmup_chats:
+        runtime.dispatch(make_update(0, chat, 0))
+    for _ in warmup_chats:
+        results.get()
+
+    seq = defaultdict(int)
+    start = time.perf_counter()
+    for update_id in range(n_updates):
+        chat = update_id % n_chats + 1
+        seq[chat] += 1
+        runtime.dispatch(make_update(update_id, chat, seq[chat]))
+    served = [results.get() for _ in range(n_updates)]
+    elapsed = time.perf_counter() - start
+    runtime.stop()
+
+    last_seq, owner, ordered = {}, {}, True
+    for chat, message_id, worker in served:
+        ordered &= message_id == last_seq.get(chat, 0) + 1 and owner.setdefault(chat, worker) == worker
+        last_seq[chat] = message_id
+    return n_updates / elapsed, ordered
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=400)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--cpu-ms", type=float, default=CPU_MS, help="CPU time per update")
+    parser.add_argument("--io-ms", type=float, default=IO_MS, help="Awaited time per update")
+    args = parser.parse_args()
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{cpus} CPUs, handler {args.cpu_ms:g} ms CPU + {args.io_ms:g} ms IO")
+    if args.io_ms == 0:
+        print(f"CPU-bound: the speedup cannot exceed x{cpus}")
+    base = None
+    for workers in args.workers:
+        throughput, ordered = run(workers, args.updates, args.chats, args.cpu_ms, args.io_ms)
+        base = base or throughput
+        print(f"{workers:>2} workers: {throughput:7.1f} updates/s  x{throughput / base:4.1f}  "
+              f"per-chat order {'ok' if ordered else 'VIOLATED'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Latency of analytics.get_spending_series for a user with years of history.
+
+Inserts a synthetic history for one existing user inside a transaction that is
+rolled back at the end, so the database is left untouched:
+
+    python -m benchmarks.bench_spending_series --years 5 --tx-per-day 20
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from analytics import get_spending_series, SERIES_GRANULARITIES
+from db import engine
+from db.models import t_transactions
+
+CATEGORIES = ["groceries", "restaurants", "transport", "online_shopping", "entertainment", "utilities"]
+CURRENCIES = ["KZT", "USD", "EUR"]
+# Fixed rates so the benchmark measures the query, not the rates API
+RATES_FROM_EUR = {"kzt": 600.0, "usd": 1.1, "eur": 1.0}
+
+
+def gen_history(user_id: int, years: int, tx_per_day: int) -> list[dict]:
+    now = datetime.now(timezone.utc)
+    rows = []
+    for day in range(years * 365):
+        base = now - timedelta(days=day)
+        for _ in range(tx_per_day):
+            rows.append({
+                "user_id": user_id,
+                "from_account_id": user_id,  # spending is matched on from_account_id
+                "datetime": base - timedelta(seconds=random.randint(0, 86_399)),
+                "amount": Decimal(f"{random.uniform(500, 50_000):.2f}"),
+                "currency": random.choice(CURRENCIES),
+                "category": random.choice(CATEGORIES),
+            })
+    return rows
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark spending series queries")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--tx-per-day", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        try:
+            # from_account_id references accounts, so the user's id must also be an account id
+            user_id = (
+                await conn.execute(text("SELECT id FROM users WHERE id IN (SELECT id FROM accounts) ORDER BY id LIMIT 1"))
+            ).scalar()
+            if user_id is None:
+                raise SystemExit("Seed the database first: python seed_db_script.py")
+
+            rows = gen_history(user_id, args.years, args.tx_per_day)
+            for i in range(0, len(rows), 5_000):
+                await conn.execute(sa.insert(t_transactions), rows[i:i + 5_000])
+            await conn.execute(text("ANALYZE transactions"))
+            print(f"Inserted {len(rows):,} transactions for user {user_id}")
+
+            end = datetime.now(timezone.utc)
+            for granularity in SERIES_GRANULARITIES:
+                for days in (30, 365, args.years * 365):
+                    start = end - timedelta(days=days)
+                    timings = []
+                    for _ in range(args.repeat):
+                        t0 = time.perf_counter()
+                        series = await get_spending_series(
+                            user_id, start, end, granularity, RATES_FROM_EUR, conn=conn
+                        )
+                        timings.append((time.perf_counter() - t0) * 1000)
+                    timings.sort()
+                    p95 = timings[int(len(timings) * 0.95) - 1]
+                    print(
+                        f"{granularity:>5} over {days:>5} days: {len(series):>6} points, "
+                        f"p50 {statistics.median(timings):7.2f} ms, p95 {p95:7.2f} ms"
+                    )
+        finally:
+            await trans.rollback()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
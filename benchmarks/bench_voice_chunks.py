@@ -0,0 +1,79 @@
+"""
+Transcription latency against voice note length, whole vs chunked, with a
+stubbed endpoint whose latency is a fixed overhead plus a per-audio-second
+cost (roughly what the hosted model shows). No network or audio codecs are
+needed; chunk boundaries come from voice.split_points on synthetic silences:
+
+    python -m benchmarks.bench_voice_chunks --chunk-seconds 60 --concurrency 4
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from voice import split_points, transcribe_chunks
+
+LENGTHS_SECONDS = [15, 60, 120, 300, 600, 1200]
+OVERHEAD_SECONDS = 0.4
+SECONDS_PER_AUDIO_SECOND = 0.03
+# Run the stub this many times faster than real time
+SPEEDUP = 20
+
+
+def synthetic_silences(duration_ms: int) -> list[tuple[int, int]]:
+    """A pause of 0.3-1 s every 3-12 s, like speech."""
+    silences, position = [], 0
+    while position < duration_ms:
+        position += random.randint(3_000, 12_000)
+        length = random.randint(300, 1_000)
+        silences.append((position, min(position + length, duration_ms)))
+        position += length
+    return silences
+
+
+async def stub_transcribe(chunk: bytes) -> str:
+    # Chunks are stand-ins whose length is their duration in ms
+    seconds = len(chunk) / 1000
+    await asyncio.sleep((OVERHEAD_SECONDS + SECONDS_PER_AUDIO_SECOND * seconds) / SPEEDUP)
+    return f"[{seconds:.0f}s]"
+
+
+async def measure(duration_ms: int, chunk_seconds: int, concurrency: int) -> tuple[float, float, int, float]:
+    whole = time.perf_counter()
+    await transcribe_chunks([b"\0" * duration_ms], transcribe_chunk=stub_transcribe,
+                            slots=asyncio.Semaphore(1))
+    whole = (time.perf_counter() - whole) * SPEEDUP
+
+    cuts = split_points(duration_ms, synthetic_silences(duration_ms), chunk_seconds * 1000)
+    bounds = [0, *cuts, duration_ms]
+    chunks = [b"\0" * (end - start) for start, end in zip(bounds, bounds[1:])]
+
+    first_partial = None
+    start = time.perf_counter()
+
+    async def on_partial(_text: str):
+        nonlocal first_partial
+        if first_partial is None:
+            first_partial = (time.perf_counter() - start) * SPEEDUP
+
+    await transcribe_chunks(chunks, on_partial, transcribe_chunk=stub_transcribe,
+                            slots=asyncio.Semaphore(concurrency))
+    chunked = (time.perf_counter() - start) * SPEEDUP
+    return whole, chunked, len(chunks), first_partial if first_partial is not None else chunked
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-seconds", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"{'length':>8} {'whole':>8} {'chunked':>8} {'chunks':>7} {'first partial':>14}")
+    for seconds in LENGTHS_SECONDS:
+        whole, chunked, n, first = await measure(seconds * 1000, args.chunk_seconds, args.concurrency)
+        print(f"{seconds:>7}s {whole:>7.1f}s {chunked:>7.1f}s {n:>7} {first:>13.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
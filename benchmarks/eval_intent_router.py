@@ -0,0 +1,101 @@
+"""
+Accuracy and latency of the intent router on a held-out split of its
+labelled examples, and how often the resulting route would still have
+given the model what it needed (the FAQ context for FAQ questions, the
+right tool schema for tool requests):
+
+    python -m benchmarks.eval_intent_router --test-share 0.25 --seeds 5
+
+The split is by source item: all template variants of one glossary term,
+product or city land on the same side, so the test set never contains a
+rephrasing of a training example. Per-intent recall and safe-route rate
+are reported next to the overall figures, since the FAQ class outnumbers
+every tool class.
+"""
+import argparse
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from intent_router import FAQ, SMALLTALK, IntentRouter, example_groups, fit_classifier, route_for
+
+
+def split_examples(
+    groups: list[tuple[str, list[str]]], test_share: float = 0.25, seed: int = 0
+) -> tuple[tuple[list[str], list[str]], tuple[list[str], list[str]]]:
+    """(train, test) split of labelled example groups, stratified by label; a group is never split."""
+    rng = random.Random(seed)
+    by_label: dict[str, list[list[str]]] = defaultdict(list)
+    for label, group in groups:
+        by_label[label].append(group)
+    train, test = ([], []), ([], [])
+    for label, label_groups in by_label.items():
+        label_groups = label_groups[:]
+        rng.shuffle(label_groups)
+        n_test = max(1, round(len(label_groups) * test_share))
+        for part, chunk in ((test, label_groups[:n_test]), (train, label_groups[n_test:])):
+            for group in chunk:
+                part[0].extend(group)
+                part[1].extend([label] * len(group))
+    return train, test
+
+
+def route_is_safe(label: str, route) -> bool:
+    if label == SMALLTALK:
+        return True
+    if label == FAQ:
+        return route.use_faq
+    return any(tool["name"] == label for tool in route.tools)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--test-share", type=float, default=0.25)
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--min-confidence", type=float, default=0.5)
+    args = parser.parse_args()
+
+    groups = example_groups()
+    n_examples = sum(len(group) for _, group in groups)
+    print(f"{n_examples} examples in {len(groups)} source groups, {len({label for label, _ in groups})} intents")
+    accuracies, safe_rates, full_rates, latencies = [], [], [], []
+    # label -> [tested, correct, safe] over all splits
+    per_label: dict[str, list[int]] = defaultdict(lambda: [0, 0, 0])
+    for seed in range(args.seeds):
+        (train_texts, train_labels), (test_texts, test_labels) = split_examples(groups, args.test_share, seed)
+        router = IntentRouter(fit_classifier(train_texts, train_labels), args.min_confidence)
+        predicted, safe, full = [], 0, 0
+        for text, label in zip(test_texts, test_labels):
+            start = time.perf_counter()
+            intent, confidence = router.classify(text)
+            latencies.append(time.perf_counter() - start)
+            route = route_for(intent, confidence, args.min_confidence)
+            predicted.append(intent)
+            is_safe = route_is_safe(label, route)
+            safe += is_safe
+            full += route.intent == "full"
+            counts = per_label[label]
+            counts[0] += 1
+            counts[1] += intent == label
+            counts[2] += is_safe
+        accuracies.append(sum(p == t for p, t in zip(predicted, test_labels)) / len(test_labels))
+        safe_rates.append(safe / len(test_labels))
+        full_rates.append(full / len(test_labels))
+
+    print(f"{'intent':<32} {'tested':>6} {'recall':>7} {'safe':>7}")
+    for label, (tested, correct, is_safe) in sorted(per_label.items()):
+        print(f"{label:<32} {tested:>6} {correct / tested:>7.3f} {is_safe / tested:>7.3f}")
+    recalls = [correct / tested for tested, correct, _ in per_label.values()]
+
+    latencies.sort()
+    print(f"accuracy         {statistics.mean(accuracies):.3f} (min {min(accuracies):.3f} over {args.seeds} splits)")
+    print(f"recall           macro {statistics.mean(recalls):.3f}, worst intent {min(recalls):.3f}")
+    print(f"safe routes      {statistics.mean(safe_rates):.3f}")
+    print(f"full fallbacks   {statistics.mean(full_rates):.3f} (confidence < {args.min_confidence})")
+    print(f"classify         median {latencies[len(latencies) // 2] * 1e3:.3f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
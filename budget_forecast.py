@@ -0,0 +1,103 @@
+import calendar
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+import numpy as np
+from analytics import SERIES_TIMEZONE, get_spending_series
+
+HISTORY_DAYS = 364  # 52 full weeks, so every weekday is equally represented
+# Both windows are whole weeks, so weekday effects cancel out of the level
+SHORT_WINDOW_DAYS = 28
+LONG_WINDOW_DAYS = 91
+
+
+def daily_matrix(series: list[dict], start: date, days: int) -> tuple[np.ndarray, np.ndarray]:
+    """Turn get_spending_series output into (categories, [category x day] KZT matrix)."""
+    if not series:
+        return np.array([], dtype=object), np.zeros((0, days))
+
+    offsets = np.fromiter(
+        (date.fromisoformat(p["bucket"]).toordinal() for p in series), dtype=np.int64, count=len(series)
+    ) - start.toordinal()
+    amounts = np.fromiter((p["amount_kzt"] for p in series), dtype=np.float64, count=len(series))
+    categories, codes = np.unique(
+        np.array([p["category"] or "other" for p in series], dtype=object), return_inverse=True
+    )
+
+    in_range = (offsets >= 0) & (offsets < days)
+    matrix = np.zeros((len(categories), days))
+    np.add.at(matrix, (codes[in_range], offsets[in_range]), amounts[in_range])
+    return categories, matrix
+
+
+def forecast_month(matrix: np.ndarray, start: date, month_start: date) -> np.ndarray:
+    """
+    Expected spend per category over the calendar month starting at `month_start`.
+
+    level    = mean of the 28- and 91-day moving averages of daily spend
+    seasonal = per-category weekday mean / overall mean over the whole history
+    forecast = sum over the month's days of level * seasonal[weekday]
+    """
+    n_categories, days = matrix.shape
+    if n_categories == 0:
+        return np.zeros(0)
+
+    weekdays = (np.arange(days) + start.weekday()) % 7
+    onehot = np.eye(7)[weekdays]  # [day x weekday]
+    weekday_mean = (matrix @ onehot) / onehot.sum(axis=0)
+    overall_mean = matrix.mean(axis=1, keepdims=True)
+    seasonal = np.divide(
+        weekday_mean, overall_mean, out=np.ones_like(weekday_mean), where=overall_mean > 0
+    )
+
+    level = (
+        matrix[:, -SHORT_WINDOW_DAYS:].mean(axis=1) + matrix[:, -LONG_WINDOW_DAYS:].mean(axis=1)
+    ) / 2
+
+    month_days = calendar.monthrange(month_start.year, month_start.month)[1]
+    month_weekdays = (np.arange(month_days) + month_start.weekday()) % 7
+    weekday_counts = np.bincount(month_weekdays, minlength=7)
+    return level * (seasonal @ weekday_counts)
+
+
+def build_forecast(series: list[dict], today: date) -> dict:
+    """Forecast of next calendar month from the daily series ending yesterday."""
+    start = today - timedelta(days=HISTORY_DAYS)
+    categories, matrix = daily_matrix(series, start, HISTORY_DAYS)
+
+    month_start = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+    forecast = forecast_month(matrix, start, month_start)
+    last_30_days = matrix[:, -30:].sum(axis=1)
+
+    order = np.argsort(-forecast)
+    return {
+        "month": month_start.strftime("%Y-%m"),
+        "total_forecast_kzt": round(float(forecast.sum()), 2),
+        "categories": [
+            {
+                "category": str(categories[i]),
+                "forecast_kzt": round(float(forecast[i]), 2),
+                "last_30_days_kzt": round(float(last_30_days[i]), 2),
+            }
+            for i in order
+        ],
+    }
+
+
+def history_window(today: date) -> tuple[datetime, datetime]:
+    """[start, end) of the daily series the forecast is built from: HISTORY_DAYS ending yesterday."""
+    tz = ZoneInfo(SERIES_TIMEZONE)
+    start = datetime.combine(today - timedelta(days=HISTORY_DAYS), time(), tzinfo=tz)
+    end = datetime.combine(today, time(), tzinfo=tz)
+    return start, end
+
+
+async def forecast_category_budget(user_id: int) -> dict:
+    """
+    Next month's spend per category for the user. Reads the same bucketed,
+    index-only daily series as the analytics line chart; no extra table scans.
+    """
+    today = datetime.now(ZoneInfo(SERIES_TIMEZONE)).date()
+    start, end = history_window(today)
+
+    series = await get_spending_series(user_id, start, end, "day")
+    return build_forecast(series, today)
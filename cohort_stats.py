@@ -0,0 +1,239 @@
+"""
+Precomputed cohort statistics for motivational comparisons.
+
+    python cohort_stats.py [--chunk-size 20000]
+
+Users are grouped by city, age band and dominant spending profile (the
+category with the most transactions in the similarity features). For each
+cohort the job stores the median monthly savings rate of its goals
+(share of the target saved per month since the goal was created), the
+median goal size in KZT and the share of goals past their deadline that
+were completed. Cohorts smaller than MIN_COHORT_SIZE are folded into
+coarser ones ("*" = any), so every user maps to a cohort with enough
+members. The bot reads a user's cohort with one indexed join.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, text
+from analytics import convert_to_kzt, get_rates
+from batch_jobs import Progress, count_users_after, iter_user_id_chunks
+from db import engine
+from db.models import t_cohort_stats, t_user_cohorts
+from user_grouping import FEATURE_CHUNK_USERS, FeatureMatrixBuilder, fetch_feature_chunk
+
+MIN_COHORT_SIZE = 20
+ANY = "*"
+AGE_BANDS = [(18, "18-24"), (25, "25-34"), (35, "35-44"), (45, "45-54"), (55, "55-64"), (65, "65+")]
+# Finest to coarsest; a user is assigned the first level whose cohort is big enough
+COHORT_LEVELS = [
+    ("city", "age_band", "profile"),
+    ("city", "age_band"),
+    ("age_band", "profile"),
+    ("age_band",),
+    (),
+]
+DAYS_PER_MONTH = 30.44
+
+USERS_QUERY = text("SELECT id, city, birth_date FROM users WHERE id = ANY(:user_ids)")
+GOALS_QUERY = text(
+    """
+    SELECT user_id, target_amount, current_amount, currency, deadline, created_at
+    FROM financial_goals
+    WHERE user_id = ANY(:user_ids)
+    """
+)
+
+USER_COHORT_QUERY = text(
+    """
+    SELECT s.city, s.age_band, s.profile, s.members, s.goals,
+           s.median_savings_rate_pct, s.median_goal_kzt, s.on_time_pct
+    FROM user_cohorts u
+    JOIN cohort_stats s USING (city, age_band, profile)
+    WHERE u.user_id = :user_id
+    """
+)
+
+
+def age_band(birth_date: date | None, today: date) -> str:
+    if birth_date is None:
+        return "unknown"
+    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+    band = "under 18"
+    for lower, name in AGE_BANDS:
+        if age >= lower:
+            band = name
+    return band
+
+
+def dominant_profiles(user_ids: np.ndarray, X, columns: list[str]) -> dict[int, str]:
+    """Category with the most transactions per user, from the raw feature matrix."""
+    category_cols = [i for i, c in enumerate(columns) if c.startswith("category_")]
+    if not category_cols or len(user_ids) == 0:
+        return {}
+    counts = X[:, category_cols].toarray() if hasattr(X, "toarray") else X[:, category_cols]
+    best = counts.argmax(axis=1)
+    names = [columns[i][len("category_"):-len("_count")] for i in category_cols]
+    return {
+        int(u): names[b] if counts[row, b] > 0 else "mixed"
+        for row, (u, b) in enumerate(zip(user_ids, best))
+    }
+
+
+def goal_metrics(goals: pd.DataFrame, rates_from_eur: dict, today: date) -> pd.DataFrame:
+    """Per-goal target in KZT, monthly savings rate and on-time completion flag."""
+    goals = goals.copy()
+    target = goals["target_amount"].astype(float)
+    current = goals["current_amount"].astype(float)
+    created = pd.to_datetime(goals["created_at"], utc=True).dt.date
+    months = np.maximum(1.0, np.array([(today - d).days for d in created]) / DAYS_PER_MONTH)
+
+    goals["target_kzt"] = [
+        convert_to_kzt(a, c, rates_from_eur) for a, c in zip(goals["target_amount"], goals["currency"])
+    ]
+    goals["savings_rate_pct"] = np.where(target > 0, current / target / months * 100, np.nan)
+    deadline = pd.to_datetime(goals["deadline"])
+    due = deadline.notna() & (deadline.dt.date <= today)
+    goals["on_time"] = np.where(due, (current >= target).astype(float), np.nan)
+    return goals
+
+
+def aggregate(members: pd.DataFrame, goals: pd.DataFrame, level: tuple) -> pd.DataFrame:
+    """Cohort stats at one level of COHORT_LEVELS, keyed by (city, age_band, profile)."""
+    members = members.copy()
+    goals = goals.copy()
+    for key in ("city", "age_band", "profile"):
+        if key not in level:
+            members[key] = ANY
+            goals[key] = ANY
+    keys = ["city", "age_band", "profile"]
+
+    sizes = members.groupby(keys).size().rename("members")
+    stats = goals.groupby(keys).agg(
+        goals=("user_id", "size"),
+        median_savings_rate_pct=("savings_rate_pct", "median"),
+        median_goal_kzt=("target_kzt", "median"),
+        on_time_pct=("on_time", "mean"),
+    )
+    stats["on_time_pct"] *= 100
+    return pd.concat([sizes, stats], axis=1).fillna({"goals": 0}).reset_index()
+
+
+def assign_cohorts(members: pd.DataFrame, goals: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Stats of every cohort with at least MIN_COHORT_SIZE members (plus the
+    overall "*" cohort), and `members` with the cohort_* key each user is
+    assigned: the finest level of COHORT_LEVELS that is big enough.
+    """
+    keys = ["city", "age_band", "profile"]
+    members = members.copy()
+    assigned = np.zeros(len(members), dtype=bool)
+    for key in keys:
+        members[f"cohort_{key}"] = ANY
+    cohorts = []
+    for level in COHORT_LEVELS:
+        stats = aggregate(members, goals, level)
+        if level:
+            stats = stats[stats["members"] >= MIN_COHORT_SIZE]
+        cohorts.append(stats)
+
+        key_of = members[keys].copy()
+        for key in keys:
+            if key not in level:
+                key_of[key] = ANY
+        eligible = key_of.merge(stats[keys], on=keys, how="left", indicator=True)["_merge"].eq("both").to_numpy()
+        take = eligible & ~assigned
+        for key in keys:
+            members.loc[take, f"cohort_{key}"] = key_of.loc[take, key]
+        assigned |= take
+    return pd.concat(cohorts, ignore_index=True).drop_duplicates(subset=keys), members
+
+
+async def load_chunk(user_ids: list[int], rates_from_eur: dict, today: date):
+    builder = FeatureMatrixBuilder()
+    await fetch_feature_chunk(builder, user_ids)
+    feature_ids, X = builder.build()
+    profiles = dominant_profiles(feature_ids, X, builder.columns)
+
+    async with engine.connect() as conn:
+        users = (await conn.execute(USERS_QUERY, {"user_ids": user_ids})).fetchall()
+        goals = pd.DataFrame((await conn.execute(GOALS_QUERY, {"user_ids": user_ids})).mappings().all())
+
+    members = pd.DataFrame(
+        {
+            "user_id": [u.id for u in users],
+            "city": [u.city or "unknown" for u in users],
+            "age_band": [age_band(u.birth_date, today) for u in users],
+            "profile": [profiles.get(u.id, "mixed") for u in users],
+        }
+    )
+    if not goals.empty:
+        goals = goal_metrics(goals, rates_from_eur, today)[["user_id", "target_kzt", "savings_rate_pct", "on_time"]]
+    return members, goals
+
+
+async def run(chunk_size: int):
+    _, rates_from_eur = await get_rates()
+    today = date.today()
+
+    member_parts, goal_parts = [], []
+    progress = Progress("cohort_stats", await count_users_after(0))
+    async for user_ids in iter_user_id_chunks(0, chunk_size):
+        members, goals = await load_chunk(user_ids, rates_from_eur, today)
+        member_parts.append(members)
+        if not goals.empty:
+            goal_parts.append(goals)
+        progress.advance(len(user_ids))
+
+    if not member_parts:
+        logging.info("No users, nothing to do")
+        return
+    members = pd.concat(member_parts, ignore_index=True)
+    goals = (
+        pd.concat(goal_parts, ignore_index=True)
+        if goal_parts
+        else pd.DataFrame(columns=["user_id", "target_kzt", "savings_rate_pct", "on_time"])
+    )
+    cohorts, members = assign_cohorts(members, goals.merge(members, on="user_id"))
+    cohorts = cohorts.astype({"members": int, "goals": int})
+    cohort_rows = cohorts.replace({np.nan: None}).to_dict("records")
+    user_rows = [
+        {"user_id": int(r.user_id), "city": r.cohort_city, "age_band": r.cohort_age_band, "profile": r.cohort_profile}
+        for r in members.itertuples()
+    ]
+
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM user_cohorts"))
+        await conn.execute(text("DELETE FROM cohort_stats"))
+        await conn.execute(insert(t_cohort_stats), cohort_rows)
+        for start in range(0, len(user_rows), 10_000):
+            await conn.execute(insert(t_user_cohorts), user_rows[start:start + 10_000])
+    logging.info(f"Stored {len(cohort_rows)} cohorts for {len(user_rows)} users")
+
+
+async def get_user_cohort_stats(user_id: int) -> dict | None:
+    """Stats of the user's cohort, e.g. for "people like you save X% per month"."""
+    async with engine.connect() as conn:
+        row = (await conn.execute(USER_COHORT_QUERY, {"user_id": int(user_id)})).mappings().one_or_none()
+    if row is None:
+        return None
+    return {
+        "cohort": {k: row[k] for k in ("city", "age_band", "profile") if row[k] != ANY},
+        "members": row["members"],
+        "goals": row["goals"],
+        "median_monthly_savings_rate_pct": row["median_savings_rate_pct"],
+        "median_goal_kzt": row["median_goal_kzt"],
+        "goals_completed_by_deadline_pct": row["on_time_pct"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute cohort statistics")
+    parser.add_argument("--chunk-size", type=int, default=FEATURE_CHUNK_USERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.chunk_size))
@@ -21,9 +21,68 @@ class Settings(BaseSettings):
             f"@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
         )
     
+    # Update ingestion (see webhook.py)
+    BOT_MODE: str = Field("polling", description="polling or webhook")
+    BOT_CONCURRENT_UPDATES: int = Field(1, description="Updates handled concurrently by one process")
+    WEBHOOK_URL: str = Field("", description="Public base URL Telegram posts to; empty to skip registration")
+    WEBHOOK_PATH: str = Field("/telegram", description="Path of the webhook endpoint")
+    WEBHOOK_SECRET_TOKEN: str = Field("", description="Secret Telegram sends in X-Telegram-Bot-Api-Secret-Token")
+    WEBHOOK_HOST: str = Field("0.0.0.0", description="Interface the webhook server binds to")
+    WEBHOOK_PORT: int = Field(8080, description="Port the webhook server binds to")
+
+    # Sharded runtime and shared state (see runtime.py, state_store.py)
+    BOT_WORKERS: int = Field(1, description="Worker processes started by runtime.py")
+    STATE_STORE: str = Field("memory", description="memory, sqlite or postgres")
+    STATE_SQLITE_PATH: str = Field("bot_state.sqlite3", description="SQLite file of STATE_STORE=sqlite")
+    FAQ_CACHE_TTL_SECONDS: int = Field(24 * 60 * 60, description="How long FAQ answers are reused")
+    ANALYTICS_CACHE_TTL_SECONDS: int = Field(24 * 60 * 60, description="How long analytics summaries and charts are kept")
+
+    # Admission control and downstream limits (see scheduler.py)
+    SCHEDULER_MAX_QUEUE_DEPTH: int = Field(200, description="Chats served plus messages waiting before new ones get a busy reply")
+    SCHEDULER_MAX_PENDING_PER_CHAT: int = Field(10, description="Messages one chat may have waiting")
+    OPENAI_CONCURRENCY: int = Field(16, description="Concurrent OpenAI calls per process")
+    DB_CONCURRENCY: int = Field(10, description="Concurrent database-backed tool calls per process")
+    YFINANCE_CONCURRENCY: int = Field(2, description="Concurrent market data downloads per process")
+
+    # Reply delivery (see main.send_reply)
+    PROGRESSIVE_REPLIES: bool = Field(True, description="Send the answer (with known quick replies) first, then charts, then generated quick replies")
+
+    QUICK_REPLIES_MODE: str = Field("inline", description="inline (part of the main response) or separate (own LLM call)")
+    QUICK_REPLIES_CACHE_TTL_SECONDS: int = Field(60 * 60, description="How long suggestion sets are reused per intent")
+
+    # Intent routing (see intent_router.py)
+    INTENT_ROUTER: bool = Field(True, description="Skip the FAQ lookup and tool schemas a message does not need")
+    ROUTER_MIN_CONFIDENCE: float = Field(0.5, description="Below this the message gets the full FAQ + tools treatment")
+
+    # Outgoing Telegram requests (see rate_limiter.py). Limits are enforced per
+    # process: TELEGRAM_GLOBAL_RATE is the bot's total and each of the
+    # BOT_WORKERS processes gets an equal share; chat limits need no split,
+    # since a chat is always served by the same worker.
+    TELEGRAM_GLOBAL_RATE: float = Field(30, description="Requests per second to all chats, across all workers")
+    TELEGRAM_CHAT_RATE: float = Field(1, description="Requests per second to one private chat")
+    TELEGRAM_CHAT_BURST: int = Field(3, description="Requests one chat may receive back to back")
+    TELEGRAM_GROUP_RATE_PER_MINUTE: float = Field(20, description="Requests per minute to one group")
+    TELEGRAM_MAX_RETRIES: int = Field(3, description="Retries of a request after RetryAfter")
+
     # OpenAI Token
     OPENAI_API_KEY: str = Field(..., description="AI Token")
 
+    # Similarity model artifacts (see similarity_artifact.py)
+    SIMILARITY_ARTIFACT_DIR: str = Field("models/similarity", description="Directory of similarity model versions")
+
+    # Bank products (see product_catalog.py)
+    PRODUCT_CATALOG_PATH: str = Field("faq_rag/data/ru/products.json", description="Product catalog, reloaded on change")
+
+    # Voice transcription (see voice.py)
+    VOICE_CHUNK_SECONDS: int = Field(60, description="Target length of transcription chunks of long voice notes")
+    VOICE_TRANSCRIPTION_CONCURRENCY: int = Field(4, description="Chunks transcribed at once across all chats")
+    VOICE_PARTIAL_TRANSCRIPTS: bool = Field(False, description="Show the transcript while long notes are processed")
+
+    # Market data (see market_data.py)
+    MARKET_DATA_PROVIDER: str = Field("yfinance", description="Quote provider: yfinance or fixture")
+    MARKET_DATA_FIXTURE: str = Field("fixtures/market_data.json", description="Closes used by the fixture provider")
+    MARKET_QUOTES_PATH: str = Field("models/market_quotes.json", description="Last known quotes; empty to disable")
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
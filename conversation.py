@@ -55,3 +55,18 @@ class Conversation:
                 ):
                     serializable.append(item)
         return serializable
+
+    def to_dict(self) -> dict:
+        """State for a StateStore; restore with Conversation.from_dict."""
+        return {
+            "user_id": self.user_id,
+            "history": self.get_serializable_history(),
+            "is_new_conversation": self.is_new_conversation,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Conversation":
+        conversation = cls(data["user_id"])
+        conversation.history = data["history"]
+        conversation.is_new_conversation = data["is_new_conversation"]
+        return conversation
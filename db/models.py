@@ -1,5 +1,6 @@
 import sqlalchemy as sa
 from sqlalchemy import Column, ForeignKey, MetaData, Table, CheckConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
 
 metadata = MetaData(schema="public")
 
@@ -67,6 +68,13 @@ t_financial_goals = Table(
 )
 Index("ix_goals_user_id", t_financial_goals.c.user_id)
 Index("ix_goals_account_id", t_financial_goals.c.account_id)
+# Finished goals of a set of users, most recent deadline first, goals without one last (peer comparisons)
+Index(
+    "ix_goals_finished_user_deadline",
+    t_financial_goals.c.user_id, t_financial_goals.c.deadline.desc().nulls_last(),
+    postgresql_where=sa.text("current_amount >= target_amount"),
+    postgresql_include=["name", "target_amount", "currency"],
+)
 
 # -------- loans --------
 t_loans = Table(
@@ -106,3 +114,106 @@ t_transactions = Table(
 Index("ix_transactions_user_id", t_transactions.c.user_id)
 Index("ix_transactions_from_account_id", t_transactions.c.from_account_id)
 Index("ix_transactions_user_datetime", t_transactions.c.user_id, t_transactions.c.datetime)
+# Covers get_spending_series so bucketing a user's history is an index-only scan
+Index(
+    "ix_transactions_from_account_datetime_spend",
+    t_transactions.c.from_account_id, t_transactions.c.datetime,
+    postgresql_include=["category", "currency", "amount"],
+)
+
+# -------- user_transaction_versions --------
+# Bumped once per statement by the trg_transactions_versions_* triggers on every
+# write to a user's transactions (as user_id or from_account_id); the analytics
+# watermark.
+# No foreign key: from_account_id values are tracked too.
+t_user_transaction_versions = Table(
+    "user_transaction_versions", metadata,
+    Column("user_id",    INT(), primary_key=True),
+    Column("version",    sa.BigInteger(), nullable=False),
+    Column("updated_at", TS(), nullable=False, server_default=sa.text("now()")),
+)
+
+# -------- user_financial_summaries --------
+# Written by analytics_batch.py, read by the bot with one primary-key lookup
+t_user_financial_summaries = Table(
+    "user_financial_summaries", metadata,
+    Column("user_id",     INT(), ForeignKey("public.users.id", ondelete="CASCADE"), primary_key=True),
+    Column("watermark_version", sa.BigInteger(), nullable=False),
+    Column("rates_version", TEXT(),  nullable=False),
+    Column("summary",       JSONB(), nullable=False),
+    Column("pie_chart",     sa.LargeBinary(), nullable=True),
+    Column("line_chart",    sa.LargeBinary(), nullable=True),
+    Column("computed_at",   TS(),    nullable=False, server_default=sa.text("now()")),
+)
+
+# -------- user_neighbors --------
+# Top-k similar users, written by user_neighbors.py
+t_user_neighbors = Table(
+    "user_neighbors", metadata,
+    Column("user_id",     INT(), ForeignKey("public.users.id", ondelete="CASCADE"), primary_key=True),
+    Column("rank",        sa.SmallInteger(), primary_key=True),
+    Column("neighbor_id", INT(), ForeignKey("public.users.id", ondelete="CASCADE"), nullable=False),
+    Column("distance",    sa.Float(), nullable=False),
+    Column("computed_at", TS(), nullable=False, server_default=sa.text("now()")),
+)
+
+# -------- batch_checkpoints --------
+# Keyset cursor of resumable batch jobs over users
+t_batch_checkpoints = Table(
+    "batch_checkpoints", metadata,
+    Column("job",          TEXT(), primary_key=True),
+    Column("last_user_id", INT(),  nullable=False, server_default=sa.text("0")),
+    Column("processed",    INT(),  nullable=False, server_default=sa.text("0")),
+    Column("started_at",   TS(),   nullable=False, server_default=sa.text("now()")),
+    Column("updated_at",   TS(),   nullable=False, server_default=sa.text("now()")),
+    Column("finished_at",  TS(),   nullable=True),
+)
+
+# -------- cohort_stats --------
+# Written by cohort_stats.py; "*" in a key column means any value
+t_cohort_stats = Table(
+    "cohort_stats", metadata,
+    Column("city",     TEXT(), primary_key=True),
+    Column("age_band", TEXT(), primary_key=True),
+    Column("profile",  TEXT(), primary_key=True),
+    Column("members",  INT(),  nullable=False),
+    Column("goals",    INT(),  nullable=False),
+    Column("median_savings_rate_pct", sa.Float(), nullable=True),
+    Column("median_goal_kzt",         sa.Float(), nullable=True),
+    Column("on_time_pct",             sa.Float(), nullable=True),
+    Column("computed_at", TS(), nullable=False, server_default=sa.text("now()")),
+)
+
+# -------- user_cohorts --------
+# Cohort each user is compared against, written by cohort_stats.py
+t_user_cohorts = Table(
+    "user_cohorts", metadata,
+    Column("user_id",  INT(),  ForeignKey("public.users.id", ondelete="CASCADE"), primary_key=True),
+    Column("city",     TEXT(), nullable=False),
+    Column("age_band", TEXT(), nullable=False),
+    Column("profile",  TEXT(), nullable=False),
+)
+
+# -------- bot state (see state_store.py, STATE_STORE=postgres) --------
+# Keyed by Telegram ids, which do not fit INT
+t_bot_conversations = Table(
+    "bot_conversations", metadata,
+    Column("user_id",    sa.BigInteger(), primary_key=True),
+    Column("data",       JSONB(), nullable=False),
+    Column("updated_at", TS(),    nullable=False, server_default=sa.text("now()")),
+)
+
+# Chats subscribed (/alerts) to the spending alerts of a bank user
+t_bot_alert_subscriptions = Table(
+    "bot_alert_subscriptions", metadata,
+    Column("user_id", sa.BigInteger(), primary_key=True),
+    Column("chat_id", sa.BigInteger(), primary_key=True),
+)
+
+t_bot_cache = Table(
+    "bot_cache", metadata,
+    Column("namespace",  TEXT(), primary_key=True),
+    Column("key",        TEXT(), primary_key=True),
+    Column("value",      TEXT(), nullable=False),
+    Column("expires_at", TS(),   nullable=False),
+)
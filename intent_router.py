@@ -0,0 +1,226 @@
+"""
+Local intent router: decides per message whether the FAQ lookup, the tool
+schemas and the full history are needed before anything is sent to OpenAI.
+
+A TF-IDF (character n-grams) + logistic regression classifier labels a
+message as "smalltalk", "faq" or the name of one tool in llm_tools.tools.
+It is trained at startup in well under a second on examples built from
+faq_rag/data/ru (FAQ and help questions, glossary terms, products,
+contacts) plus the synthetic phrasings below, and classifies a message in
+a fraction of a millisecond.
+
+    smalltalk   no FAQ lookup, no tools, short history
+    faq         FAQ lookup, no tools
+    <tool>      that tool's schema only, no FAQ lookup
+    (unsure)    everything, as before the router
+
+Answers to a question the bot just asked ("5000000", "да") are always
+routed fully, since their meaning is in the question. Decisions and what
+they saved are logged and counted in metrics (router.*).
+
+    python -m benchmarks.eval_intent_router   accuracy on a held-out split
+"""
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline, make_pipeline
+from config import get_settings
+from llm_tools import tools
+from metrics import metrics
+
+FAQ_DATA_DIR = "faq_rag/data/ru"
+SMALLTALK = "smalltalk"
+FAQ = "faq"
+FULL_HISTORY = 10
+SHORT_HISTORY = 4
+
+SYNTHETIC_EXAMPLES = {
+    SMALLTALK: [
+        "спасибо", "спасибо большое", "благодарю", "ок", "окей", "хорошо", "понятно", "ясно", "да", "нет",
+        "ага", "угу", "привет", "здравствуйте", "добрый день", "добрый вечер", "доброе утро", "пока",
+        "до свидания", "всего доброго", "отлично", "супер", "класс", "круто", "понял", "поняла",
+        "спасибо, всё понятно", "хорошего дня", "ладно", "ну ок", "👍", "спс", "благодарю за помощь",
+        "как дела", "ты бот?", "кто ты", "извините", "неважно", "забудь", "всё, спасибо",
+    ],
+    "generate_saving_strategies": [
+        "хочу накопить на машину", "как накопить на квартиру", "хочу накопить 5 миллионов",
+        "помоги составить план накоплений", "как быстрее накопить на отпуск", "стратегии накопления",
+        "моя цель накопить 2000000 тенге", "как собрать деньги на свадьбу", "подбери депозит для моей цели",
+        "хочу копить на учебу ребенка", "сколько времени нужно чтобы накопить на дом",
+        "как мне достичь финансовой цели", "накопить на первоначальный взнос", "план сбережений на год",
+        "хочу откладывать деньги на мечту", "коплю на машину, у меня уже есть 500 тысяч",
+        "как правильно копить деньги", "предложи стратегию сбережений", "хочу накопить на iphone",
+    ],
+    "what_if_savings": [
+        "а если откладывать на 20% больше", "насколько быстрее если копить больше",
+        "что если я буду откладывать 100 тысяч вместо 50", "а если увеличить ежемесячный взнос",
+        "сколько я выиграю если откладывать на 10 процентов больше", "что если копить в два раза больше",
+        "а если я буду откладывать меньше", "как изменится срок если добавлять по 30 тысяч",
+        "сравни сроки при разных суммах откладывания", "а если откладывать на половину больше",
+        "на сколько месяцев раньше если увеличить сбережения", "что будет если уменьшить взнос на 20%",
+        "если откладывать 150 тысяч в месяц когда я накоплю", "а при 50% больших накоплениях",
+    ],
+    "get_personal_finance_analytics": [
+        "покажи мои расходы", "анализ моих трат", "на что я трачу деньги", "аналитика расходов",
+        "сколько я потратил в этом месяце", "покажи статистику по категориям", "мои траты за месяц",
+        "разбивка расходов по категориям", "проанализируй мои финансы", "куда уходят мои деньги",
+        "сколько я трачу на еду", "отчет по расходам", "покажи график трат", "анализ моих расходов",
+        "где я могу сэкономить", "как оптимизировать мои траты", "мои доходы и расходы",
+        "сколько уходит на развлечения", "покажи мой бюджет",
+    ],
+    "get_investment_recommendations": [
+        "куда инвестировать", "посоветуй инвестиции", "во что вложить деньги", "инвестиционные советы",
+        "хочу инвестировать с низким риском", "рекомендации по инвестициям", "какие акции купить",
+        "консервативные инвестиции", "хочу рискованные инвестиции с высокой доходностью",
+        "куда вложить 1 миллион", "инвестировать в акции или депозит", "подбери портфель",
+        "умеренный риск инвестиции", "какие сейчас трендовые акции", "хочу приумножить деньги",
+        "халяльные инвестиции", "как начать инвестировать",
+    ],
+    "compare_goals": [
+        "как копят другие люди", "сравни меня с другими", "а как у других пользователей",
+        "сколько откладывают люди как я", "какие цели у похожих людей", "мотивируй меня примерами",
+        "чего достигли другие", "сравнить мои цели", "как другие достигают целей",
+        "сколько людей достигают цели вовремя", "что копят люди моего возраста",
+        "какие цели ставят в моем городе", "истории успеха других клиентов", "я копию лучше других?",
+    ],
+    "forecast_category_budget": [
+        "прогноз расходов на следующий месяц", "сколько я потрачу в следующем месяце", "прогноз бюджета",
+        "спрогнозируй мои траты", "какие будут расходы дальше", "бюджет на следующий месяц",
+        "сколько денег понадобится на еду в следующем месяце", "предскажи мои расходы",
+        "планирование бюджета на месяц", "ожидаемые траты по категориям", "сколько я буду тратить",
+        "прогноз по категориям расходов", "хватит ли мне денег в следующем месяце",
+    ],
+    FAQ: [
+        "список функционала", "что ты умеешь", "что умеет бот", "какие у тебя функции", "помощь",
+        "какие вклады есть в банке", "какие карты есть", "как открыть счет", "где ближайшее отделение",
+        "какой у банка телефон", "режим работы банка", "что такое исламский банк", "как взять финансирование",
+        "какие документы нужны", "почему мне отказали", "какая наценка", "что такое депозит",
+        "как скачать приложение", "есть ли кэшбэк", "тарифы банка", "как связаться с поддержкой",
+    ],
+}
+
+FAQ_TEMPLATES = ["{}", "что такое {}", "расскажи про {}", "{} это что", "объясни {}"]
+PRODUCT_TEMPLATES = ["{}", "расскажи про {}", "условия {}", "какая доходность у {}", "как оформить {}"]
+CITY_TEMPLATES = ["отделение в {}", "адрес банка в {}", "где офис в городе {}"]
+
+
+def faq_example_groups(data_dir: str = FAQ_DATA_DIR) -> list[list[str]]:
+    """
+    Questions the FAQ index answers, from the files it is built from, one
+    group per source item: the template variants of a glossary term, product
+    or city stay together.
+    """
+    def load(name):
+        with open(os.path.join(data_dir, name), encoding="utf-8") as f:
+            return json.load(f)
+
+    groups = [[item["question"]] for name in ("faq.json", "help.json") for item in load(name)]
+    for item in load("glossary.json"):
+        term = item["term"].split(" (")[0]
+        groups.append([t.format(term) for t in FAQ_TEMPLATES])
+    for item in load("products.json"):
+        groups.append([t.format(item["product_name"]) for t in PRODUCT_TEMPLATES])
+    # Several offices share a city; its phrasings form one group
+    cities = dict.fromkeys(item["city"] for item in load("contacts.json") if item.get("city"))
+    groups += [[t.format(city) for t in CITY_TEMPLATES] for city in cities]
+    groups += [[link["label"]] for link in load("learn_more.json")["learn_more_links"]]
+    return groups
+
+
+def example_groups(data_dir: str = FAQ_DATA_DIR) -> list[tuple[str, list[str]]]:
+    """(label, phrasings) per source item; a held-out split must keep each group on one side."""
+    groups = [(label, [example]) for label, examples in SYNTHETIC_EXAMPLES.items() for example in examples]
+    groups += [(FAQ, group) for group in faq_example_groups(data_dir)]
+    return groups
+
+
+def training_examples(data_dir: str = FAQ_DATA_DIR) -> tuple[list[str], list[str]]:
+    texts, labels = [], []
+    for label, group in example_groups(data_dir):
+        texts += group
+        labels += [label] * len(group)
+    return texts, labels
+
+
+def fit_classifier(texts: list[str], labels: list[str]) -> Pipeline:
+    classifier = make_pipeline(
+        TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), lowercase=True, sublinear_tf=True),
+        LogisticRegression(C=10, max_iter=2000, class_weight="balanced"),
+    )
+    classifier.fit(texts, labels)
+    return classifier
+
+
+@dataclass(frozen=True)
+class Route:
+    intent: str  # a label, or "full" when unsure or for a follow-up answer
+    confidence: float
+    use_faq: bool
+    tools: list[dict] = field(default_factory=list)
+    history_size: int = FULL_HISTORY
+
+
+TOOLS_BY_NAME = {tool["name"]: tool for tool in tools}
+FULL_ROUTE = Route("full", 0.0, use_faq=True, tools=tools)
+
+
+def route_for(intent: str, confidence: float, min_confidence: float) -> Route:
+    if confidence < min_confidence:
+        return Route("full", confidence, use_faq=True, tools=tools)
+    if intent == SMALLTALK:
+        return Route(intent, confidence, use_faq=False, history_size=SHORT_HISTORY)
+    if intent == FAQ:
+        return Route(intent, confidence, use_faq=True)
+    return Route(intent, confidence, use_faq=False, tools=[TOOLS_BY_NAME[intent]])
+
+
+class IntentRouter:
+    def __init__(self, classifier: Pipeline, min_confidence: float):
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+
+    def classify(self, text: str) -> tuple[str, float]:
+        probabilities = self.classifier.predict_proba([text])[0]
+        best = probabilities.argmax()
+        return self.classifier.classes_[best], float(probabilities[best])
+
+    def route(self, text: str, previous_reply: str | None = None) -> Route:
+        if previous_reply and previous_reply.rstrip().endswith("?"):
+            route = FULL_ROUTE
+            metrics.inc("router.follow_ups")
+        else:
+            start = time.perf_counter()
+            intent, confidence = self.classify(text)
+            metrics.observe("router.classify", time.perf_counter() - start)
+            route = route_for(intent, confidence, self.min_confidence)
+        log_route(text, route)
+        return route
+
+
+def log_route(text: str, route: Route):
+    skipped_tools = [t for t in tools if t not in route.tools]
+    saved_schema_chars = sum(len(json.dumps(t, ensure_ascii=False)) for t in skipped_tools)
+    metrics.inc(f"router.{route.intent}")
+    metrics.inc("router.schema_chars_saved", saved_schema_chars)
+    if not route.use_faq:
+        metrics.inc("router.faq_lookups_skipped")
+    logging.info(
+        f"Route {route.intent} ({route.confidence:.2f}) for {text[:50]!r}: faq={route.use_faq}, "
+        f"tools={[t['name'] for t in route.tools]}, history={route.history_size}, "
+        f"saved {len(skipped_tools)} tool schemas ({saved_schema_chars} chars)"
+    )
+
+
+@lru_cache
+def get_router() -> IntentRouter:
+    start = time.perf_counter()
+    texts, labels = training_examples()
+    router = IntentRouter(fit_classifier(texts, labels), get_settings().ROUTER_MIN_CONFIDENCE)
+    logging.info(f"Trained intent router on {len(texts)} examples in {time.perf_counter() - start:.2f}s")
+    return router
+
@@ -1,26 +1,36 @@
-import yfinance as yf
-import openai
 import json
 import asyncio
+import math
 import sys
+from market_data import get_market_data
+from product_catalog import get_catalog
 
 if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
-async def generate_investment_recommendations(risk_level: str):
-    client = openai.AsyncOpenAI(api_key=openai.api_key)
+def _bound(value: float) -> float | None:
+    """Product range bound for the model; unbounded (infinite) is None, since JSON has no Infinity."""
+    return value if math.isfinite(value) else None
+
 
+async def generate_investment_recommendations(risk_level: str):
     if risk_level == "low":
+        deposits = sorted(get_catalog().deposits(), key=lambda p: p.expected_yield_percent or 0, reverse=True)
         return {
             "risk_level": "low",
             "recommendations": [
-                {
-                    "type": "bank_deposit",
-                    "name": "Депозит 'Овернайт'",
-                    "expected_yield_percent": 12,
-                    "description": "Надёжный вариант с фиксированной доходностью и минимальным риском."
-                },
+                *(
+                    {
+                        "type": "bank_deposit",
+                        "name": f"Депозит '{deposit.name}'",
+                        "expected_yield_percent": deposit.expected_yield_percent,
+                        "min_amount_tenge": _bound(deposit.min_amount),
+                        "max_term_months": _bound(deposit.max_term_months),
+                        "description": "Надёжный вариант с фиксированной доходностью и минимальным риском."
+                    }
+                    for deposit in deposits
+                ),
                 {
                     "type": "gov_bond",
                     "name": "Гособлигации РК",
@@ -32,7 +42,8 @@ async def generate_investment_recommendations(risk_level: str):
 
     elif risk_level == "medium":
         stocks = ["AAPL", "MSFT", "GOOGL"]
-        data = {ticker: yf.Ticker(ticker).history(period="1y")["Close"].iloc[-1] for ticker in stocks}
+        quotes = await get_market_data().get_quotes(stocks)
+        data = {ticker: quote.current_price for ticker, quote in quotes.items()}
         return {
             "risk_level": "medium",
             "recommendations": [
@@ -42,51 +53,21 @@ async def generate_investment_recommendations(risk_level: str):
         }
 
     elif risk_level == "high":
-        # --- 1️⃣ Запрос к OpenAI ---
-        prompt = (
-            "Назови 5 американских акций, которые за последний месяц показали "
-            "наибольший рост по цене. Ответь строго JSON списком тикеров, например: "
-            '["NVDA", "TSLA", "AMD", "META", "AAPL"]'
-        )
-
-        response = await client.responses.create(
-            model="gpt-4.1-mini",
-            input=prompt
-        )
-
-        text = response.output_text.strip()
-        print("🔍 OpenAI raw output:", text)
-
-        # --- 2️⃣ Чистим Markdown-форматирование ---
-        cleaned_text = (
-            text.replace("```json", "")
-                .replace("```", "")
-                .strip()
-        )
-
-        # --- 3️⃣ Пробуем распарсить JSON ---
-        try:
-            trending_tickers = json.loads(cleaned_text)
-            print("✅ Используем акции от OpenAI:", trending_tickers)
-        except Exception as e:
-            print(f"⚠️ Ошибка парсинга: {e}")
-            print("Используем fallback тикеры.")
-            trending_tickers = ["QBTS", "SMCI", "AI", "NVDA", "PLTR"]
-
-        # --- 4️⃣ Получаем данные из yfinance ---
-        stock_data = {}
-        for ticker in trending_tickers:
-            try:
-                info = yf.Ticker(ticker).history(period="1mo")["Close"]
-                stock_data[ticker] = {
-                    "current_price": round(info.iloc[-1], 2),
-                    "month_growth_percent": round(((info.iloc[-1] - info.iloc[0]) / info.iloc[0]) * 100, 2)
-                }
-            except Exception as e:
-                print(f"⚠️ Ошибка при получении данных для {ticker}: {e}")
-                continue
+        # --- 1️⃣ Трендовые тикеры: считаются фоновой задачей по истории цен ---
+        market_data = get_market_data()
+        trending_tickers = market_data.trending_tickers()
+
+        # --- 2️⃣ Получаем данные одним пакетным запросом через кэш ---
+        quotes = await market_data.get_quotes(trending_tickers)
+        stock_data = {
+            ticker: {
+                "current_price": quote.current_price,
+                "month_growth_percent": quote.month_growth_percent,
+            }
+            for ticker, quote in quotes.items()
+        }
 
-        # --- 5️⃣ Формируем финальный ответ ---
+        # --- 3️⃣ Формируем финальный ответ ---
         return {
             "risk_level": "high",
             "recommendations": [
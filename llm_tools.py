@@ -24,6 +24,39 @@ tools = [
             "additionalProperties": False,
         },
     },
+    {
+        "type": "function",
+        "strict": True,
+        "name": "what_if_savings",
+        "description": (
+            "Compare how fast the client reaches a financial goal with the bank's deposits "
+            "if they change their monthly savings, e.g. \"how much faster if I save 20% more?\"."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "financial_goal": {
+                    "type": "integer",
+                    "description": "The client's financial goal in KZT.",
+                },
+                "current_balance": {
+                    "type": "integer",
+                    "description": "The client's current balance in KZT.",
+                },
+                "monthly_savings": {
+                    "type": "integer",
+                    "description": "How much the client saves monthly now.",
+                },
+                "monthly_savings_change_percent": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "description": "Changes of the monthly savings to compare, in percent (e.g. [10, 20, 50]). Empty for a default set.",
+                },
+            },
+            "required": ["financial_goal", "current_balance", "monthly_savings", "monthly_savings_change_percent"],
+            "additionalProperties": False,
+        },
+    },
     {
         "type": "function",
         "strict": True,
@@ -57,14 +90,26 @@ tools = [
         "type": "function",
         "strict": True,
         "name": "compare_goals",
-        "description": "Get anonymous insights about how other people are achieving their goals to motivate the user.",
+        "description": "Get anonymous insights about how other people are achieving their goals to motivate the user: recent goals finished by similar users and statistics of people like them (median monthly savings rate, typical goal size, share of goals completed by the deadline).",
+        "parameters": {
+            "type": "object",
+            "properties": {},
+            "required": [],
+            "additionalProperties": False,
+        },
+    },
+    {
+        "type": "function",
+        "strict": True,
+        "name": "forecast_category_budget",
+        "description": "Forecast the client's spending per category for next month based on their history.",
         "parameters": {
             "type": "object",
             "properties": {},
             "required": [],
             "additionalProperties": False,
         },
-    }
+    },
 ]
 
 
@@ -8,8 +8,11 @@ import random
 from db import engine
 import json
 from faq_rag.faq_rag import ask_faq
-from saving_strategies import generate_saving_strategies
+from saving_strategies import generate_saving_strategies, what_if_savings
+from product_catalog import get_catalog
 import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable
 from dotenv import load_dotenv
 import os
 import telegram
@@ -23,12 +26,31 @@ from telegram.ext import (
 )
 import openai_client
 from conversation import Conversation
-from llm_tools import tools
-from quick_replies import create_quick_replies, generate_quick_replies
-from analytics import get_user_financial_summary
-from pydub import AudioSegment
+from quick_replies import (
+    REPLY_FORMAT,
+    Suggestions,
+    complete_quick_replies,
+    create_quick_replies,
+    parse_structured_reply,
+    resolve_suggestions,
+    suggestion_intent,
+)
+from analytics_cache import get_cached_user_financial_summary, get_summary_charts
+from budget_forecast import forecast_category_budget
+from spending_alerts import SpendingAnomalyDetector
+from voice import download_voice, transcribe_voice
+from config import get_settings
+from webhook import start_webhook
+from state_store import get_store
+from scheduler import ChatScheduler, limit
+from rate_limiter import PriorityRateLimiter
+from typing_indicator import TypingTicker
 from investment_advice import generate_investment_recommendations, get_risk_level_str
-from user_grouping import prepare_knn_and_aggregated_data, find_relevant_goal_comparisons
+from market_data import get_market_data
+from user_grouping import find_relevant_goal_comparisons
+from cohort_stats import get_user_cohort_stats
+from intent_router import FULL_ROUTE, get_router
+from similarity_artifact import keep_model_fresh, load_or_fit_model
 
 
 load_dotenv()
@@ -38,57 +60,99 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("❌ BOT_TOKEN is missing in .env")
 
-nn = None
-X = None
-features = None
 bank_user_id = None
-app = ApplicationBuilder().token(BOT_TOKEN).build()
-
-conversations: dict[int, Conversation] = {}
-
-os.makedirs("media", exist_ok=True)
-
-
-def get_or_create_conversation(user_id: int) -> Conversation:
-    """Get existing conversation or create a new one."""
-    if user_id not in conversations:
-        conversations[user_id] = Conversation(user_id)
-    return conversations[user_id]
-
-
-async def send_typing_action_periodically(chat_id: int, stop_event: asyncio.Event):
-    """Send typing action every 3 seconds until stop_event is set."""
-    while not stop_event.is_set():
-        try:
-            await app.bot.send_chat_action(
-                chat_id=chat_id, action=telegram.constants.ChatAction.TYPING
-            )
-        except Exception as e:
-            logging.error(f"Error sending typing action: {e}")
-
-        # Wait 3 seconds or until stop_event is set
-        try:
-            await asyncio.wait_for(stop_event.wait(), timeout=3.0)
-        except asyncio.TimeoutError:
-            continue
-
+app_builder = (
+    ApplicationBuilder()
+    .token(BOT_TOKEN)
+    .concurrent_updates(get_settings().BOT_CONCURRENT_UPDATES)
+    .rate_limiter(PriorityRateLimiter())
+)
+if get_settings().BOT_MODE == "webhook":
+    # Updates arrive through webhook.py, no long-polling updater
+    app_builder = app_builder.updater(None)
+app = app_builder.build()
+
+spending_detector = SpendingAnomalyDetector()
+typing_indicator = TypingTicker(
+    lambda chat_id: app.bot.send_chat_action(chat_id=chat_id, action=telegram.constants.ChatAction.TYPING)
+)
 
-async def generate_reply(user_id: int, text: str) -> tuple[str, list[str]]:
-    conversation = get_or_create_conversation(user_id)
+QUICK_REPLIES_TEXT = "Можно продолжить так 👇"
+BUSY_REPLY = "Сейчас очень много обращений 🙏 Пожалуйста, напишите мне ещё раз через минуту."
+ALERTS_ON_REPLY = "Буду сообщать о необычных тратах 🔔 Отключить: /alerts off"
+ALERTS_OFF_REPLY = "Уведомления о необычных тратах отключены."
+
+
+@dataclass
+class IncomingMessage:
+    update: Update
+    text: str | Awaitable[str]  # voice transcripts are awaited when the message's turn comes
+
+
+async def get_or_create_conversation(user_id: int) -> Conversation:
+    """Load the conversation from the state store or start a new one."""
+    data = await get_store().load_conversation(user_id)
+    if data is None:
+        return Conversation(user_id)
+    return Conversation.from_dict(data)
+
+
+async def cached_ask_faq(query: str) -> str:
+    """FAQ answers shared by all workers through the state store."""
+    store = get_store()
+    reply = await store.cache_get("faq", query)
+    if reply is None:
+        async with limit("openai"):
+            reply = str(await asyncio.get_running_loop().run_in_executor(None, ask_faq, query))
+        await store.cache_set("faq", query, reply, get_settings().FAQ_CACHE_TTL_SECONDS)
+    return reply
+
+
+async def deliver_spending_alerts():
+    """Forward each flagged transaction to the chats subscribed to its user's alerts (/alerts)."""
+    while True:
+        alert = await spending_detector.queue.get()
+        for chat_id in await get_store().alert_chats(alert.user_id):
+            try:
+                await app.bot.send_message(chat_id=chat_id, text=alert.text())
+            except Exception as e:
+                logging.error(f"Error sending spending alert: {e}")
+
+
+async def generate_reply(
+    user_id: int, text: str
+) -> tuple[str, asyncio.Task | None, list[str] | Awaitable[list[str]]]:
+    """
+    The answer, the task rendering its charts (if any) and the quick replies:
+    the options when they are already known, otherwise a coroutine generating
+    them to run while the answer is sent.
+    """
+    conversation = await get_or_create_conversation(user_id)
 
     conversation.add_user_message(text)
 
-    reply_text, images = await generate_reply_text(conversation)
+    reply_text, images, suggestions = await generate_reply_text(conversation)
     conversation.add_assistant_message(reply_text)
-
-    quick_options = await generate_quick_replies(conversation)
+    await get_store().save_conversation(user_id, conversation.to_dict())
 
     logging.debug(json.dumps(conversation.get_serializable_history()))
-    return reply_text, images, quick_options
+    if suggestions.options is not None:
+        return reply_text, images, suggestions.options
+    return reply_text, images, safe_quick_replies(conversation, suggestions)
 
 
-async def generate_reply_text(conversation: Conversation) -> str:
+async def safe_quick_replies(conversation: Conversation, suggestions: Suggestions) -> list[str]:
+    try:
+        return await complete_quick_replies(conversation, suggestions)
+    except Exception as e:
+        logging.error(f"Quick replies failed: {e}")
+        return []
+
+
+async def generate_reply_text(conversation: Conversation) -> tuple[str, asyncio.Task | None, Suggestions]:
     images = None
+    inline_replies = get_settings().QUICK_REPLIES_MODE == "inline"
+    reply_format = REPLY_FORMAT if inline_replies else openai.NOT_GIVEN
 
     logging.info("=== generate_reply_text START ===")
 
@@ -106,27 +170,47 @@ async def generate_reply_text(conversation: Conversation) -> str:
         for msg in messages
         if isinstance(msg, dict) and "content" in msg and msg["content"] is not None
     ]
+    last_message = next(
+        (msg["content"] for msg in reversed(messages)),
+        "",
+    )
+    previous_reply = next(
+        (msg["content"] for msg in reversed(messages) if msg.get("role") == "assistant"),
+        None,
+    )
 
-    try:
-        loop = asyncio.get_event_loop()
-        last_message = next(
-            (msg["content"] for msg in reversed(messages)),
-            "",
-        )
-
-        faq_query = last_message
-        start = time.time()
-        faq_reply = await loop.run_in_executor(None, ask_faq, faq_query)
-        end = time.time()
-        print(f"It took {start - end} seconds to ask_faq")
-        faq_reply = str(faq_reply)
-        logging.info(f"FAQ reply: {faq_reply}")
-    except Exception as e:
-        logging.error(f"FAQ retrieval error: {e}")
-        raise e
-        faq_reply = "No FAQ information available."
+    # Decide locally which context and tools this message needs
+    route = get_router().route(last_message, previous_reply) if get_settings().INTENT_ROUTER else FULL_ROUTE
+    if route.history_size < len(messages):
+        # Short prompt: the system prompt and the last few messages
+        messages = [{"role": "developer", "content": Conversation.SYSTEM_PROMPT}] + messages[-route.history_size:]
+    route_tools = route.tools or openai.NOT_GIVEN
 
-    messages.append({"role": "developer", "content": "FAQ RAG: " + faq_reply})
+    if route.use_faq:
+        try:
+            faq_query = last_message
+            start = time.time()
+            faq_reply = await cached_ask_faq(faq_query)
+            end = time.time()
+            print(f"It took {start - end} seconds to ask_faq")
+            faq_reply = str(faq_reply)
+            logging.info(f"FAQ reply: {faq_reply}")
+        except Exception as e:
+            logging.error(f"FAQ retrieval error: {e}")
+            raise e
+            faq_reply = "No FAQ information available."
+
+        messages.append({"role": "developer", "content": "FAQ RAG: " + faq_reply})
+    # Current product terms from the catalog take precedence over the FAQ index
+    mentioned_products = get_catalog().mentioned_in(last_message)
+    if mentioned_products:
+        messages.append(
+            {
+                "role": "developer",
+                "content": "Актуальные условия продуктов: "
+                + "; ".join(p.describe() for p in mentioned_products),
+            }
+        )
     logging.info(f"Messages after FAQ append: {messages}")
 
     try:
@@ -134,12 +218,14 @@ async def generate_reply_text(conversation: Conversation) -> str:
         print("FIRST CALL", messages)
         print()
         start = time.time()
-        response = await openai_client.client.responses.create(
-            model="gpt-4o-mini",
-            tools=tools,
-            instructions=instructions,
-            input=messages,
-        )
+        async with limit("openai"):
+            response = await openai_client.client.responses.create(
+                model="gpt-4o-mini",
+                tools=route_tools,
+                instructions=instructions,
+                input=messages,
+                text=reply_format,
+            )
         end = time.time()
         print(
             f"It took {start - end} seconds to do first openai call"
@@ -147,16 +233,18 @@ async def generate_reply_text(conversation: Conversation) -> str:
         logging.info(f"Raw OpenAI response: {response}")
     except Exception as e:
         logging.error(f"OpenAI API call failed: {e}")
-        return "Error generating response."
+        return "Error generating response.", None, Suggestions("chat", [])
 
     messages = conversation.get_history_copy()
     messages += response.output
 
     has_function_call = False
+    called_tools = []
     for item in response.output:
         logging.info(f"Processing response item: {item}")
         if item.type == "function_call":
             has_function_call = True
+            called_tools.append(item.name)
             logging.info(f"Detected function call: {item.name}")
             if item.name == "generate_saving_strategies":
                 loop = asyncio.get_event_loop()
@@ -183,15 +271,16 @@ async def generate_reply_text(conversation: Conversation) -> str:
                 logging.info("Re-generating response after function call output")
             elif item.name == "get_personal_finance_analytics":
                 args = json.loads(item.arguments)
-                analytics = await get_user_financial_summary(bank_user_id)
-                print(analytics)
-                print(analytics["graphs"])
-                images = []
-                if "pie_chart" in analytics["graphs"]:
-                    images.append(analytics["graphs"]["pie_chart"])
-                if "line_chart" in analytics["graphs"]:
-                    images.append(analytics["graphs"]["line_chart"])
-                analytics["graphs"] = None
+                async with limit("db"):
+                    analytics = await get_cached_user_financial_summary(bank_user_id)
+                logging.debug(f"Analytics: {analytics}")
+                if analytics is None:
+                    # No transactions: nothing to summarize or chart
+                    analytics = {}
+                else:
+                    # Charts render in a thread while the answer is generated and sent
+                    images = asyncio.create_task(get_summary_charts(analytics))
+                    analytics = {k: v for k, v in analytics.items() if k not in ("graphs", "chart_data")}
                 messages.append(
                     {
                         "type": "function_call_output",
@@ -211,28 +300,60 @@ async def generate_reply_text(conversation: Conversation) -> str:
                         "output": json.dumps({"recommendations": recommendations}),
                     }
                 )
-            elif item.name == "compare_goals":
+            elif item.name == "forecast_category_budget":
+                async with limit("db"):
+                    forecast = await forecast_category_budget(bank_user_id)
+                messages.append(
+                    {
+                        "type": "function_call_output",
+                        "call_id": item.call_id,
+                        "output": json.dumps({"forecast": forecast}),
+                    }
+                )
+            elif item.name == "what_if_savings":
                 args = json.loads(item.arguments)
-                goals = await find_relevant_goal_comparisons(
-                    bank_user_id, nn, X, features
+                table = what_if_savings(
+                    args["financial_goal"],
+                    args["current_balance"],
+                    args["monthly_savings"],
+                    args.get("monthly_savings_change_percent"),
+                )
+                messages.append(
+                    {
+                        "type": "function_call_output",
+                        "call_id": item.call_id,
+                        "output": json.dumps(table, ensure_ascii=False),
+                    }
                 )
+            elif item.name == "compare_goals":
+                args = json.loads(item.arguments)
+                async with limit("db"):
+                    goals, cohort = await asyncio.gather(
+                        find_relevant_goal_comparisons(bank_user_id),
+                        get_user_cohort_stats(bank_user_id),
+                    )
                 messages.append(
                     {
                         "type": "function_call_output",
                         "call_id": item.call_id,
-                        "output": json.dumps({"top_3_relevant_goals": goals}),
+                        "output": json.dumps(
+                            {"top_3_relevant_goals": goals, "similar_people": cohort},
+                            ensure_ascii=False,
+                        ),
                     }
                 )
 
 
     if has_function_call:
         start = time.time()
-        response = await openai_client.client.responses.create(
-            model="gpt-4o-mini",
-            tools=tools,
-            instructions="Present the result of the function call in the context of the conversation. Derive insights from the data and make calls to action for the user.",
-            input=messages,
-        )
+        async with limit("openai"):
+            response = await openai_client.client.responses.create(
+                model="gpt-4o-mini",
+                tools=route_tools,
+                instructions="Present the result of the function call in the context of the conversation. Derive insights from the data and make calls to action for the user.",
+                input=messages,
+                text=reply_format,
+            )
         end = time.time()
         print(
             f"It took {start - end} seconds to ask chatgpt to present the function call result"
@@ -241,6 +362,10 @@ async def generate_reply_text(conversation: Conversation) -> str:
 
     output_text = response.output_text if hasattr(response, "output_text") else ""
     logging.info(f"Final output_text before markdownify: {output_text}")
+    inline_options = None
+    if inline_replies:
+        output_text, inline_options = parse_structured_reply(output_text)
+    suggestions = await resolve_suggestions(suggestion_intent(is_conversation_start, called_tools), inline_options)
 
     markdown_text = telegramify_markdown.markdownify(
         output_text, max_line_length=None, normalize_whitespace=False
@@ -248,144 +373,226 @@ async def generate_reply_text(conversation: Conversation) -> str:
     logging.info(f"Final markdown_text: {markdown_text}")
     logging.info("=== generate_reply_text END ===")
 
-    return markdown_text, images
+    return markdown_text, images, suggestions
 
 
-async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    stop_event = asyncio.Event()
-    typing_task = asyncio.create_task(
-        send_typing_action_periodically(update.effective_chat.id, stop_event)
-    )
-
+async def rendered_charts(charts: asyncio.Task | None) -> list:
+    if charts is None:
+        return []
     try:
-        reply, _, quick_options = await generate_reply(
-            update.effective_user.id, "Список функционала"
-        )
+        return await charts
+    except Exception as e:
+        logging.error(f"Rendering charts failed: {e}")
+        return []
+
+
+async def send_reply(
+    update: Update, reply: str, charts: asyncio.Task | None, quick_options: list[str] | asyncio.Task
+):
+    """
+    Progressive delivery: the answer as soon as it is generated, with the
+    quick-reply keyboard when the options are already known, then the charts
+    when they are rendered, then a message carrying the keyboard once the
+    fallback options are generated. Otherwise everything at once, charts first
+    and the answer with the keyboard below them.
+    """
+    if get_settings().PROGRESSIVE_REPLIES:
+        if isinstance(quick_options, list):
+            # The keyboard stays up while the charts follow
+            await update.message.reply_text(
+                reply, reply_markup=create_quick_replies(quick_options), parse_mode="MarkdownV2"
+            )
+            images = await rendered_charts(charts)
+            if images:
+                await update.message.reply_media_group([InputMediaPhoto(media=x) for x in images])
+            return
+
+        # The new keyboard comes with a later message; stale options go away now
         await update.message.reply_text(
-            reply,
-            reply_markup=create_quick_replies(quick_options),
-            parse_mode="MarkdownV2",
+            reply, reply_markup=create_quick_replies([]), parse_mode="MarkdownV2"
         )
-    finally:
-        stop_event.set()
-        await typing_task
+        images = await rendered_charts(charts)
+        if images:
+            await update.message.reply_media_group([InputMediaPhoto(media=x) for x in images])
+        options = await quick_options
+        if options:
+            await update.message.reply_text(QUICK_REPLIES_TEXT, reply_markup=create_quick_replies(options))
+        return
+
+    options = quick_options if isinstance(quick_options, list) else await quick_options
+    images = await rendered_charts(charts)
+    if images:
+        # A media group cannot carry a reply keyboard, so the answer follows it
+        await update.message.reply_media_group([InputMediaPhoto(media=x) for x in images])
+    await update.message.reply_text(
+        reply,
+        reply_markup=create_quick_replies(options),
+        parse_mode="MarkdownV2",
+    )
 
 
-async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    stop_event = asyncio.Event()
-    typing_task = asyncio.create_task(
-        send_typing_action_periodically(update.effective_chat.id, stop_event)
-    )
+async def answer_messages(chat_id: int, messages: list[IncomingMessage]):
+    """Answer the messages a chat sent since its last reply, in one reply to the latest."""
+    async with typing_indicator.typing(chat_id):
+        texts = []
+        for message in messages:
+            try:
+                text = message.text if isinstance(message.text, str) else await message.text
+            except Exception as e:
+                logging.error(f"Could not read message: {e}")
+                continue
+            if text:
+                texts.append(text)
+        if not texts:
+            return
 
-    try:
-        reply, images, quick_options = await generate_reply(
-            update.effective_user.id, update.message.text
-        )
-        if images:
-            await update.message.reply_media_group(
-                [InputMediaPhoto(media=x) for x in images],
-                caption=reply,
-                parse_mode="MarkdownV2",
-            )
-        else:
-            await update.message.reply_text(
-                reply,
-                reply_markup=create_quick_replies(quick_options),
-                parse_mode="MarkdownV2",
-            )
-    finally:
-        stop_event.set()
-        await typing_task
+        update = messages[-1].update
+        reply, charts, quick_replies = await generate_reply(update.effective_user.id, "\n".join(texts))
 
+    # Suggestions still missing are generated while the answer is being sent
+    quick_options = quick_replies if isinstance(quick_replies, list) else asyncio.create_task(quick_replies)
+    await send_reply(update, reply, charts, quick_options)
 
-async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    stop_event = asyncio.Event()
-    typing_task = asyncio.create_task(
-        send_typing_action_periodically(update.effective_chat.id, stop_event)
-    )
 
-    try:
-        voice = update.message.voice
-        if not voice:
-            return
+chat_scheduler = ChatScheduler(answer_messages)
+subscribed_alert_chats: set[int] = set()  # written to the store by this process
 
-        # Download voice message
-        file = await context.bot.get_file(voice.file_id)
-        ogg_path = f"./media/voice_{voice.file_unique_id}.ogg"
-        await file.download_to_drive(ogg_path)
 
-        if not os.path.exists(ogg_path):
-            print("[ERROR] Downloaded file does not exist!")
-            return
+async def enqueue_message(update: Update, text: str | Awaitable[str]) -> bool:
+    """Queue a message behind the chat's earlier ones, or answer at once that the bot is busy."""
+    if chat_scheduler.submit(update.effective_chat.id, IncomingMessage(update, text)):
+        return True
+    await update.message.reply_text(BUSY_REPLY)
+    return False
 
-        # Convert OGG to WAV (Whisper can handle OGG too, but WAV is safer)
-        wav_path = f"./media/voice_{voice.file_unique_id}.wav"
-        AudioSegment.from_ogg(ogg_path).export(wav_path, format="wav")
 
-        if not os.path.exists(wav_path):
-            print("[ERROR] WAV file was not created!")
-            return
+async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await enqueue_message(update, "Список функционала")
 
-        wav_size = os.path.getsize(wav_path)
-        print(f"[INFO] WAV file size: {wav_size} bytes")
-        if wav_size == 0:
-            print("[ERROR] WAV file is empty!")
-            return
 
-        # Transcribe with Whisper
-        audio_file = open(wav_path, "rb")
+async def alerts_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/alerts subscribes the chat to spending alerts of the account it is served from, /alerts off stops them."""
+    store = get_store()
+    chat_id = update.effective_chat.id
+    if context.args and context.args[0].lower() == "off":
+        subscribed_alert_chats.discard(chat_id)
+        await store.remove_alert_chat(bank_user_id, chat_id)
+        await update.message.reply_text(ALERTS_OFF_REPLY)
+    else:
+        # A chat is always served by the same worker, so this process knows its subscriptions
+        if chat_id not in subscribed_alert_chats:
+            await store.add_alert_chat(bank_user_id, chat_id)
+            subscribed_alert_chats.add(chat_id)
+        await update.message.reply_text(ALERTS_ON_REPLY)
 
-        transcript = openai.audio.transcriptions.create(
-            model="whisper-1", file=audio_file
-        )
-        logging.info("Voice transcript:", transcript.text)
 
-        reply, images, quick_options = await generate_reply(
-            update.effective_user.id, transcript.text
-        )
-        if images:
-            await update.message.reply_media_group(
-                [InputMediaPhoto(media=x) for x in images],
-                caption=reply,
-                parse_mode="MarkdownV2",
-            )
-        else:
-            await update.message.reply_text(
-                reply,
-                reply_markup=create_quick_replies(quick_options),
-                parse_mode="MarkdownV2",
-            )
-    except Exception as e:
-        raise e
-    finally:
-        stop_event.set()
-        await typing_task
+async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await enqueue_message(update, update.message.text)
 
 
-async def main():
+async def transcribe_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    voice = update.message.voice
+    # Download into memory and transcribe without blocking the event loop
+    audio = await download_voice(context.bot, voice)
+    if not audio:
+        logging.error("Downloaded voice message is empty")
+        return ""
+    on_partial = None
+    if get_settings().VOICE_PARTIAL_TRANSCRIPTS:
+        partial_message = None
+
+        async def on_partial(text_so_far: str):
+            nonlocal partial_message
+            preview = f"🎙 {text_so_far}…"
+            if partial_message is None:
+                partial_message = await update.message.reply_text(preview)
+            else:
+                await partial_message.edit_text(preview)
+
+    transcript = await transcribe_voice(audio, voice.duration, on_partial)
+    logging.info(f"Voice transcript: {transcript}")
+    return transcript
+
+
+async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.message.voice:
+        return
+    # Transcription starts right away; the transcript joins the chat's queue in arrival order
+    transcript = asyncio.create_task(transcribe_message(update, context))
+    if not await enqueue_message(update, transcript):
+        transcript.cancel()
+
+
+async def setup(primary: bool = True):
     global bank_user_id
-    global nn
-    global X
-    global features
 
     async with engine.connect() as conn:
         result = await conn.execute(text("SELECT id FROM users OFFSET 51 LIMIT 1"))
         bank_user_id = result.scalar()
-    nn, X, features = await prepare_knn_and_aggregated_data()
+    await load_or_fit_model(publish=primary)
+    if get_settings().INTENT_ROUTER:
+        get_router()  # trained here rather than on the first message
     logging.basicConfig(level=logging.INFO)
     app.add_handler(CommandHandler("start", start_handler))
+    app.add_handler(CommandHandler("alerts", alerts_handler))
     app.add_handler(MessageHandler(filters.VOICE, voice_handler))
     app.add_handler(MessageHandler(filters.TEXT, message_handler))
+
+
+def start_background_tasks(primary: bool = True) -> list[asyncio.Task]:
+    """
+    Per-process refreshers. Only the primary process rebuilds the similarity
+    artifact and fetches market data (the others reload what it publishes),
+    and detects and delivers alerts.
+    """
+    tasks = [
+        asyncio.create_task(keep_model_fresh(publish=primary)),
+        asyncio.create_task(get_market_data().run(fetch=primary)),
+    ]
+    if primary:
+        tasks += [
+            asyncio.create_task(spending_detector.run()),
+            asyncio.create_task(deliver_spending_alerts()),
+        ]
+    return tasks
+
+
+async def run_worker(index: int, updates: AsyncIterator[dict]):
+    """Worker process of runtime.py: handles the updates of its shard of chats."""
+    await setup(primary=index == 0)
+    await app.initialize()
+    await app.start()
+    background_tasks = start_background_tasks(primary=index == 0)
+    try:
+        async for data in updates:
+            await app.update_queue.put(Update.de_json(data, app.bot))
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await app.stop()
+        await app.shutdown()
+
+
+async def main():
+    await setup()
     print("🚀 Bot is starting...")
     await app.initialize()
     await app.start()
-    await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    webhook_runner = None
+    if get_settings().BOT_MODE == "webhook":
+        webhook_runner = await start_webhook(app)
+    else:
+        await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    background_tasks = start_background_tasks()
 
     # Keep running until interrupted
     await asyncio.Event().wait()
 
     # Cleanup
-    await app.updater.stop()
+    if webhook_runner is not None:
+        await webhook_runner.cleanup()
+    else:
+        await app.updater.stop()
     await app.stop()
     await app.shutdown()
 
@@ -0,0 +1,264 @@
+"""
+Market data for investment recommendations.
+
+MarketDataService keeps the recent daily closes of every ticker it has been
+asked about in a shared in-memory cache. Missing or stale tickers are
+fetched in one batched provider call off the event loop; concurrent
+requests for the same tickers wait for that call instead of repeating it.
+During US market hours a background task refreshes all tracked tickers
+every REFRESH_SECONDS, so requests normally never wait on the network.
+The last known quotes are persisted to MARKET_QUOTES_PATH and loaded at
+startup; if the provider fails, stale quotes are served rather than none.
+With several worker processes only one runs the refresher against the
+provider; the others reload the quotes it persists.
+
+The trending list for the high-risk tier is ranked from the same cached
+history (month growth over TRENDING_UNIVERSE) by the background task and
+served from memory with the time it was computed.
+
+Providers are pluggable: "yfinance" (default) or "fixture", which reads
+closes from a local JSON file ({"AAPL": [189.1, 190.4, ...], ...}) for
+tests and offline runs.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, time as dt_time
+from functools import lru_cache
+from typing import Protocol
+from zoneinfo import ZoneInfo
+from config import get_settings
+from metrics import metrics
+from scheduler import limit
+
+HISTORY_PERIOD = "1mo"
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = dt_time(9, 30)
+MARKET_CLOSE = dt_time(16, 0)
+REFRESH_SECONDS = 5 * 60
+OPEN_TTL_SECONDS = 15 * 60  # quotes move; refetch on demand if the refresher fell behind
+CLOSED_TTL_SECONDS = 12 * 60 * 60  # closes do not change until the next session
+TRENDING_COUNT = 5
+# Liquid US names the trending list is ranked from
+TRENDING_UNIVERSE = [
+    "AAPL", "MSFT", "GOOGL", "AMZN", "META", "NVDA", "TSLA", "AMD", "AVGO", "NFLX",
+    "PLTR", "SMCI", "AI", "QBTS",
+]
+FALLBACK_TRENDING = ["QBTS", "SMCI", "AI", "NVDA", "PLTR"]
+
+
+@dataclass(frozen=True)
+class Quote:
+    ticker: str
+    closes: tuple[float, ...]  # daily closes over HISTORY_PERIOD, oldest first
+    fetched_at: float
+
+    @property
+    def current_price(self) -> float:
+        return round(self.closes[-1], 2)
+
+    @property
+    def month_growth_percent(self) -> float:
+        first, last = self.closes[0], self.closes[-1]
+        return round((last - first) / first * 100, 2) if first else 0.0
+
+    def age_seconds(self) -> float:
+        return time.time() - self.fetched_at
+
+
+@dataclass(frozen=True)
+class Trending:
+    tickers: list[str]  # best month growth first
+    computed_at: float
+
+
+def rank_trending(quotes: dict[str, Quote], count: int = TRENDING_COUNT) -> list[str]:
+    ranked = sorted(quotes.values(), key=lambda q: q.month_growth_percent, reverse=True)
+    return [q.ticker for q in ranked[:count]]
+
+
+class MarketDataProvider(Protocol):
+    def history(self, tickers: list[str], period: str) -> dict[str, list[float]]:
+        """Daily closes per ticker, oldest first; unknown tickers are left out. Blocking."""
+        ...
+
+
+class YFinanceProvider:
+    def history(self, tickers: list[str], period: str) -> dict[str, list[float]]:
+        import yfinance as yf
+
+        frame = yf.download(
+            tickers, period=period, interval="1d", auto_adjust=True,
+            group_by="column", threads=True, progress=False,
+        )
+        if frame is None or frame.empty:
+            return {}
+        closes = frame["Close"]
+        if not hasattr(closes, "columns"):  # single ticker on older yfinance
+            closes = closes.to_frame(tickers[0])
+        result = {}
+        for ticker in tickers:
+            if ticker in closes.columns:
+                series = closes[ticker].dropna()
+                if not series.empty:
+                    result[ticker] = [float(x) for x in series]
+        return result
+
+
+class FixtureProvider:
+    def __init__(self, path: str):
+        self.path = path
+
+    def history(self, tickers: list[str], period: str) -> dict[str, list[float]]:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        return {t: [float(x) for x in data[t]] for t in tickers if data.get(t)}
+
+
+def market_is_open(now: datetime | None = None) -> bool:
+    now = (now or datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+class MarketDataService:
+    def __init__(self, provider: MarketDataProvider, persist_path: str | None = None):
+        self.provider = provider
+        self.persist_path = persist_path
+        self.quotes: dict[str, Quote] = {}
+        self.unknown: dict[str, float] = {}  # ticker -> when the provider last had no data for it
+        self.trending: Trending | None = None
+        self._lock = asyncio.Lock()
+
+    def ttl_seconds(self) -> float:
+        return OPEN_TTL_SECONDS if market_is_open() else CLOSED_TTL_SECONDS
+
+    def _stale(self, tickers: list[str], ttl: float) -> list[str]:
+        now = time.time()
+        return [
+            t for t in tickers
+            if (t not in self.quotes or self.quotes[t].age_seconds() >= ttl)
+            and now - self.unknown.get(t, 0) >= ttl
+        ]
+
+    async def get_quotes(self, tickers: list[str]) -> dict[str, Quote]:
+        """Quotes of the given tickers; stale or missing ones are fetched in one batch."""
+        ttl = self.ttl_seconds()
+        stale = self._stale(tickers, ttl)
+        metrics.inc("market_data.hits", len(tickers) - len(stale))
+        if stale:
+            metrics.inc("market_data.misses", len(stale))
+            async with self._lock:
+                # Another request may have fetched them while we waited
+                stale = self._stale(stale, ttl)
+                if stale:
+                    await self._fetch(stale)
+        return {t: self.quotes[t] for t in tickers if t in self.quotes}
+
+    async def _fetch(self, tickers: list[str]):
+        start = time.perf_counter()
+        try:
+            async with limit("yfinance"):
+                history = await asyncio.to_thread(self.provider.history, tickers, HISTORY_PERIOD)
+        except Exception as e:
+            metrics.inc("market_data.fetch_errors")
+            logging.error(f"Market data fetch failed for {tickers}: {e}")
+            return
+        metrics.observe("market_data.fetch", time.perf_counter() - start)
+
+        now = time.time()
+        for ticker, closes in history.items():
+            if closes:
+                self.quotes[ticker] = Quote(ticker, tuple(closes), now)
+        missing = set(tickers) - history.keys()
+        for ticker in missing:
+            self.unknown[ticker] = now
+        if missing:
+            logging.warning(f"No market data for {sorted(missing)}")
+        if history and self.persist_path:
+            await asyncio.to_thread(self.save, self.persist_path)
+
+    async def refresh(self):
+        """Refetch every tracked ticker in one batch."""
+        if self.quotes:
+            async with self._lock:
+                await self._fetch(sorted(self.quotes))
+
+    def rank_trending(self):
+        quotes = {t: self.quotes[t] for t in TRENDING_UNIVERSE if t in self.quotes}
+        if quotes:
+            self.trending = Trending(rank_trending(quotes), time.time())
+
+    def trending_tickers(self) -> list[str]:
+        """Latest ranked trending list; never waits on the network."""
+        return self.trending.tickers if self.trending else list(FALLBACK_TRENDING)
+
+    async def update_trending(self):
+        await self.get_quotes(TRENDING_UNIVERSE)
+        self.rank_trending()
+
+    async def run(self, interval: float = REFRESH_SECONDS, fetch: bool = True):
+        """
+        Background task: keep tracked quotes fresh while the market is open
+        and re-rank the trending list from them. With fetch=False the quotes
+        are reloaded from persist_path, where the fetching process saves them.
+        """
+        fetch = fetch or not self.persist_path
+        while True:
+            try:
+                if fetch:
+                    if market_is_open():
+                        await self.refresh()
+                    await self.update_trending()
+                else:
+                    await asyncio.to_thread(self.load, self.persist_path)
+                    self.rank_trending()
+            except Exception as e:
+                logging.error(f"Market data refresh failed: {e}")
+            metrics.set_gauge("market_data.tickers", len(self.quotes))
+            if self.trending:
+                metrics.set_gauge("market_data.trending_age_seconds", time.time() - self.trending.computed_at)
+            await asyncio.sleep(interval)
+
+    def save(self, path: str):
+        data = {t: {"closes": list(q.closes), "fetched_at": q.fetched_at} for t, q in self.quotes.items()}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"  # several processes may save at once
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, path: str):
+        """Quotes saved by a previous run or another process, where newer; they keep their fetch time."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logging.error(f"Could not load persisted quotes from {path}: {e}")
+            return
+        for ticker, entry in data.items():
+            known = self.quotes.get(ticker)
+            if entry.get("closes") and (known is None or entry["fetched_at"] > known.fetched_at):
+                self.quotes[ticker] = Quote(ticker, tuple(entry["closes"]), entry["fetched_at"])
+
+
+@lru_cache
+def get_market_data() -> MarketDataService:
+    """Process-wide service configured from settings, with persisted quotes loaded."""
+    settings = get_settings()
+    if settings.MARKET_DATA_PROVIDER == "fixture":
+        provider = FixtureProvider(settings.MARKET_DATA_FIXTURE)
+    elif settings.MARKET_DATA_PROVIDER == "yfinance":
+        provider = YFinanceProvider()
+    else:
+        raise ValueError(f"Unknown MARKET_DATA_PROVIDER: {settings.MARKET_DATA_PROVIDER}")
+
+    service = MarketDataService(provider, settings.MARKET_QUOTES_PATH or None)
+    if service.persist_path:
+        service.load(service.persist_path)
+        service.rank_trending()
+    return service
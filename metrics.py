@@ -0,0 +1,59 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """In-process counters, gauges and timings, read back with snapshot()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._gauges: dict[str, float] = {}
+        self._timings: dict[str, list[float]] = {}  # name -> [count, total, max]
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        """Return a JSON-serializable copy of all metrics."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": {
+                    name: {
+                        "count": count,
+                        "avg_ms": round(total / count * 1000, 3) if count else 0.0,
+                        "max_ms": round(peak * 1000, 3),
+                    }
+                    for name, (count, total, peak) in self._timings.items()
+                },
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,171 @@
+"""
+Bank product catalog shared by saving strategies, investment advice and FAQ.
+
+Products are read from PRODUCT_CATALOG_PATH (faq_rag/data/ru/products.json,
+the same file the FAQ index is built from) and normalized: amounts to
+min/max tenge, terms to months whether the file gives *_term_months or
+*_term_days, missing bounds to 0 / infinity. get_catalog() re-reads the file
+when its mtime changes (checked at most every RELOAD_CHECK_SECONDS), so
+edits go live without a restart; a broken file keeps the previous catalog.
+
+Eligibility is answered by two interval indexes, on amount and on term:
+the endpoints of all product ranges split the axis into elementary
+segments, each storing the products covering it, so a lookup is a binary
+search plus a set intersection instead of a scan over every product.
+"""
+import bisect
+import json
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from config import get_settings
+
+DAYS_PER_MONTH = 30
+RELOAD_CHECK_SECONDS = 5.0
+DEPOSIT_TYPE = "Депозитный"
+
+
+@dataclass(frozen=True)
+class Product:
+    name: str
+    product_type: str
+    min_amount: float
+    max_amount: float
+    min_term_months: float
+    max_term_months: float
+    expected_yield_percent: float | None
+    attributes: dict = field(compare=False, hash=False)  # the raw entry from the file
+
+    @property
+    def is_deposit(self) -> bool:
+        return self.product_type == DEPOSIT_TYPE
+
+    def describe(self) -> str:
+        parts = [f"{self.name} ({self.product_type})"]
+        if self.expected_yield_percent is not None:
+            parts.append(f"доходность {self.expected_yield_percent:g}% годовых")
+        if self.min_amount > 0 or math.isfinite(self.max_amount):
+            parts.append(f"сумма {_range(self.min_amount, self.max_amount)} ₸")
+        if self.min_term_months > 0 or math.isfinite(self.max_term_months):
+            parts.append(f"срок {_range(self.min_term_months, self.max_term_months)} мес.")
+        return ", ".join(parts)
+
+
+def _range(low: float, high: float) -> str:
+    if not math.isfinite(high):
+        return f"от {low:,.0f}".replace(",", " ")
+    if low <= 0:
+        return f"до {high:,.0f}".replace(",", " ")
+    return f"{low:,.0f}–{high:,.0f}".replace(",", " ")
+
+
+def _term_months(entry: dict, bound: str) -> float | None:
+    """`bound` is "min" or "max"; days are converted to months."""
+    months = entry.get(f"{bound}_term_months")
+    if months is not None:
+        return float(months)
+    days = entry.get(f"{bound}_term_days")
+    if days is not None:
+        return float(days) / DAYS_PER_MONTH
+    return None
+
+
+def normalize_product(entry: dict) -> Product:
+    min_term = _term_months(entry, "min")
+    max_term = _term_months(entry, "max")
+    yield_percent = entry.get("expected_yield_percent")
+    return Product(
+        name=entry["product_name"],
+        product_type=entry.get("product_type", ""),
+        min_amount=float(entry.get("min_amount_tenge") or 0),
+        max_amount=float(entry["max_amount_tenge"]) if entry.get("max_amount_tenge") is not None else math.inf,
+        min_term_months=min_term if min_term is not None else 0.0,
+        max_term_months=max_term if max_term is not None else math.inf,
+        expected_yield_percent=float(yield_percent) if yield_percent is not None else None,
+        attributes=entry,
+    )
+
+
+class IntervalIndex:
+    """Stabbing queries over closed intervals [low, high]: which ones contain x."""
+
+    def __init__(self, intervals: list[tuple[float, float, int]]):
+        self.points = sorted({p for low, high, _ in intervals for p in (low, high)})
+        # at[i]: intervals containing points[i]; between[i]: containing (points[i], points[i + 1])
+        self.at = [frozenset(k for low, high, k in intervals if low <= p <= high) for p in self.points]
+        self.between = [
+            frozenset(k for low, high, k in intervals if low <= a and b <= high)
+            for a, b in zip(self.points, self.points[1:])
+        ]
+
+    def stab(self, x: float) -> frozenset[int]:
+        i = bisect.bisect_left(self.points, x)
+        if i < len(self.points) and self.points[i] == x:
+            return self.at[i]
+        if 0 < i < len(self.points):
+            return self.between[i - 1]
+        return frozenset()
+
+
+class ProductCatalog:
+    def __init__(self, products: list[Product], mtime: float | None = None):
+        self.products = products
+        self.mtime = mtime
+        self.by_name = {p.name: p for p in products}
+        self.amount_index = IntervalIndex([(p.min_amount, p.max_amount, i) for i, p in enumerate(products)])
+        self.term_index = IntervalIndex([(p.min_term_months, p.max_term_months, i) for i, p in enumerate(products)])
+
+    @classmethod
+    def load(cls, path: str) -> "ProductCatalog":
+        mtime = os.stat(path).st_mtime
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        return cls([normalize_product(e) for e in entries], mtime)
+
+    def eligible(
+        self, amount: float | None = None, term_months: float | None = None, product_type: str | None = None
+    ) -> list[Product]:
+        """Products whose amount and term ranges contain the given values, in file order."""
+        indices = set(range(len(self.products)))
+        if amount is not None:
+            indices &= self.amount_index.stab(amount)
+        if term_months is not None:
+            indices &= self.term_index.stab(term_months)
+        products = [self.products[i] for i in sorted(indices)]
+        if product_type is not None:
+            products = [p for p in products if p.product_type == product_type]
+        return products
+
+    def deposits(self) -> list[Product]:
+        return [p for p in self.products if p.is_deposit]
+
+    def mentioned_in(self, text: str) -> list[Product]:
+        """Products named in a user message, for grounding FAQ answers in current terms."""
+        text = text.casefold()
+        return [p for p in self.products if p.name.casefold() in text]
+
+
+_catalog: ProductCatalog | None = None
+_checked_at = 0.0
+
+
+def get_catalog() -> ProductCatalog:
+    """Current catalog, reloaded when the file has changed."""
+    global _catalog, _checked_at
+    now = time.monotonic()
+    if _catalog is not None and now - _checked_at < RELOAD_CHECK_SECONDS:
+        return _catalog
+    _checked_at = now
+
+    path = get_settings().PRODUCT_CATALOG_PATH
+    try:
+        if _catalog is None or os.stat(path).st_mtime != _catalog.mtime:
+            _catalog = ProductCatalog.load(path)
+            logging.info(f"Loaded {len(_catalog.products)} products from {path}")
+    except Exception as e:
+        if _catalog is None:
+            raise
+        logging.error(f"Could not reload product catalog from {path}, keeping the previous one: {e}")
+    return _catalog
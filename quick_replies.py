@@ -6,9 +6,122 @@ from faq_rag.faq_rag import ask_faq, async_check_faq_has
 from conversation import Conversation
 import openai
 import openai_client
+from dataclasses import dataclass
+from scheduler import limit
+from state_store import get_store
+from config import get_settings
+from metrics import metrics
 from llm_tools import tools, get_tools_summary
 from telegram import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 
+# Structured output of the main response: the answer and the suggestions in one call
+REPLY_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "reply",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "answer": {
+                    "type": "string",
+                    "description": "The reply to the user, in Markdown.",
+                },
+                "quick_replies": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": (
+                        "1-8 things the user could reply with next, as contextual buttons. "
+                        "1-5 words per option. Only letters. No punctuation or numeration. "
+                        "Empty when asking the user for data."
+                    ),
+                },
+            },
+            "required": ["answer", "quick_replies"],
+            "additionalProperties": False,
+        },
+    }
+}
+
+# Fixed suggestions for common states, no model involved
+TEMPLATES = {
+    "greeting": [
+        "Анализ моих расходов",
+        "Стратегии накопления",
+        "Инвестиционные советы",
+        "Прогноз бюджета",
+        "Сравнить мои цели",
+    ],
+    "tool:get_personal_finance_analytics": [
+        "Как сократить расходы",
+        "Прогноз бюджета",
+        "Стратегии накопления",
+        "Сравнить мои цели",
+    ],
+}
+# Suggestions of states without a template are reused from recent turns in the same state
+CACHE_NAMESPACE = "quick_replies"
+
+
+@dataclass
+class Suggestions:
+    intent: str  # "greeting", "tool:<name>" or "chat"
+    options: list[str] | None  # None: not known yet, ask the model separately
+
+
+def suggestion_intent(is_greeting: bool, called_tools: list[str]) -> str:
+    if is_greeting:
+        return "greeting"
+    if called_tools:
+        return f"tool:{called_tools[-1]}"
+    return "chat"
+
+
+def clean_replies(replies: list[str]) -> list[str]:
+    replies = [x.capitalize().replace(".", "").replace("- ", "") for x in replies]
+    return [x for x in replies if x]
+
+
+def parse_structured_reply(output_text: str) -> tuple[str, list[str] | None]:
+    """(answer, quick replies) of a REPLY_FORMAT response; plain text gives no quick replies."""
+    try:
+        data = json.loads(output_text)
+        return data["answer"], clean_replies(data["quick_replies"])
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return output_text, None
+
+
+async def resolve_suggestions(intent: str, inline: list[str] | None) -> Suggestions:
+    """Template, else the model's inline suggestions, else a cached set for the intent."""
+    if intent in TEMPLATES:
+        metrics.inc("quick_replies.template")
+        return Suggestions(intent, TEMPLATES[intent])
+    store = get_store()
+    if inline is not None:
+        if inline and intent != "chat":
+            await store.cache_set(CACHE_NAMESPACE, intent, json.dumps(inline, ensure_ascii=False),
+                                  get_settings().QUICK_REPLIES_CACHE_TTL_SECONDS)
+        metrics.inc("quick_replies.inline")
+        return Suggestions(intent, inline)
+    if intent != "chat":
+        cached = await store.cache_get(CACHE_NAMESPACE, intent)
+        if cached is not None:
+            metrics.inc("quick_replies.cached")
+            return Suggestions(intent, json.loads(cached))
+    return Suggestions(intent, None)
+
+
+async def complete_quick_replies(conversation: Conversation, suggestions: Suggestions) -> list[str]:
+    """The suggestions, falling back to the separate quick replies call when there are none yet."""
+    if suggestions.options is not None:
+        return suggestions.options
+    metrics.inc("quick_replies.fallback_calls")
+    options = await generate_quick_replies(conversation)
+    if options and suggestions.intent != "chat":
+        await get_store().cache_set(CACHE_NAMESPACE, suggestions.intent, json.dumps(options, ensure_ascii=False),
+                                    get_settings().QUICK_REPLIES_CACHE_TTL_SECONDS)
+    return options
+
 
 def create_quick_replies(options: list[str]) -> ReplyKeyboardMarkup:
     """Create reply keyboard markup from quick reply options."""
@@ -50,7 +163,8 @@ async def generate_quick_replies(conversation: Conversation) -> list[str]:
             faq_input = "Функционал"
 
         start = time.time()
-        faq_reply = await loop.run_in_executor(None, ask_faq, faq_input)
+        async with limit("openai"):
+            faq_reply = await loop.run_in_executor(None, ask_faq, faq_input)
         end = time.time()
         print(f"It took {start - end} seconds to ask faq in quick replies")
         faq_reply = str(faq_reply)
@@ -65,33 +179,34 @@ async def generate_quick_replies(conversation: Conversation) -> list[str]:
 
     # Create async OpenAI client
     start = time.time()
-    response = await openai_client.client.responses.create(
-        model="gpt-4o-mini",
-        tools=[
-            {
-                "type": "function",
-                "strict": True,
-                "name": "provide_replies",
-                "description": "Provide replies here.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "replies": {
-                            "type": "array",
-                            "items": {
-                                "type": "string",
+    async with limit("openai"):
+        response = await openai_client.client.responses.create(
+            model="gpt-4o-mini",
+            tools=[
+                {
+                    "type": "function",
+                    "strict": True,
+                    "name": "provide_replies",
+                    "description": "Provide replies here.",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "replies": {
+                                "type": "array",
+                                "items": {
+                                    "type": "string",
+                                },
+                                "description": "List of reply messages",
                             },
-                            "description": "List of reply messages",
                         },
+                        "required": ["replies"],
+                        "additionalProperties": False,
                     },
-                    "required": ["replies"],
-                    "additionalProperties": False,
-                },
-            }
-        ],
-        instructions="Your next reply is not visible to the user. Suggest 1-8 things for the user to reply with. Add relevant contextual buttons. 1-5 words per option. Only letters. No punctuation or numeration. End your response with a JSON array of strings.",
-        input=messages,
-    )
+                }
+            ],
+            instructions="Your next reply is not visible to the user. Suggest 1-8 things for the user to reply with. Add relevant contextual buttons. 1-5 words per option. Only letters. No punctuation or numeration. End your response with a JSON array of strings.",
+            input=messages,
+        )
     end = time.time()
     print(f"It took {start - end} seconds to generate replies")
 
@@ -101,7 +216,7 @@ async def generate_quick_replies(conversation: Conversation) -> list[str]:
             if item.name == "provide_replies":
                 replies = json.loads(item.arguments)["replies"]
 
-    replies = [x.capitalize().replace(".", "").replace("- ", "") for x in replies]
+    replies = clean_replies(replies)
 
     # start = time.time()
     # related_replies = await asyncio.gather(*(async_check_faq_has(x) for x in replies))
@@ -0,0 +1,231 @@
+"""
+Outgoing Telegram rate limiting for every request the bot makes.
+
+PriorityRateLimiter plugs into ApplicationBuilder.rate_limiter, so replies,
+media groups, edits, chat actions and spending alerts all pass through it
+without changes at the call sites. Requests addressed to a chat wait for a
+token from a global bucket and from the chat's own bucket
+(TELEGRAM_CHAT_RATE per second with bursts of TELEGRAM_CHAT_BURST;
+TELEGRAM_GROUP_RATE_PER_MINUTE for groups). The global bucket lives in this
+process, so it refills at TELEGRAM_GLOBAL_RATE / BOT_WORKERS per second:
+every worker of runtime.py sends with the same bot token. Tokens go to
+waiting requests by priority: replies, then edits, then chat actions; in
+order of arrival within a priority.
+
+Chat actions are best effort: one waiting action per chat is enough, an
+action is dropped when a reply to the same chat is already waiting (the
+reply ends the indicator anyway) or when it waited longer than it would
+have been shown. On RetryAfter, sending pauses for the requested time and
+the request is retried up to TELEGRAM_MAX_RETRIES times (actions are not
+retried). Requests without a chat (getUpdates, getFile, setWebhook...)
+are not limited.
+
+Metrics: timings outbox.wait.<reply|edit|action> (queueing latency) and
+outbox.send, gauge outbox.queue_depth, counters outbox.retry_after,
+outbox.actions_collapsed and outbox.actions_stale.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Callable, Coroutine
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import get_settings
+from metrics import metrics
+
+REPLY, EDIT, ACTION = 0, 1, 2
+PRIORITY_NAMES = {REPLY: "reply", EDIT: "edit", ACTION: "action"}
+# A typing indicator is shown for 5 seconds; an action queued longer than this is pointless
+ACTION_STALE_SECONDS = 3.0
+# Idle (full) chat buckets are dropped once there are more than this many
+MAX_CHAT_BUCKETS = 10_000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def request_priority(endpoint: str) -> int:
+    if endpoint == "sendChatAction":
+        return ACTION
+    if endpoint.startswith("edit"):
+        return EDIT
+    return REPLY
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    chat_id: int | str = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    granted: asyncio.Future = field(compare=False)  # True to send, False to drop
+
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    def __init__(
+        self,
+        global_rate: float | None = None,
+        chat_rate: float | None = None,
+        chat_burst: int | None = None,
+        group_rate_per_minute: float | None = None,
+        max_retries: int | None = None,
+    ):
+        settings = get_settings()
+        self.global_rate = global_rate or settings.TELEGRAM_GLOBAL_RATE / max(1, settings.BOT_WORKERS)
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE
+        self.chat_burst = chat_burst or settings.TELEGRAM_CHAT_BURST
+        self.group_rate = (group_rate_per_minute or settings.TELEGRAM_GROUP_RATE_PER_MINUTE) / 60
+        self.max_retries = max_retries if max_retries is not None else settings.TELEGRAM_MAX_RETRIES
+
+        self.global_bucket = TokenBucket(self.global_rate, self.global_rate)
+        self.chat_buckets: dict[int | str, TokenBucket] = {}
+        self.waiting: list[_Waiter] = []
+        self.paused_until = 0.0
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass  # @channel usernames
+
+        priority = request_priority(endpoint)
+        max_retries = 0 if priority == ACTION else rate_limit_args or self.max_retries
+        for attempt in range(max_retries + 1):
+            if not await self._acquire(chat_id, priority):
+                return True  # dropped chat action; sendChatAction returns True
+            start = time.perf_counter()
+            try:
+                result = await callback(*args, **kwargs)
+                metrics.observe("outbox.send", time.perf_counter() - start)
+                return result
+            except RetryAfter as e:
+                seconds = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+                metrics.inc("outbox.retry_after")
+                logging.warning(f"Telegram flood control on {endpoint}, pausing sends for {seconds}s")
+                if priority == ACTION:
+                    return True
+                if attempt == max_retries:
+                    raise
+
+    async def _acquire(self, chat_id: int | str, priority: int) -> bool:
+        """Wait for this request's turn; False if it should be dropped."""
+        if priority == ACTION and any(w.chat_id == chat_id and not w.granted.done() for w in self.waiting):
+            # A reply or another action to the chat is already waiting
+            metrics.inc("outbox.actions_collapsed")
+            return False
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        now = time.monotonic()
+        waiter = _Waiter(priority, next(self._seq), chat_id, now, asyncio.get_running_loop().create_future())
+        self.waiting.append(waiter)
+        metrics.set_gauge("outbox.queue_depth", len(self.waiting))
+        self._wakeup.set()
+        try:
+            send = await waiter.granted
+        finally:
+            if not waiter.granted.done():
+                waiter.granted.cancel()
+        metrics.observe(f"outbox.wait.{PRIORITY_NAMES[priority]}", time.monotonic() - now)
+        return send
+
+    def _chat_bucket(self, chat_id: int | str, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.is_full(now)}
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _grant(self, now: float) -> float | None:
+        """Hand out the tokens available now; seconds until the next one may be, None if nobody waits."""
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        delay = None
+        still_waiting = []
+        for waiter in sorted(self.waiting):
+            if waiter.granted.done():  # cancelled by its caller
+                continue
+            if waiter.priority == ACTION and now - waiter.enqueued_at > ACTION_STALE_SECONDS:
+                metrics.inc("outbox.actions_stale")
+                waiter.granted.set_result(False)
+                continue
+            global_wait = self.global_bucket.wait_time(now)
+            chat_bucket = self._chat_bucket(waiter.chat_id, now)
+            chat_wait = chat_bucket.wait_time(now)
+            if global_wait > 0 or chat_wait > 0:
+                wait = max(global_wait, chat_wait)
+                delay = wait if delay is None else min(delay, wait)
+                still_waiting.append(waiter)
+                continue
+            self.global_bucket.take(now)
+            chat_bucket.take(now)
+            waiter.granted.set_result(True)
+
+        self.waiting = still_waiting
+        metrics.set_gauge("outbox.queue_depth", len(self.waiting))
+        return delay
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._grant(time.monotonic())
+            if delay is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
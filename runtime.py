@@ -0,0 +1,207 @@
+"""
+Sharded multi-process bot runtime.
+
+    python runtime.py [--workers 4]
+
+A supervisor process receives updates (webhook server with BOT_MODE=webhook,
+long polling otherwise) and routes each one to worker process
+chat_id % workers over a multiprocessing queue. A chat always lands on the
+same worker, so its updates keep their order, while different chats use
+all cores. Workers run main.run_worker: the usual handlers, with
+conversations and caches in the state store (STATE_STORE=sqlite or
+postgres, so they survive restarts and are visible to every worker; with
+STATE_STORE=memory each process would have its own, so more than one worker
+is refused).
+Background work runs on worker 0 only: it detects and delivers spending
+alerts, rebuilds the similarity artifact and fetches market data; the
+other workers reload the artifact and the quotes it publishes.
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import multiprocessing as mp
+import os
+import queue
+from typing import AsyncIterator
+from config import get_settings
+from metrics import metrics
+
+WORKER_QUEUE_SIZE = 1000
+POLL_TIMEOUT_SECONDS = 30
+DISPATCH_RETRY_SECONDS = 0.05
+STOP_TIMEOUT_SECONDS = 10
+
+# Update fields that carry a message with a chat, then fields that carry a user
+MESSAGE_FIELDS = ["message", "edited_message", "channel_post", "edited_channel_post", "business_message"]
+OTHER_FIELDS = [
+    "callback_query", "inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query",
+    "poll_answer", "my_chat_member", "chat_member", "chat_join_request",
+]
+
+
+def chat_id_of(update: dict) -> int | None:
+    for field in MESSAGE_FIELDS:
+        if field in update:
+            return update[field]["chat"]["id"]
+    for field in OTHER_FIELDS:
+        if field in update:
+            item = update[field]
+            chat = item.get("chat") or (item.get("message") or {}).get("chat")
+            if chat:
+                return chat["id"]
+            user = item.get("from") or item.get("user")
+            if user:
+                return user["id"]
+    return None
+
+
+def shard_of(update: dict, workers: int) -> int:
+    chat_id = chat_id_of(update)
+    key = chat_id if chat_id is not None else update.get("update_id", 0)
+    return key % workers
+
+
+async def iter_queue(q) -> AsyncIterator[dict]:
+    """Items of a multiprocessing queue until the None sentinel."""
+    while True:
+        item = await asyncio.to_thread(q.get)
+        if item is None:
+            return
+        yield item
+
+
+def worker_entry(index: int, q, target: str, target_args: tuple):
+    module, name = target.split(":")
+    run = getattr(importlib.import_module(module), name)
+    asyncio.run(run(index, iter_queue(q), *target_args))
+
+
+class ShardedRuntime:
+    def __init__(
+        self,
+        workers: int,
+        target: str = "main:run_worker",
+        target_args: tuple = (),
+        queue_size: int = WORKER_QUEUE_SIZE,
+    ):
+        """`target` is "module:coroutine", called as coroutine(index, updates, *target_args) in each worker."""
+        context = mp.get_context("spawn")
+        self.queues = [context.Queue(queue_size) for _ in range(workers)]
+        self.processes = [
+            context.Process(target=worker_entry, args=(i, q, target, target_args), name=f"bot-worker-{i}", daemon=True)
+            for i, q in enumerate(self.queues)
+        ]
+
+    @property
+    def workers(self) -> int:
+        return len(self.processes)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def dispatch(self, update: dict) -> int:
+        """Route an update to its worker; raises queue.Full if that worker is backlogged."""
+        index = shard_of(update, self.workers)
+        self.queues[index].put_nowait(update)
+        metrics.inc(f"runtime.worker_{index}.updates")
+        return index
+
+    def alive(self) -> list[bool]:
+        return [p.is_alive() for p in self.processes]
+
+    def queue_depths(self) -> list[int | None]:
+        depths = []
+        for q in self.queues:
+            try:
+                depths.append(q.qsize())
+            except NotImplementedError:  # macOS
+                depths.append(None)
+        return depths
+
+    def stop(self, timeout: float = STOP_TIMEOUT_SECONDS):
+        for q in self.queues:
+            q.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+async def dispatch_with_backpressure(runtime: ShardedRuntime, update: dict):
+    while True:
+        try:
+            runtime.dispatch(update)
+            return
+        except queue.Full:
+            metrics.inc("runtime.backpressure")
+            await asyncio.sleep(DISPATCH_RETRY_SECONDS)
+
+
+async def poll_updates(runtime: ShardedRuntime, bot):
+    from telegram import Update
+
+    await bot.delete_webhook()
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=POLL_TIMEOUT_SECONDS, allowed_updates=Update.ALL_TYPES
+            )
+        except Exception as e:
+            logging.error(f"Polling failed: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            await dispatch_with_backpressure(runtime, update.to_dict())
+            offset = update.update_id + 1
+
+
+async def supervise(workers: int):
+    # Imported here so the routing above can be used without the bot stack (benchmarks)
+    from telegram import Bot
+    from webhook import register_webhook, serve_webhook
+
+    settings = get_settings()
+    if workers > 1 and settings.STATE_STORE == "memory":
+        # Worker 0 delivers every alert, but would only see the subscriptions made on its own chats
+        raise ValueError("STATE_STORE=memory is per process; use sqlite or postgres with more than one worker")
+    # Workers read it to take their share of the global Telegram rate
+    os.environ["BOT_WORKERS"] = str(workers)
+    runtime = ShardedRuntime(workers)
+    runtime.start()
+    logging.info(f"Started {workers} bot workers")
+
+    bot = Bot(settings.BOT_TOKEN)
+    await bot.initialize()
+    try:
+        if settings.BOT_MODE == "webhook":
+
+            async def handle_update(data: dict):
+                runtime.dispatch(data)  # queue.Full -> 503, Telegram redelivers
+
+            def health() -> tuple[bool, dict]:
+                alive = runtime.alive()
+                return all(alive), {"workers": alive, "queue_depths": runtime.queue_depths()}
+
+            runner = await serve_webhook(handle_update, health)
+            await register_webhook(bot)
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await runner.cleanup()
+        else:
+            await poll_updates(runtime, bot)
+    finally:
+        await bot.shutdown()
+        runtime.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the bot as sharded worker processes")
+    parser.add_argument("--workers", type=int, default=get_settings().BOT_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(supervise(args.workers))
@@ -1,53 +1,154 @@
-# Bank services
-services = [
-    {
-        "product_name": "Овернайт",
-        "product_type": "Депозитный",
-        "expected_yield_percent": 12,
-        "max_amount_tenge": 100_000_000,
-        "min_amount_tenge": 1_000_000,
-        "min_term_months": 1,
-        "max_term_months": 12
-    },
-    {
-        "product_name": "Выгодный",
-        "product_type": "Депозитный",
-        "expected_yield_percent": 17,
-        "max_amount_tenge": 100_000_000,
-        "min_amount_tenge": 500_000,
-        "min_term_months": 3,
-        "max_term_months": 12
-    }
-]
+import numpy as np
+from product_catalog import DEPOSIT_TYPE, get_catalog
+
+DEFAULT_MAX_TERM_MONTHS = 1200
+WHAT_IF_CHANGES_PERCENT = [-20, -10, 10, 20, 50]
+# Closed-form results this close to a decision boundary (goal reached or not,
+# cent rounding) are re-checked with the month-by-month simulation, so the
+# engine returns exactly what simulate() would
+_BOUNDARY_TOLERANCE = 1e-11
+
+
+def simulate(financial_goal, current_balance, monthly_savings, annual_rate, max_term_months=DEFAULT_MAX_TERM_MONTHS):
+    """
+    Reference month-by-month simulation: deposit, then monthly interest.
+    Returns (months, balance); the goal is reached iff balance >= financial_goal.
+    """
+    balance = current_balance
+    months = 0
+    while balance < financial_goal and months < max_term_months:
+        balance += monthly_savings
+        # Apply monthly interest (assume annual rate divided by 12)
+        balance += balance * (annual_rate / 12)
+        months += 1
+    return months, balance
+
+
+def project(financial_goal, current_balance, monthly_savings, annual_rate, max_term_months=DEFAULT_MAX_TERM_MONTHS):
+    """
+    Months to goal for a whole grid in one NumPy pass. Arguments broadcast
+    against each other, e.g. goals[:, None, None], monthly[None, :, None],
+    rates[None, None, :].
+
+    With g = 1 + rate/12 the balance after n months is the annuity
+        B_n = g^n * B_0 + m * g * (g^n - 1) / (g - 1)
+    so the first n with B_n >= goal is
+        n = ceil(log((goal + c) / (B_0 + c)) / log(g)),  c = m * g / (g - 1)
+    (n = ceil((goal - B_0) / m) without interest).
+
+    Returns (months, final_balance) arrays; months is -1 where the goal is not
+    reached within max_term_months, like a simulate() that stops at the term.
+    Terms count whole months: simulate() keeps going while months < term, so a
+    fractional term (from *_term_days) allows ceil(term) months.
+    """
+    goal, b0, m, rate, term = np.broadcast_arrays(
+        *(np.asarray(x, dtype=np.float64) for x in
+          (financial_goal, current_balance, monthly_savings, annual_rate, max_term_months))
+    )
+    g = 1 + rate / 12
+    term = np.ceil(term)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        has_interest = rate != 0
+        c = np.where(has_interest, m * g / (g - 1), 0.0)
+        n_interest = np.ceil(np.log((goal + c) / (b0 + c)) / np.log(g))
+        n_flat = np.ceil((goal - b0) / m)
+        n = np.where(has_interest, n_interest, n_flat)
+        n = np.where(b0 >= goal, 0, n)
+        n = np.where(np.isfinite(n) & (n >= 0), n, np.inf)
+        reached = n <= term
+        n = np.where(reached, n, term)
+
+        gn = g ** n
+        final = np.where(has_interest, gn * b0 + c * (gn - 1), b0 + n * m)
+        previous = np.where(has_interest, gn / g * b0 + c * (gn / g - 1), b0 + (n - 1) * m)
+
+    months = np.where(reached, n, -1).astype(np.int64)
+
+    # Cells the closed form cannot decide bit-for-bit go through simulate()
+    scale = np.maximum(np.abs(goal), 1.0)
+    near_goal = (np.abs(final - goal) <= _BOUNDARY_TOLERANCE * scale) | (
+        (n > 0) & (np.abs(previous - goal) <= _BOUNDARY_TOLERANCE * scale)
+    )
+    cents = final * 100
+    near_cent = np.abs(cents - np.floor(cents) - 0.5) <= _BOUNDARY_TOLERANCE * np.maximum(np.abs(cents), 1.0)
+    outside_domain = (m < 0) | (b0 < 0) | ~np.isfinite(final)
+    for index in map(tuple, np.argwhere(near_goal | near_cent | outside_domain)):
+        months_i, balance_i = simulate(goal[index], b0[index], m[index], rate[index], term[index])
+        months[index] = months_i if balance_i >= goal[index] else -1
+        final[index] = balance_i
+    return months, final
+
+
+def _product_arrays(products):
+    rates = np.array([(p.expected_yield_percent or 0) / 100 for p in products], dtype=np.float64)
+    terms = np.array(
+        [p.max_term_months if np.isfinite(p.max_term_months) else DEFAULT_MAX_TERM_MONTHS for p in products],
+        dtype=np.float64,
+    )
+    return rates, terms
+
 
 def generate_saving_strategies(financial_goal, current_balance, monthly_savings):
     strategies = []
+    # Deposits whose amount range admits the current balance
+    products = get_catalog().eligible(amount=current_balance, product_type=DEPOSIT_TYPE)
+    if not products:
+        return strategies
+    rates, terms = _product_arrays(products)
+    months, final = project(financial_goal, current_balance, monthly_savings, rates, terms)
 
-    for service in services:
-        min_amount = service.get("min_amount_tenge", 0)
-        interest_rate = service.get("expected_yield_percent", 0) / 100  # convert to decimal
-
-        if current_balance < min_amount:
-            # Skip strategies if current balance is below minimum
+    for i, product in enumerate(products):
+        if months[i] < 0:
             continue
-
-        balance = current_balance
-        months = 0
-
-        # Simulate monthly growth
-        while balance < financial_goal and months < service.get("max_term_months", 1200):
-            balance += monthly_savings
-            # Apply monthly interest (assume annual rate divided by 12)
-            balance += balance * (interest_rate / 12)
-            months += 1
-
-        if balance >= financial_goal:
-            strategies.append({
-                "product_name": service["product_name"],
-                "estimated_months_to_goal": months,
-                "final_amount": round(balance, 2)
-            })
+        strategies.append({
+            "product_name": product.name,
+            "estimated_months_to_goal": int(months[i]),
+            "final_amount": round(float(final[i]), 2)
+        })
 
     # Sort strategies by how fast they reach the goal
     strategies.sort(key=lambda x: x["estimated_months_to_goal"])
     return strategies
+
+
+def what_if_savings(financial_goal, current_balance, monthly_savings, monthly_savings_change_percent=None):
+    """
+    Months to goal for every product at several monthly contribution levels,
+    e.g. "how much faster if I save 20% more?". One projection over the
+    [contribution x product] grid.
+    """
+    changes = sorted({0, *(monthly_savings_change_percent or WHAT_IF_CHANGES_PERCENT)})
+    changes = [p for p in changes if p >= -100]
+    contributions = np.array([monthly_savings * (1 + p / 100) for p in changes], dtype=np.float64)
+    catalog = get_catalog()
+    eligible = catalog.eligible(amount=current_balance, product_type=DEPOSIT_TYPE)
+    rates, terms = _product_arrays(eligible)
+    months, final = project(financial_goal, current_balance, contributions[:, None], rates[None, :], terms[None, :])
+
+    baseline = months[changes.index(0)]
+    scenarios = []
+    for row, change in enumerate(changes):
+        products = []
+        for i, product in enumerate(eligible):
+            reached = months[row, i] >= 0
+            products.append({
+                "product_name": product.name,
+                "estimated_months_to_goal": int(months[row, i]) if reached else None,
+                "final_amount": round(float(final[row, i]), 2) if reached else None,
+                "months_saved_vs_current": (
+                    int(baseline[i] - months[row, i]) if reached and baseline[i] >= 0 else None
+                ),
+            })
+        scenarios.append({
+            "monthly_savings_change_percent": change,
+            "monthly_savings": round(float(contributions[row]), 2),
+            "products": products,
+        })
+
+    return {
+        "financial_goal": financial_goal,
+        "current_balance": current_balance,
+        "ineligible_products": [p.name for p in catalog.deposits() if p not in eligible],
+        "scenarios": scenarios,
+    }
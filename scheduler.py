@@ -0,0 +1,119 @@
+"""
+Admission control for incoming messages and outgoing calls.
+
+ChatScheduler runs the messages of one chat strictly one after another:
+messages that arrive while the chat is busy wait in its queue and are then
+handled together as one batch (coalesced), so a burst of messages gets one
+answer instead of several replies racing over the same conversation.
+Different chats run concurrently. When the total load (chats being served
+plus messages waiting) reaches SCHEDULER_MAX_QUEUE_DEPTH, or one chat has
+SCHEDULER_MAX_PENDING_PER_CHAT messages waiting, submit() refuses the
+message so the caller can answer with a quick "busy" reply right away.
+
+limit(name) bounds concurrent calls to a downstream service across all
+chats of the process (openai, db, yfinance; sizes in config.py) and records
+how long callers waited for a slot.
+
+Metrics: gauges scheduler.queue_depth and scheduler.active_chats, timing
+scheduler.wait (submit to start), counters scheduler.coalesced and
+scheduler.shed; gauges limits.<name>.in_flight and timings limits.<name>.wait.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Generic, TypeVar
+from config import get_settings
+from metrics import metrics
+
+T = TypeVar("T")
+
+
+class ChatScheduler(Generic[T]):
+    def __init__(
+        self,
+        handle: Callable[[int, list[T]], Awaitable[None]],
+        max_queue_depth: int | None = None,
+        max_pending_per_chat: int | None = None,
+    ):
+        """`handle(chat_id, items)` serves a batch of items of one chat, oldest first."""
+        settings = get_settings()
+        self.handle = handle
+        self.max_queue_depth = max_queue_depth or settings.SCHEDULER_MAX_QUEUE_DEPTH
+        self.max_pending_per_chat = max_pending_per_chat or settings.SCHEDULER_MAX_PENDING_PER_CHAT
+        self.pending: dict[int, list[tuple[float, T]]] = {}
+        self.running: dict[int, asyncio.Task] = {}
+        self.waiting = 0
+
+    @property
+    def load(self) -> int:
+        return len(self.running) + self.waiting
+
+    def submit(self, chat_id: int, item: T) -> bool:
+        """Queue an item for its chat; False if it was shed because of load."""
+        queue = self.pending.setdefault(chat_id, [])
+        if self.load >= self.max_queue_depth or len(queue) >= self.max_pending_per_chat:
+            if not queue:
+                del self.pending[chat_id]
+            metrics.inc("scheduler.shed")
+            return False
+        queue.append((time.perf_counter(), item))
+        self.waiting += 1
+        if chat_id not in self.running:
+            self.running[chat_id] = asyncio.create_task(self._serve(chat_id))
+        self._report()
+        return True
+
+    async def _serve(self, chat_id: int):
+        try:
+            while self.pending.get(chat_id):
+                batch = self.pending.pop(chat_id)
+                self.waiting -= len(batch)
+                self._report()
+                now = time.perf_counter()
+                for submitted_at, _ in batch:
+                    metrics.observe("scheduler.wait", now - submitted_at)
+                if len(batch) > 1:
+                    metrics.inc("scheduler.coalesced", len(batch) - 1)
+                try:
+                    await self.handle(chat_id, [item for _, item in batch])
+                except Exception as e:
+                    logging.exception(f"Handling messages of chat {chat_id} failed: {e}")
+        finally:
+            del self.running[chat_id]
+            self._report()
+
+    def _report(self):
+        metrics.set_gauge("scheduler.queue_depth", self.waiting)
+        metrics.set_gauge("scheduler.active_chats", len(self.running))
+
+
+_limits: dict[str, asyncio.Semaphore] = {}
+_in_flight: dict[str, int] = {}
+
+
+def _limit_size(name: str) -> int:
+    settings = get_settings()
+    return {
+        "openai": settings.OPENAI_CONCURRENCY,
+        "db": settings.DB_CONCURRENCY,
+        "yfinance": settings.YFINANCE_CONCURRENCY,
+    }[name]
+
+
+@asynccontextmanager
+async def limit(name: str):
+    """Hold one of the process-wide slots of a downstream service."""
+    if name not in _limits:
+        _limits[name] = asyncio.Semaphore(_limit_size(name))
+        _in_flight[name] = 0
+    start = time.perf_counter()
+    async with _limits[name]:
+        metrics.observe(f"limits.{name}.wait", time.perf_counter() - start)
+        _in_flight[name] += 1
+        metrics.set_gauge(f"limits.{name}.in_flight", _in_flight[name])
+        try:
+            yield
+        finally:
+            _in_flight[name] -= 1
+            metrics.set_gauge(f"limits.{name}.in_flight", _in_flight[name])
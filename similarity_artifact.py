@@ -0,0 +1,229 @@
+"""
+Versioned on-disk artifact of the fitted similarity model.
+
+    python similarity_artifact.py [--keep 3]
+
+Layout under SIMILARITY_ARTIFACT_DIR:
+
+    <version>/user_ids.npy       ascending user ids, row i of X
+    <version>/X_data.npy         scaled, row-normalized CSR matrix as its three arrays
+    <version>/X_indices.npy
+    <version>/X_indptr.npy
+    <version>/scale.npy          StandardScaler(with_mean=False) parameters
+    <version>/var.npy
+    <version>/meta.json          columns, shape, n_samples_seen, fitted_at
+    LATEST                       name of the newest complete version
+
+Arrays are loaded with np.load(mmap_mode="r"), so loading takes milliseconds
+regardless of size and every bot worker on the host maps the same page-cache
+pages instead of holding a private copy.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import StandardScaler
+from config import get_settings
+from metrics import metrics
+from user_grouping import (
+    SimilarityModel,
+    fetch_user_features,
+    fit_model,
+    get_model,
+    install_model,
+)
+
+LATEST_FILE = "LATEST"
+MODEL_REFRESH_SECONDS = 6 * 60 * 60
+ARTIFACT_KEEP = 3
+STALENESS_TICK_SECONDS = 60
+
+
+def artifact_root() -> str:
+    return get_settings().SIMILARITY_ARTIFACT_DIR
+
+
+def latest_version(root: str | None = None) -> str | None:
+    root = root or artifact_root()
+    try:
+        with open(os.path.join(root, LATEST_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_artifact(model: SimilarityModel, root: str | None = None) -> str:
+    """Write the model as a new version and point LATEST at it once it is complete."""
+    root = root or artifact_root()
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    tmp_dir = os.path.join(root, f".{version}.tmp")
+    os.makedirs(tmp_dir)
+
+    X = model.X.tocsr()
+    np.save(os.path.join(tmp_dir, "user_ids.npy"), model.user_ids)
+    np.save(os.path.join(tmp_dir, "X_data.npy"), X.data)
+    np.save(os.path.join(tmp_dir, "X_indices.npy"), X.indices)
+    np.save(os.path.join(tmp_dir, "X_indptr.npy"), X.indptr)
+    np.save(os.path.join(tmp_dir, "scale.npy"), model.scaler.scale_)
+    np.save(os.path.join(tmp_dir, "var.npy"), model.scaler.var_)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "version": version,
+                "columns": model.columns,
+                "shape": list(X.shape),
+                "nnz": int(X.nnz),
+                "n_samples_seen": int(model.scaler.n_samples_seen_),
+                "fitted_at": model.fitted_at,
+            },
+            f,
+            ensure_ascii=False,
+        )
+
+    os.rename(tmp_dir, os.path.join(root, version))
+    latest_tmp = os.path.join(root, f".{LATEST_FILE}.tmp")
+    with open(latest_tmp, "w") as f:
+        f.write(version)
+    os.replace(latest_tmp, os.path.join(root, LATEST_FILE))
+    return version
+
+
+def load_artifact(version: str, root: str | None = None) -> SimilarityModel:
+    root = root or artifact_root()
+    path = os.path.join(root, version)
+
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(path, name), mmap_mode="r")
+
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    X = sp.csr_matrix(
+        (load("X_data.npy"), load("X_indices.npy"), load("X_indptr.npy")),
+        shape=tuple(meta["shape"]),
+        copy=False,
+    )
+
+    scaler = StandardScaler(with_mean=False)
+    scaler.scale_ = np.asarray(load("scale.npy"))
+    scaler.var_ = np.asarray(load("var.npy"))
+    scaler.mean_ = None
+    scaler.n_features_in_ = X.shape[1]
+    scaler.n_samples_seen_ = meta["n_samples_seen"]
+
+    return SimilarityModel(
+        scaler=scaler,
+        X=X,
+        user_ids=load("user_ids.npy"),
+        columns=meta["columns"],
+        fitted_at=meta["fitted_at"],
+        version=version,
+    )
+
+
+def load_latest(root: str | None = None) -> SimilarityModel | None:
+    version = latest_version(root)
+    if version is None:
+        return None
+    start = time.perf_counter()
+    model = load_artifact(version, root)
+    logging.info(
+        f"Loaded similarity artifact {version} ({len(model.user_ids)} users) "
+        f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+    return model
+
+
+def prune(keep: int, root: str | None = None):
+    """Delete all but the newest `keep` versions (never the one LATEST points at)."""
+    root = root or artifact_root()
+    current = latest_version(root)
+    versions = sorted(
+        d for d in os.listdir(root)
+        if not d.startswith(".") and os.path.isdir(os.path.join(root, d))
+    )
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != current:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+async def load_or_fit_model(publish: bool = True) -> SimilarityModel | None:
+    """
+    Bot startup: map the latest artifact. If there is none yet, the publishing
+    process builds and publishes it; the others wait for keep_model_fresh to
+    pick it up.
+    """
+    try:
+        model = load_latest()
+    except Exception as e:
+        logging.error(f"Could not load similarity artifact: {e}")
+        model = None
+    if model is None:
+        if not publish:
+            logging.warning("No similarity artifact yet, waiting for it to be published")
+            return None
+        await build(ARTIFACT_KEEP)
+        model = load_latest()
+    install_model(model)
+    metrics.set_gauge("similarity.users", len(model.user_ids))
+    return model
+
+
+async def keep_model_fresh(publish: bool = False, interval: float = MODEL_REFRESH_SECONDS):
+    """
+    Background task: swap in newer artifacts as soon as they are published.
+    Exactly one process per artifact directory runs with publish=True and
+    rebuilds the artifact once the current one is older than `interval`;
+    the others only ever map LATEST, so every worker keeps sharing the same
+    page-cache pages. Publishes model staleness and rebuild metrics.
+    """
+    model = get_model()
+    seen_version = model.version if model else None
+    while True:
+        await asyncio.sleep(STALENESS_TICK_SECONDS)
+        model = get_model()
+        try:
+            if publish and (model is None or model.age_seconds() >= interval):
+                with metrics.timer("similarity.rebuild"):
+                    await build(ARTIFACT_KEEP)
+            version = latest_version()
+            if version is not None and version != seen_version:
+                seen_version = version
+                model = await asyncio.to_thread(load_artifact, version)
+                install_model(model)
+                metrics.inc("similarity.artifact_reloads")
+                logging.info(f"Switched to similarity artifact {version}")
+        except Exception as e:
+            metrics.inc("similarity.refit_errors")
+            logging.error(f"Similarity model refresh failed: {e}")
+        if model is not None:
+            metrics.set_gauge("similarity.model_age_seconds", model.age_seconds())
+
+
+async def build(keep: int) -> str:
+    user_ids, X, columns = await fetch_user_features()
+    if len(user_ids) == 0:
+        raise ValueError("No transactions found in database")
+    model = await asyncio.to_thread(fit_model, user_ids, X, columns)
+
+    root = artifact_root()
+    os.makedirs(root, exist_ok=True)
+    version = save_artifact(model, root)
+    prune(keep, root)
+    logging.info(f"Saved similarity artifact {version} for {len(user_ids)} users to {root}")
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the similarity model artifact")
+    parser.add_argument("--keep", type=int, default=ARTIFACT_KEEP, help="Versions to keep on disk")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(build(args.keep))
@@ -0,0 +1,205 @@
+"""
+Proactive "unusual spend" alerts over new transactions.
+
+SpendingAnomalyDetector polls `transactions` by id (no history rescan: it
+starts at the current max id) and feeds every new expense row into
+CategoryStats, which keeps Welford running mean/variance per (user, category)
+and flags an amount more than Z_THRESHOLD standard deviations above the mean
+in O(1). As in the analytics summary and the spending series, a user's
+expenses are the rows with their id in from_account_id (user_id is the
+receiving side); rows without a from_account_id are not spending and are
+skipped.
+Flagged SpendingAlert objects go to an asyncio.Queue the bot delivers from.
+
+Ids are assigned when a row is inserted, not when it commits, so a row can
+become visible after rows with higher ids were already read. Each poll
+therefore re-reads the last LOOKBACK_IDS ids below the highest one seen and
+skips the rows it already processed (a set of the ids in that window); a row
+committing later than LOOKBACK_IDS newer inserts is missed.
+
+Memory: stats live in three preallocated [max_users x n_categories] arrays
+(uint32 count, float64 mean, float64 M2) = 20 bytes per category per user,
+plus ~100 bytes of index entry per tracked user. With the default 10
+categories and 100_000 users that is ~30 MB, fixed at startup; beyond
+max_users the least recently active user's row is recycled.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+import numpy as np
+from sqlalchemy import text
+from analytics import convert_to_kzt, get_rates
+from db import engine
+from metrics import metrics
+
+CATEGORIES = [
+    "groceries", "restaurants", "transport", "online_shopping", "entertainment",
+    "utilities", "clothes", "recurring", "transfer", "other",
+]
+MAX_TRACKED_USERS = 100_000
+MIN_SAMPLES = 10
+Z_THRESHOLD = 3.0
+POLL_INTERVAL_SECONDS = 5.0
+POLL_BATCH_SIZE = 1000
+LOOKBACK_IDS = 1000
+ALERT_QUEUE_SIZE = 10_000
+
+RECENT_IDS_QUERY = text(
+    "SELECT id FROM transactions WHERE id > :after AND from_account_id IS NOT NULL"
+)
+
+NEW_TRANSACTIONS_QUERY = text(
+    """
+    SELECT id, from_account_id AS user_id, datetime, amount, currency, category
+    FROM transactions
+    WHERE id > :after
+      AND from_account_id IS NOT NULL
+    ORDER BY id
+    LIMIT :limit
+    """
+)
+
+
+@dataclass
+class SpendingAlert:
+    user_id: int
+    category: str
+    amount_kzt: float
+    mean_kzt: float
+    z_score: float
+    transaction_id: int
+    datetime: datetime
+
+    def text(self) -> str:
+        return (
+            f"Необычная трата в категории {self.category}: {self.amount_kzt:,.0f} ₸ "
+            f"(обычно около {self.mean_kzt:,.0f} ₸)."
+        )
+
+
+class CategoryStats:
+    """Running count/mean/variance per (user, category) in fixed-size arrays."""
+
+    def __init__(self, categories: list[str] = CATEGORIES, max_users: int = MAX_TRACKED_USERS):
+        self.category_index = {c: i for i, c in enumerate(categories)}
+        self.other = self.category_index.get("other", len(categories) - 1)
+        self.max_users = max_users
+        self.count = np.zeros((max_users, len(categories)), dtype=np.uint32)
+        self.mean = np.zeros((max_users, len(categories)), dtype=np.float64)
+        self.m2 = np.zeros((max_users, len(categories)), dtype=np.float64)
+        self._rows: OrderedDict[int, int] = OrderedDict()  # user_id -> row, LRU order
+
+    def _row(self, user_id: int) -> int:
+        row = self._rows.get(user_id)
+        if row is not None:
+            self._rows.move_to_end(user_id)
+            return row
+        if len(self._rows) < self.max_users:
+            row = len(self._rows)
+        else:
+            _, row = self._rows.popitem(last=False)
+            self.count[row] = 0
+            self.mean[row] = 0
+            self.m2[row] = 0
+        self._rows[user_id] = row
+        return row
+
+    def update(self, user_id: int, category: str | None, amount: float) -> tuple[float, float] | None:
+        """
+        Score `amount` against the stats seen so far, then fold it in.
+        Returns (z_score, mean) when the amount is an outlier, else None.
+        """
+        row = self._row(user_id)
+        col = self.category_index.get(category, self.other)
+        n = int(self.count[row, col])
+        mean = float(self.mean[row, col])
+        m2 = float(self.m2[row, col])
+
+        outlier = None
+        if n >= MIN_SAMPLES:
+            std = (m2 / (n - 1)) ** 0.5
+            if std > 0:
+                z = (amount - mean) / std
+                if z > Z_THRESHOLD:
+                    outlier = (z, mean)
+
+        n += 1
+        delta = amount - mean
+        mean += delta / n
+        self.count[row, col] = n
+        self.mean[row, col] = mean
+        self.m2[row, col] = m2 + delta * (amount - mean)
+        return outlier
+
+
+class SpendingAnomalyDetector:
+    def __init__(self, stats: CategoryStats | None = None, queue: asyncio.Queue | None = None):
+        self.stats = stats or CategoryStats()
+        self.queue: asyncio.Queue[SpendingAlert] = queue or asyncio.Queue(maxsize=ALERT_QUEUE_SIZE)
+        self.last_id: int | None = None  # highest id seen
+        self.seen: set[int] = set()  # ids above last_id - LOOKBACK_IDS already processed
+
+    def process(self, row, rates_from_eur: dict):
+        amount_kzt = convert_to_kzt(row.amount, row.currency, rates_from_eur)
+        outlier = self.stats.update(row.user_id, row.category, amount_kzt)
+        metrics.inc("spending_alerts.transactions")
+        if outlier is None:
+            return
+
+        z, mean = outlier
+        alert = SpendingAlert(
+            user_id=row.user_id,
+            category=row.category or "other",
+            amount_kzt=round(amount_kzt, 2),
+            mean_kzt=round(mean, 2),
+            z_score=round(z, 2),
+            transaction_id=row.id,
+            datetime=row.datetime,
+        )
+        try:
+            self.queue.put_nowait(alert)
+            metrics.inc("spending_alerts.flagged")
+        except asyncio.QueueFull:
+            metrics.inc("spending_alerts.dropped")
+
+    async def poll_once(self) -> int:
+        """Process the rows not seen yet; returns how many there were."""
+        if self.last_id is None:
+            async with engine.connect() as conn:
+                result = await conn.execute(text("SELECT coalesce(max(id), 0) FROM transactions"))
+                self.last_id = int(result.scalar_one())
+                result = await conn.execute(RECENT_IDS_QUERY, {"after": self.last_id - LOOKBACK_IDS})
+                self.seen = set(result.scalars().all())
+
+        # Rows already seen in the window come back too; the limit leaves room for them
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                NEW_TRANSACTIONS_QUERY,
+                {"after": self.last_id - LOOKBACK_IDS, "limit": POLL_BATCH_SIZE + len(self.seen)},
+            )
+            rows = [row for row in result.fetchall() if row.id not in self.seen]
+        if not rows:
+            return 0
+
+        _, rates_from_eur = await get_rates()
+        for row in rows:
+            self.process(row, rates_from_eur)
+            self.seen.add(row.id)
+        metrics.inc("spending_alerts.late_rows", sum(row.id <= self.last_id for row in rows))
+        self.last_id = max(self.last_id, rows[-1].id)
+        self.seen = {i for i in self.seen if i > self.last_id - LOOKBACK_IDS}
+        metrics.set_gauge("spending_alerts.queue_depth", self.queue.qsize())
+        return len(rows)
+
+    async def run(self):
+        """Poll forever; keeps going on DB errors so the bot is not taken down."""
+        while True:
+            try:
+                n = await self.poll_once()
+            except Exception as e:
+                logging.error(f"Spending anomaly poll failed: {e}")
+                n = 0
+            if n < POLL_BATCH_SIZE:
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
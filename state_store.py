@@ -0,0 +1,258 @@
+"""
+Per-chat state and shared caches behind a pluggable store, so any bot
+worker or replica can serve any chat.
+
+    STATE_STORE=memory     single process only (default, tests)
+    STATE_STORE=sqlite     one file (STATE_SQLITE_PATH) shared by the workers of one host
+    STATE_STORE=postgres   the application database, for several hosts
+
+A store holds conversations (as Conversation.to_dict() JSON), the chats
+subscribed to each user's spending alerts, and string caches with a TTL
+(e.g. FAQ answers). Values are JSON text in every backend.
+"""
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from sqlalchemy import text
+from config import get_settings
+
+
+class StateStore(ABC):
+    @abstractmethod
+    async def load_conversation(self, user_id: int) -> dict | None: ...
+
+    @abstractmethod
+    async def save_conversation(self, user_id: int, data: dict): ...
+
+    @abstractmethod
+    async def add_alert_chat(self, user_id: int, chat_id: int): ...
+
+    @abstractmethod
+    async def remove_alert_chat(self, user_id: int, chat_id: int): ...
+
+    @abstractmethod
+    async def alert_chats(self, user_id: int) -> list[int]:
+        """Chats subscribed to the spending alerts of a user."""
+
+    @abstractmethod
+    async def cache_get(self, namespace: str, key: str) -> str | None: ...
+
+    @abstractmethod
+    async def cache_set(self, namespace: str, key: str, value: str, ttl_seconds: float): ...
+
+    async def close(self):
+        pass
+
+
+class MemoryStore(StateStore):
+    def __init__(self):
+        self.conversations: dict[int, str] = {}
+        self.alert_subscriptions: set[tuple[int, int]] = set()
+        self.cache: dict[tuple[str, str], tuple[str, float]] = {}
+
+    async def load_conversation(self, user_id: int) -> dict | None:
+        data = self.conversations.get(user_id)
+        return json.loads(data) if data is not None else None
+
+    async def save_conversation(self, user_id: int, data: dict):
+        # Stored serialized, like the other backends, so callers cannot share mutable state
+        self.conversations[user_id] = json.dumps(data, ensure_ascii=False)
+
+    async def add_alert_chat(self, user_id: int, chat_id: int):
+        self.alert_subscriptions.add((user_id, chat_id))
+
+    async def remove_alert_chat(self, user_id: int, chat_id: int):
+        self.alert_subscriptions.discard((user_id, chat_id))
+
+    async def alert_chats(self, user_id: int) -> list[int]:
+        return [chat_id for subscriber, chat_id in self.alert_subscriptions if subscriber == user_id]
+
+    async def cache_get(self, namespace: str, key: str) -> str | None:
+        entry = self.cache.get((namespace, key))
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    async def cache_set(self, namespace: str, key: str, value: str, ttl_seconds: float):
+        self.cache[(namespace, key)] = (value, time.time() + ttl_seconds)
+
+
+SQLITE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS conversations (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS alert_subscriptions (user_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, "
+    "PRIMARY KEY (user_id, chat_id))",
+    "CREATE TABLE IF NOT EXISTS cache (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+    "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))",
+]
+
+
+class SQLiteStore(StateStore):
+    """aiosqlite in WAL mode; several worker processes may share the file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._lock = asyncio.Lock()
+
+    async def _conn(self):
+        if self._db is None:
+            async with self._lock:
+                if self._db is None:
+                    import aiosqlite
+
+                    db = await aiosqlite.connect(self.path, timeout=30)
+                    await db.execute("PRAGMA journal_mode=WAL")
+                    await db.execute("PRAGMA synchronous=NORMAL")
+                    for statement in SQLITE_SCHEMA:
+                        await db.execute(statement)
+                    await db.commit()
+                    self._db = db
+        return self._db
+
+    async def load_conversation(self, user_id: int) -> dict | None:
+        db = await self._conn()
+        async with db.execute("SELECT data FROM conversations WHERE user_id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def save_conversation(self, user_id: int, data: dict):
+        db = await self._conn()
+        await db.execute(
+            "INSERT INTO conversations (user_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (user_id, json.dumps(data, ensure_ascii=False), time.time()),
+        )
+        await db.commit()
+
+    async def add_alert_chat(self, user_id: int, chat_id: int):
+        db = await self._conn()
+        await db.execute(
+            "INSERT OR IGNORE INTO alert_subscriptions (user_id, chat_id) VALUES (?, ?)", (user_id, chat_id)
+        )
+        await db.commit()
+
+    async def remove_alert_chat(self, user_id: int, chat_id: int):
+        db = await self._conn()
+        await db.execute("DELETE FROM alert_subscriptions WHERE user_id = ? AND chat_id = ?", (user_id, chat_id))
+        await db.commit()
+
+    async def alert_chats(self, user_id: int) -> list[int]:
+        db = await self._conn()
+        async with db.execute("SELECT chat_id FROM alert_subscriptions WHERE user_id = ?", (user_id,)) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def cache_get(self, namespace: str, key: str) -> str | None:
+        db = await self._conn()
+        async with db.execute(
+            "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires_at >= ?",
+            (namespace, key, time.time()),
+        ) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def cache_set(self, namespace: str, key: str, value: str, ttl_seconds: float):
+        db = await self._conn()
+        await db.execute(
+            "INSERT INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (namespace, key, value, time.time() + ttl_seconds),
+        )
+        await db.commit()
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+class PostgresStore(StateStore):
+    """Tables bot_conversations, bot_alert_subscriptions and bot_cache of the application database."""
+
+    def __init__(self, engine=None):
+        if engine is None:
+            from db import engine
+        self.engine = engine
+
+    async def load_conversation(self, user_id: int) -> dict | None:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT data FROM bot_conversations WHERE user_id = :user_id"), {"user_id": user_id}
+            )
+            data = result.scalar_one_or_none()
+        return data
+
+    async def save_conversation(self, user_id: int, data: dict):
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text(
+                    """
+                    INSERT INTO bot_conversations (user_id, data, updated_at)
+                    VALUES (:user_id, CAST(:data AS jsonb), now())
+                    ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                    """
+                ),
+                {"user_id": user_id, "data": json.dumps(data, ensure_ascii=False)},
+            )
+
+    async def add_alert_chat(self, user_id: int, chat_id: int):
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "INSERT INTO bot_alert_subscriptions (user_id, chat_id) VALUES (:user_id, :chat_id) "
+                    "ON CONFLICT DO NOTHING"
+                ),
+                {"user_id": user_id, "chat_id": chat_id},
+            )
+
+    async def remove_alert_chat(self, user_id: int, chat_id: int):
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text("DELETE FROM bot_alert_subscriptions WHERE user_id = :user_id AND chat_id = :chat_id"),
+                {"user_id": user_id, "chat_id": chat_id},
+            )
+
+    async def alert_chats(self, user_id: int) -> list[int]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT chat_id FROM bot_alert_subscriptions WHERE user_id = :user_id"), {"user_id": user_id}
+            )
+            return list(result.scalars().all())
+
+    async def cache_get(self, namespace: str, key: str) -> str | None:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                text(
+                    "SELECT value FROM bot_cache "
+                    "WHERE namespace = :namespace AND key = :key AND expires_at >= now()"
+                ),
+                {"namespace": namespace, "key": key},
+            )
+            return result.scalar_one_or_none()
+
+    async def cache_set(self, namespace: str, key: str, value: str, ttl_seconds: float):
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text(
+                    """
+                    INSERT INTO bot_cache (namespace, key, value, expires_at)
+                    VALUES (:namespace, :key, :value, now() + make_interval(secs => :ttl))
+                    ON CONFLICT (namespace, key) DO UPDATE
+                    SET value = excluded.value, expires_at = excluded.expires_at
+                    """
+                ),
+                {"namespace": namespace, "key": key, "value": value, "ttl": float(ttl_seconds)},
+            )
+
+
+@lru_cache
+def get_store() -> StateStore:
+    settings = get_settings()
+    if settings.STATE_STORE == "memory":
+        return MemoryStore()
+    if settings.STATE_STORE == "sqlite":
+        return SQLiteStore(settings.STATE_SQLITE_PATH)
+    if settings.STATE_STORE == "postgres":
+        return PostgresStore()
+    raise ValueError(f"Unknown STATE_STORE: {settings.STATE_STORE}")
@@ -0,0 +1,91 @@
+"""
+One shared "typing…" ticker for all chats that are waiting for an answer.
+
+    async with typing_indicator.typing(chat_id):
+        ...  # the chat shows "typing…" until the block exits
+
+Chats register while they are busy; a single task sends their chat actions
+every INTERVAL_SECONDS (Telegram shows one for about 5 seconds), newly
+registered chats first, in batches of at most BATCH_SIZE per
+BATCH_PAUSE_SECONDS so a crowd of busy chats does not turn into a burst of
+API calls. The number of tasks and timers stays constant however many
+chats are busy. A chat registered several times (e.g. by nested blocks)
+stays busy until the last block exits.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+from metrics import metrics
+
+INTERVAL_SECONDS = 4.0
+BATCH_SIZE = 25
+BATCH_PAUSE_SECONDS = 1.0
+
+
+class TypingTicker:
+    def __init__(
+        self,
+        send_action: Callable[[int], Awaitable[object]],
+        interval: float = INTERVAL_SECONDS,
+        batch_size: int = BATCH_SIZE,
+        batch_pause: float = BATCH_PAUSE_SECONDS,
+    ):
+        self.send_action = send_action
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.registrations: dict[int, int] = {}
+        self.next_due: dict[int, float] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    @asynccontextmanager
+    async def typing(self, chat_id: int):
+        self.registrations[chat_id] = self.registrations.get(chat_id, 0) + 1
+        if self.registrations[chat_id] == 1:
+            self.next_due[chat_id] = 0.0
+            self._ensure_running()
+            self._wakeup.set()
+        metrics.set_gauge("typing.active_chats", len(self.registrations))
+        try:
+            yield
+        finally:
+            self.registrations[chat_id] -= 1
+            if not self.registrations[chat_id]:
+                del self.registrations[chat_id]
+                self.next_due.pop(chat_id, None)
+            metrics.set_gauge("typing.active_chats", len(self.registrations))
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _send(self, chat_id: int):
+        try:
+            await self.send_action(chat_id)
+        except Exception as e:
+            logging.error(f"Error sending typing action: {e}")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            due = sorted((t, chat_id) for chat_id, t in self.next_due.items() if t <= now)
+            batch = [chat_id for _, chat_id in due[: self.batch_size]]
+            if batch:
+                for chat_id in batch:
+                    self.next_due[chat_id] = now + self.interval
+                metrics.inc("typing.actions", len(batch))
+                await asyncio.gather(*(self._send(chat_id) for chat_id in batch))
+                if len(due) > len(batch):
+                    await asyncio.sleep(self.batch_pause)
+                continue
+
+            timeout = min(self.next_due.values()) - now if self.next_due else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -1,94 +1,269 @@
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from sklearn.neighbors import NearestNeighbors
+import time
+from dataclasses import dataclass, field
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import StandardScaler, normalize
 from sqlalchemy import text
+from batch_jobs import iter_user_id_chunks
 from db import engine
 
 N_NEIGHBORS = 10  # Seems enough, but feel free to adjust
+FEATURE_CHUNK_USERS = 20_000
 
-async def prepare_knn_and_aggregated_data():
+NUMERIC_COLUMNS = ["expense_mean", "expense_std", "transaction_count"]
+
+# Per-user aggregates computed by Postgres; mode() breaks ties by smallest
+# currency code, like pandas' Series.mode().iloc[0] did
+USER_STATS_QUERY = text(
     """
-    Async version — prepares KNN model and aggregated user transaction data.
-    Returns the KNN model, scaled feature matrix X, and the features DataFrame.
+    SELECT user_id,
+           avg(amount)::float8 AS expense_mean,
+           coalesce(stddev_samp(amount), 0)::float8 AS expense_std,
+           count(*) AS transaction_count,
+           mode() WITHIN GROUP (ORDER BY currency) AS most_used_currency
+    FROM transactions
+    WHERE user_id = ANY(:user_ids)
+    GROUP BY user_id
+    ORDER BY user_id
     """
-    async with engine.connect() as conn:
-        result = await conn.execute(text("SELECT * FROM transactions"))
-        rows = result.mappings().all()
-        transactions = pd.DataFrame(rows)
-
-    if transactions.empty:
-        raise ValueError("No transactions found in database")
-
-    # Aggregate transaction data by user
-    features = transactions.groupby("user_id").agg(
-        expense_mean=("amount", "mean"),
-        expense_std=("amount", "std"),
-        transaction_count=("amount", "count"),
-        most_used_currency=("currency", lambda x: x.mode().iloc[0]),
-    )
+)
 
-    # One-hot encode the most used currency
-    currencies = pd.get_dummies(features["most_used_currency"], prefix="currency")
-    features = pd.concat([features.drop(columns="most_used_currency"), currencies], axis=1)
+CATEGORY_COUNTS_QUERY = text(
+    """
+    SELECT user_id, category, count(*) AS n
+    FROM transactions
+    WHERE user_id = ANY(:user_ids) AND category IS NOT NULL
+    GROUP BY user_id, category
+    """
+)
 
-    # Count transactions per category
-    cat_counts = (
-        transactions
-        .pivot_table(index="user_id", columns="category", values="amount", aggfunc="count", fill_value=0)
-        .add_prefix("category_")
-        .add_suffix("_count")
-    )
+# Served by the partial index ix_goals_finished_user_deadline
+FINISHED_GOALS_QUERY = text(
+    """
+    SELECT name, target_amount, currency, deadline
+    FROM financial_goals
+    WHERE user_id = ANY(:user_ids) AND current_amount >= target_amount
+    ORDER BY deadline DESC NULLS LAST
+    LIMIT 3
+    """
+)
+
+
+@dataclass
+class FeatureMatrixBuilder:
+    """
+    Accumulates per-user feature rows chunk by chunk into a CSR matrix:
+    amount mean/std/count, one-hot most used currency and per-category counts.
+
+    Currency and category columns are added as they are first seen, so the
+    taxonomy is open-ended; only non-zero entries are stored, so memory is
+    O(users x categories actually used) rather than O(users x all columns).
+    With `columns` given and frozen=True, unknown columns are dropped instead
+    (used to featurize single users against a fitted model).
+    """
+
+    columns: list[str] = field(default_factory=lambda: list(NUMERIC_COLUMNS))
+    frozen: bool = False
+
+    def __post_init__(self):
+        self.column_index = {c: i for i, c in enumerate(self.columns)}
+        self._chunks: list[sp.csr_matrix] = []
+        self._user_ids: list[np.ndarray] = []
 
-    # Merge category counts into features
-    features = features.merge(cat_counts, left_index=True, right_index=True, how="left")
+    def _column(self, name: str) -> int | None:
+        index = self.column_index.get(name)
+        if index is None and not self.frozen:
+            index = len(self.columns)
+            self.columns.append(name)
+            self.column_index[name] = index
+        return index
 
-    # Scale features
-    scaler = StandardScaler()
-    X = scaler.fit_transform(features)
+    def add_chunk(self, stats: list, counts: list):
+        """`stats`: USER_STATS_QUERY rows ordered by user_id; `counts`: CATEGORY_COUNTS_QUERY rows."""
+        if not stats:
+            return
+        user_ids = np.fromiter((r.user_id for r in stats), dtype=np.int64, count=len(stats))
+        position = {int(u): i for i, u in enumerate(user_ids)}
 
-    # Fit a KNN model (+1 because the closest neighbor is the user themself)
-    nn = NearestNeighbors(n_neighbors=N_NEIGHBORS + 1, metric="cosine")
-    nn.fit(X)
+        rows, cols, values = [], [], []
+        for i, r in enumerate(stats):
+            rows += [i, i, i]
+            cols += [0, 1, 2]
+            values += [r.expense_mean, r.expense_std, r.transaction_count]
+            currency = self._column(f"currency_{r.most_used_currency}")
+            if currency is not None:
+                rows.append(i)
+                cols.append(currency)
+                values.append(1.0)
+        for r in counts:
+            category = self._column(f"category_{r.category}_count")
+            if category is not None and r.user_id in position:
+                rows.append(position[r.user_id])
+                cols.append(category)
+                values.append(r.n)
 
-    return nn, X, features
+        chunk = sp.coo_matrix(
+            (np.asarray(values, dtype=np.float64), (np.asarray(rows), np.asarray(cols))),
+            shape=(len(user_ids), len(self.columns)),
+        ).tocsr()
+        self._chunks.append(chunk)
+        self._user_ids.append(user_ids)
 
+    def build(self) -> tuple[np.ndarray, sp.csr_matrix]:
+        """(user_ids ascending, CSR matrix [users x columns])."""
+        if not self._chunks:
+            return np.zeros(0, dtype=np.int64), sp.csr_matrix((0, len(self.columns)))
+        for chunk in self._chunks:
+            chunk.resize((chunk.shape[0], len(self.columns)))
+        X = sp.vstack(self._chunks, format="csr")
+        user_ids = np.concatenate(self._user_ids)
+        self._chunks, self._user_ids = [], []
+        return user_ids, X
 
-async def find_relevant_goal_comparisons(target_user_id, nn, X, features):
+
+@dataclass(frozen=True)
+class SimilarityModel:
     """
-    Async version — finds relevant finished goals from similar users.
+    Fitted scaler + brute-force cosine neighbour index over the sparse per-user
+    feature matrix. X holds the scaled rows L2-normalized, so cosine similarity
+    is a sparse dot product and the index is X itself, with no private copy
+    (which lets workers share a memory-mapped X, see similarity_artifact.py).
     """
-    # Get target vector
-    target_index = features.index.get_loc(target_user_id)
-    target_vector = X[target_index].reshape(1, -1)
 
+    scaler: StandardScaler
+    X: sp.csr_matrix
+    user_ids: np.ndarray  # ascending, row i of X belongs to user_ids[i]
+    columns: list[str]
+    fitted_at: float
+    version: str | None = None  # artifact version when loaded from disk
+
+    def age_seconds(self) -> float:
+        return time.time() - self.fitted_at
+
+    def kneighbors(self, vector: sp.csr_matrix, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """(row indices, cosine distances) of the k rows closest to a normalized vector."""
+        sims = np.asarray((self.X @ vector.T).todense()).ravel()
+        k = min(k, len(sims))
+        part = np.argpartition(-sims, k - 1)[:k]
+        order = part[np.argsort(-sims[part])]
+        return order, 1 - sims[order]
+
+    def row_of(self, user_id) -> int | None:
+        i = int(np.searchsorted(self.user_ids, user_id))
+        if i < len(self.user_ids) and self.user_ids[i] == user_id:
+            return i
+        return None
+
+
+_model: SimilarityModel | None = None
+
+
+def get_model() -> SimilarityModel | None:
+    """Current model; read it once per request, refreshes swap the reference."""
+    return _model
+
+
+def install_model(model: SimilarityModel):
+    """Atomically replace the model used by new requests."""
+    global _model
+    _model = model
+
+
+async def fetch_feature_chunk(builder: FeatureMatrixBuilder, user_ids: list[int]):
     async with engine.connect() as conn:
-        result = await conn.execute(text("SELECT * FROM financial_goals"))
-        rows = result.mappings().all()
-        goals = pd.DataFrame(rows)
+        params = {"user_ids": [int(x) for x in user_ids]}
+        stats = (await conn.execute(USER_STATS_QUERY, params)).fetchall()
+        counts = (await conn.execute(CATEGORY_COUNTS_QUERY, params)).fetchall()
+    builder.add_chunk(stats, counts)
 
-    if goals.empty:
+
+async def fetch_user_features(chunk_size: int = FEATURE_CHUNK_USERS) -> tuple[np.ndarray, sp.csr_matrix, list[str]]:
+    """
+    Feature matrix of all users with transactions, aggregated in SQL and
+    streamed in user-id chunks, so neither transactions nor a dense
+    [users x columns] frame is ever held in memory.
+    """
+    builder = FeatureMatrixBuilder()
+    async for user_ids in iter_user_id_chunks(0, chunk_size):
+        await fetch_feature_chunk(builder, user_ids)
+    user_ids, X = builder.build()
+    return user_ids, X, builder.columns
+
+
+def fit_model(user_ids: np.ndarray, X: sp.csr_matrix, columns: list[str]) -> SimilarityModel:
+    # Scale features; no centering, which would densify the matrix
+    scaler = StandardScaler(with_mean=False)
+    X = normalize(scaler.fit_transform(X).tocsr())
+
+    return SimilarityModel(
+        scaler=scaler, X=X, user_ids=user_ids, columns=list(columns), fitted_at=time.time()
+    )
+
+
+async def user_vector(model: SimilarityModel, user_id) -> tuple[sp.csr_matrix | None, int | None]:
+    """
+    Scaled feature vector of the user and its row in model.X. Users who joined
+    after the last refit are featurized on the fly and have no row.
+    """
+    index = model.row_of(user_id)
+    if index is not None:
+        return model.X[index], index
+
+    builder = FeatureMatrixBuilder(columns=list(model.columns), frozen=True)
+    await fetch_feature_chunk(builder, [user_id])
+    user_ids, row = builder.build()
+    if len(user_ids) == 0:
+        return None, None
+    return normalize(model.scaler.transform(row)), None
+
+
+async def get_neighbor_ids(user_id: int) -> list[int]:
+    """Precomputed neighbours of the user, closest first (empty if not computed yet)."""
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT neighbor_id FROM user_neighbors WHERE user_id = :user_id ORDER BY rank"),
+            {"user_id": int(user_id)},
+        )
+        return list(result.scalars().all())
+
+
+async def find_similar_users(target_user_id) -> list[int]:
+    """Nearest users according to the in-process model, closest first."""
+    model = get_model()
+    if model is None:
         return []
 
-    # Find nearest neighbors
-    distances, indices = nn.kneighbors(target_vector)
+    # Get target vector
+    target_vector, target_index = await user_vector(model, target_user_id)
+    if target_vector is None:
+        return []
+
+    # Find nearest neighbors (+1 because the closest neighbor is the user themself)
+    indices, distances = model.kneighbors(target_vector, N_NEIGHBORS + 1)
 
     # Filter out the target user
-    similar_indices = [i for i in indices[0] if i != target_index]
-    similar_users = features.index[similar_indices].to_numpy()
-
-    # Gather finished goals
-    examples = []
-    for similar_user_id in similar_users:
-        users_goals = goals[goals["user_id"] == similar_user_id]
-        finished_goals = users_goals[users_goals["target_amount"] >= users_goals["current_amount"]]
-        if len(finished_goals) == 0:
-            continue
-
-        for x in finished_goals[["name", "target_amount", "currency", "deadline"]].values.tolist():
-            x[3] = pd.to_datetime(x[3]).date()
-            x[1] = float(x[1])
-            x[3] = str(x[3])
-            examples.append(tuple(x))
+    similar_indices = [i for i in indices if i != target_index][:N_NEIGHBORS]
+    return model.user_ids[similar_indices].tolist()
+
+
+async def find_relevant_goal_comparisons(target_user_id):
+    """
+    Async version — finds relevant finished goals from similar users.
+    Neighbours come from the precomputed user_neighbors table; the in-process
+    model is only consulted for users the batch job has not seen yet.
+    """
+    similar_users = await get_neighbor_ids(target_user_id)
+    if not similar_users:
+        similar_users = await find_similar_users(target_user_id)
+    if not similar_users:
+        return []
+
+    async with engine.connect() as conn:
+        result = await conn.execute(FINISHED_GOALS_QUERY, {"user_ids": [int(x) for x in similar_users]})
+        rows = result.fetchall()
 
     # Return top 3 most recent finished goals
-    return sorted(examples, key=lambda x: x[3], reverse=True)[:3]
+    return [
+        (name, float(target_amount), currency, deadline.isoformat() if deadline is not None else None)
+        for name, target_amount, currency, deadline in rows
+    ]
@@ -0,0 +1,164 @@
+"""
+Precomputed nearest neighbours for every user.
+
+    python user_neighbors.py [--k 10] [--batch-size 4096] [--approximate]
+
+Fits the similarity model, finds the top-k cosine neighbours of all users in
+batched matrix products over the L2-normalized feature matrix and replaces
+the contents of `user_neighbors` in one transaction. Above EXACT_MAX_USERS
+(or with --approximate) an IVF index is used instead: users are clustered
+with mini-batch k-means and each batch is only compared against the users
+of its N_PROBE closest clusters.
+"""
+import argparse
+import asyncio
+import logging
+import time
+import numpy as np
+import scipy.sparse as sp
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import normalize
+from sqlalchemy import insert, text
+from db import engine
+from db.models import t_user_neighbors
+from metrics import metrics
+from user_grouping import N_NEIGHBORS, fetch_user_features, fit_model
+
+EXACT_MAX_USERS = 200_000
+DEFAULT_BATCH_SIZE = 4096
+MAX_BLOCK_ELEMENTS = 32_000_000  # ~128 MB of float32 similarities per batch
+N_PROBE = 8
+INSERT_BATCH_SIZE = 10_000
+
+
+def normalize_rows(X):
+    """L2-normalize rows as float32, keeping sparse input sparse; zero rows stay zero."""
+    return normalize(X.astype(np.float32), norm="l2", axis=1)
+
+
+def similarities(A, B) -> np.ndarray:
+    sims = A @ B.T
+    return sims.toarray() if sp.issparse(sims) else np.asarray(sims)
+
+
+def top_k(similarities: np.ndarray, k: int, exclude: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Column positions and similarities of the k best entries per row, best first.
+    `exclude[i]` is the column of row i's own user (-1 if absent).
+    """
+    rows = np.arange(len(similarities))
+    has_self = exclude >= 0
+    similarities[rows[has_self], exclude[has_self]] = -np.inf
+
+    k = min(k, similarities.shape[1])
+    part = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    part_sims = np.take_along_axis(similarities, part, axis=1)
+    order = np.argsort(-part_sims, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_sims, order, axis=1)
+
+
+def exact_neighbors(X: np.ndarray, k: int, batch_size: int = DEFAULT_BATCH_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """(indices, cosine distances) of the k nearest other rows for every row."""
+    Xn = normalize_rows(X)
+    n = Xn.shape[0]
+    k = min(k, n - 1)
+    # Bound the dense [batch x n] similarity block
+    batch_size = max(1, min(batch_size, MAX_BLOCK_ELEMENTS // n))
+    indices = np.empty((n, k), dtype=np.int64)
+    distances = np.empty((n, k), dtype=np.float32)
+    for start in range(0, n, batch_size):
+        stop = min(start + batch_size, n)
+        sims = similarities(Xn[start:stop], Xn)
+        idx, best = top_k(sims, k, np.arange(start, stop))
+        indices[start:stop] = idx
+        distances[start:stop] = 1 - best
+    return indices, distances
+
+
+def ivf_neighbors(
+    X: np.ndarray, k: int, batch_size: int = DEFAULT_BATCH_SIZE, n_probe: int = N_PROBE
+) -> tuple[np.ndarray, np.ndarray]:
+    """Approximate exact_neighbors: search only the n_probe closest k-means cells."""
+    Xn = normalize_rows(X)
+    n = Xn.shape[0]
+    k = min(k, n - 1)
+    n_lists = max(1, int(np.sqrt(n)))
+    n_probe = min(n_probe, n_lists)
+
+    kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=batch_size, n_init=3, random_state=0)
+    cells = kmeans.fit_predict(Xn)
+    centroids = normalize_rows(kmeans.cluster_centers_)
+    members = [np.flatnonzero(cells == c) for c in range(n_lists)]
+
+    indices = np.full((n, k), -1, dtype=np.int64)
+    distances = np.full((n, k), np.inf, dtype=np.float32)
+    # Group queries by home cell so each group shares one candidate set
+    for cell in range(n_lists):
+        queries = members[cell]
+        if len(queries) == 0:
+            continue
+        probe = np.argsort(-(centroids @ centroids[cell]))[:n_probe]
+        candidates = np.concatenate([members[c] for c in probe])
+        position = {user: i for i, user in enumerate(candidates)}
+
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            sims = similarities(Xn[batch], Xn[candidates])
+            exclude = np.array([position.get(user, -1) for user in batch])
+            idx, best = top_k(sims, k, exclude)
+            found = idx.shape[1]
+            indices[batch, :found] = candidates[idx]
+            distances[batch, :found] = 1 - best
+    return indices, distances
+
+
+async def write_neighbors(user_ids: np.ndarray, indices: np.ndarray, distances: np.ndarray):
+    """Replace the table contents atomically; readers see the old lists until commit."""
+    k = indices.shape[1]
+    users_per_batch = max(1, INSERT_BATCH_SIZE // max(k, 1))
+    written = 0
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM user_neighbors"))
+        for start in range(0, len(user_ids), users_per_batch):
+            rows = [
+                {
+                    "user_id": int(user_ids[i]),
+                    "rank": rank,
+                    "neighbor_id": int(user_ids[j]),
+                    "distance": float(distances[i, rank]),
+                }
+                for i in range(start, min(start + users_per_batch, len(user_ids)))
+                for rank, j in enumerate(indices[i])
+                if j >= 0 and np.isfinite(distances[i, rank])
+            ]
+            if rows:
+                await conn.execute(insert(t_user_neighbors), rows)
+                written += len(rows)
+    logging.info(f"Wrote {written} neighbour rows for {len(user_ids)} users")
+
+
+async def run(k: int, batch_size: int, approximate: bool):
+    user_ids, X, columns = await fetch_user_features()
+    if len(user_ids) == 0:
+        raise ValueError("No transactions found in database")
+    model = await asyncio.to_thread(fit_model, user_ids, X, columns)
+
+    start = time.perf_counter()
+    search = ivf_neighbors if approximate or len(user_ids) > EXACT_MAX_USERS else exact_neighbors
+    indices, distances = await asyncio.to_thread(search, model.X, k, batch_size)
+    duration = time.perf_counter() - start
+    metrics.observe("user_neighbors.search", duration)
+    logging.info(f"{search.__name__} for {len(user_ids)} users in {duration:.2f}s")
+
+    await write_neighbors(model.user_ids, indices, distances)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute nearest neighbours of all users")
+    parser.add_argument("--k", type=int, default=N_NEIGHBORS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--approximate", action="store_true", help="Use the IVF index regardless of size")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.k, args.batch_size, args.approximate))
@@ -0,0 +1,180 @@
+"""
+Voice message transcription.
+
+Voice notes are downloaded into memory and the OGG/Opus bytes are sent to
+the transcription endpoint as they are, with the async shared client, so
+nothing blocks the event loop and nothing is written to disk. Only if the
+endpoint rejects the file is it transcoded to WAV, in a worker thread.
+
+Notes longer than VOICE_CHUNK_SECONDS are cut at silences near every chunk
+boundary (off the event loop) and the chunks are transcribed concurrently,
+at most VOICE_TRANSCRIPTION_CONCURRENCY at a time across all chats, then
+stitched in order. Latency then grows with length / concurrency instead of
+length. An optional callback receives the transcript of the leading
+finished chunks as they complete.
+"""
+import asyncio
+import io
+import logging
+import time
+from typing import Awaitable, Callable
+import openai
+from pydub import AudioSegment
+from pydub.silence import detect_silence
+import openai_client
+from config import get_settings
+from metrics import metrics
+from scheduler import limit
+
+TRANSCRIPTION_MODEL = "whisper-1"
+# Cut a long note into chunks only if it is this much longer than a chunk
+CHUNKING_SLACK = 1.25
+# How far from the ideal cut a silence may be, as a share of the chunk length
+SILENCE_SEARCH_SHARE = 0.25
+MIN_SILENCE_MS = 300
+SILENCE_BELOW_AVERAGE_DB = 16
+SILENCE_SEEK_STEP_MS = 10
+
+_transcription_slots: asyncio.BoundedSemaphore | None = None
+
+
+def transcription_slots() -> asyncio.BoundedSemaphore:
+    """Process-wide bound on concurrent transcription requests."""
+    global _transcription_slots
+    if _transcription_slots is None:
+        _transcription_slots = asyncio.BoundedSemaphore(get_settings().VOICE_TRANSCRIPTION_CONCURRENCY)
+    return _transcription_slots
+
+
+async def download_voice(bot, voice) -> bytes:
+    file = await bot.get_file(voice.file_id)
+    return bytes(await file.download_as_bytearray())
+
+
+def ogg_to_wav(audio: bytes) -> bytes:
+    """Blocking; run in a thread."""
+    out = io.BytesIO()
+    AudioSegment.from_file(io.BytesIO(audio), format="ogg").export(out, format="wav")
+    return out.getvalue()
+
+
+def split_points(duration_ms: int, silences: list[tuple[int, int]], chunk_ms: int) -> list[int]:
+    """
+    Cut positions for chunks of about chunk_ms: at every multiple of chunk_ms
+    after the previous cut, take the middle of the nearest silence within
+    SILENCE_SEARCH_SHARE * chunk_ms, else cut right there.
+    """
+    window = chunk_ms * SILENCE_SEARCH_SHARE
+    middles = [(start + end) // 2 for start, end in silences]
+    cuts = []
+    position = 0
+    while duration_ms - position > chunk_ms * CHUNKING_SLACK:
+        target = position + chunk_ms
+        nearby = [m for m in middles if abs(m - target) <= window and m > position]
+        cut = min(nearby, key=lambda m: abs(m - target)) if nearby else target
+        cuts.append(cut)
+        position = cut
+    return cuts
+
+
+def split_voice(audio: bytes, chunk_seconds: int) -> list[bytes]:
+    """
+    OGG chunks of a voice note cut at silences; short notes come back
+    unchanged as the only chunk. Blocking; run in a thread.
+    """
+    segment = AudioSegment.from_file(io.BytesIO(audio), format="ogg")
+    chunk_ms = chunk_seconds * 1000
+    if len(segment) <= chunk_ms * CHUNKING_SLACK:
+        return [audio]
+
+    silences = detect_silence(
+        segment,
+        min_silence_len=MIN_SILENCE_MS,
+        silence_thresh=segment.dBFS - SILENCE_BELOW_AVERAGE_DB,
+        seek_step=SILENCE_SEEK_STEP_MS,
+    )
+    bounds = [0, *split_points(len(segment), silences, chunk_ms), len(segment)]
+    chunks = []
+    for start, end in zip(bounds, bounds[1:]):
+        out = io.BytesIO()
+        segment[start:end].export(out, format="ogg", codec="libopus")
+        chunks.append(out.getvalue())
+    return chunks
+
+
+async def transcribe(audio: bytes, filename: str = "voice.ogg", content_type: str = "audio/ogg") -> str:
+    start = time.perf_counter()
+    async with limit("openai"):
+        result = await openai_client.client.audio.transcriptions.create(
+            model=TRANSCRIPTION_MODEL, file=(filename, audio, content_type)
+        )
+    metrics.observe("voice.transcription", time.perf_counter() - start)
+    return result.text
+
+
+async def transcribe_ogg(audio: bytes) -> str:
+    """Transcript of one OGG/Opus chunk, falling back to WAV if the upload is rejected."""
+    try:
+        return await transcribe(audio)
+    except openai.BadRequestError as e:
+        logging.warning(f"OGG upload rejected ({e}), retrying as WAV")
+        metrics.inc("voice.wav_fallbacks")
+        wav = await asyncio.to_thread(ogg_to_wav, audio)
+        return await transcribe(wav, "voice.wav", "audio/wav")
+
+
+async def transcribe_chunks(
+    chunks: list[bytes],
+    on_partial: Callable[[str], Awaitable[None]] | None = None,
+    transcribe_chunk: Callable[[bytes], Awaitable[str]] = transcribe_ogg,
+    slots: asyncio.Semaphore | None = None,
+) -> str:
+    """
+    Transcribe chunks concurrently within the shared slots and join them in
+    order. on_partial gets the text of the leading finished chunks whenever
+    it grows, until the whole transcript is ready.
+    """
+    slots = slots or transcription_slots()
+    texts: list[str | None] = [None] * len(chunks)
+    reported = 0
+    report_lock = asyncio.Lock()  # keeps partial updates in order
+
+    async def run(i: int, chunk: bytes):
+        nonlocal reported
+        async with slots:
+            texts[i] = (await transcribe_chunk(chunk)).strip()
+        if on_partial is None:
+            return
+        async with report_lock:
+            prefix = reported
+            while prefix < len(texts) and texts[prefix] is not None:
+                prefix += 1
+            if reported < prefix < len(texts):
+                reported = prefix
+                try:
+                    await on_partial(" ".join(t for t in texts[:prefix] if t))
+                except Exception as e:
+                    logging.error(f"Partial transcript callback failed: {e}")
+
+    await asyncio.gather(*(run(i, chunk) for i, chunk in enumerate(chunks)))
+    return " ".join(t for t in texts if t)
+
+
+async def transcribe_voice(
+    audio: bytes,
+    duration_seconds: float | None = None,
+    on_partial: Callable[[str], Awaitable[None]] | None = None,
+) -> str:
+    """
+    Transcript of an OGG/Opus voice note of any length. Notes known to be
+    short (Telegram reports the duration) are sent without decoding.
+    """
+    chunk_seconds = get_settings().VOICE_CHUNK_SECONDS
+    chunks = [audio]
+    if duration_seconds is None or duration_seconds > chunk_seconds * CHUNKING_SLACK:
+        try:
+            chunks = await asyncio.to_thread(split_voice, audio, chunk_seconds)
+        except Exception as e:
+            logging.error(f"Could not split voice note, transcribing it whole: {e}")
+    metrics.inc("voice.chunks", len(chunks))
+    return await transcribe_chunks(chunks, on_partial)
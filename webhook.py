@@ -0,0 +1,105 @@
+"""
+Webhook ingestion: an embedded aiohttp server that receives Telegram updates.
+
+    POST {WEBHOOK_PATH}   Telegram updates; the X-Telegram-Bot-Api-Secret-Token
+                          header must equal WEBHOOK_SECRET_TOKEN
+    GET  /healthz         200 while the bot is running, 503 otherwise
+
+Valid updates are handed on and acknowledged right away: in a single
+process they go to the Application's update_queue and run on its workers
+(see BOT_CONCURRENT_UPDATES); under runtime.py they are routed to the
+worker process owning the chat. If an update cannot be accepted the
+endpoint answers 503 and Telegram redelivers it later. Any number of
+replicas can sit behind a load balancer: each registers the same public
+WEBHOOK_URL at startup.
+"""
+import hmac
+import logging
+from typing import Awaitable, Callable
+from aiohttp import web
+from telegram import Bot, Update
+from telegram.ext import Application
+from config import get_settings
+from metrics import metrics
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+HEALTH_PATH = "/healthz"
+
+
+def build_web_app(
+    handle_update: Callable[[dict], Awaitable[None]],
+    health: Callable[[], tuple[bool, dict]],
+    secret_token: str,
+    path: str,
+) -> web.Application:
+    async def receive_update(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret_token):
+            metrics.inc("webhook.rejected")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except Exception as e:
+            metrics.inc("webhook.invalid")
+            logging.error(f"Invalid webhook payload: {e}")
+            return web.Response(status=400)
+        try:
+            await handle_update(data)
+        except Exception as e:
+            metrics.inc("webhook.unavailable")
+            logging.error(f"Could not accept update: {e}")
+            return web.Response(status=503)
+        metrics.inc("webhook.updates")
+        return web.Response()
+
+    async def health_check(request: web.Request) -> web.Response:
+        healthy, details = health()
+        return web.json_response(details, status=200 if healthy else 503)
+
+    web_app = web.Application()
+    web_app.router.add_post(path, receive_update)
+    web_app.router.add_get(HEALTH_PATH, health_check)
+    return web_app
+
+
+async def serve_webhook(
+    handle_update: Callable[[dict], Awaitable[None]], health: Callable[[], tuple[bool, dict]]
+) -> web.AppRunner:
+    """Start the HTTP server; returns the runner to clean up."""
+    settings = get_settings()
+    if not settings.WEBHOOK_SECRET_TOKEN:
+        raise ValueError("WEBHOOK_SECRET_TOKEN is required in webhook mode")
+
+    runner = web.AppRunner(build_web_app(handle_update, health, settings.WEBHOOK_SECRET_TOKEN, settings.WEBHOOK_PATH))
+    await runner.setup()
+    await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+    logging.info(f"Webhook server listening on {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}")
+    return runner
+
+
+async def register_webhook(bot: Bot):
+    settings = get_settings()
+    if settings.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET_TOKEN,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logging.info(f"Webhook registered at {settings.WEBHOOK_URL}")
+
+
+async def start_webhook(application: Application) -> web.AppRunner:
+    """Feed webhook updates into the application's update_queue."""
+
+    async def handle_update(data: dict):
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        metrics.set_gauge("webhook.update_queue_depth", application.update_queue.qsize())
+
+    def health() -> tuple[bool, dict]:
+        return application.running, {
+            "running": application.running,
+            "update_queue": application.update_queue.qsize(),
+        }
+
+    runner = await serve_webhook(handle_update, health)
+    await register_webhook(application.bot)
+    return runner